@@ -1,9 +1,27 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import APIRouter, FastAPI, HTTPException, Header, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.models.schemas import FAQRequest, FAQResponse, BookingChangeRequest, BookingChangeResponse
+from fastapi.responses import Response, StreamingResponse
+from fastapi.routing import APIRoute
+from app.models.schemas import FAQRequest, FAQResponse, FAQBatchRequest, FAQBatchResponse, BookingChangeRequest, BookingChangeResponse, BookingBulkChangeRequest
+from app import prefork
 from app.services.faq_service import FAQService
-from app.services.booking_service import BookingService
+from app.services.booking_service import BookingService, IdempotencyKeyInProgressError, IdempotencyKeyMismatchError
+from app.services.executor_service import BoundedExecutor, ExecutorSaturatedError
+from app.services.metrics_service import (
+    ADMISSION_REJECTED_TOTAL, CONTENT_TYPE, FAQ_STAGE_SECONDS, HTTP_REQUEST_SECONDS, METRICS_DIR_ENV, REGISTRY
+)
+from app.services.rate_limit_service import RateLimiter, RateLimitExceededError
+from app.services.profiler_service import ProfilerBusyError, TraceMiddleware, TraceStore, profile, traced
+from contextvars import ContextVar
+from typing import Optional
+import asyncio
+import functools
+import json
+import math
+import secrets
+import time
 import uvicorn
+import os
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -25,11 +43,136 @@ app.add_middleware(
 faq_service = FAQService()
 booking_service = BookingService()
 
+# Set when an endpoint of a SerializationTimedRoute returns
+_endpoint_returned_at: ContextVar[Optional[float]] = ContextVar("endpoint_returned_at", default=None)
+
+class SerializationTimedRoute(APIRoute):
+    """
+    Route recording everything FastAPI does after the endpoint returns (response model
+    validation, jsonable encoding and rendering) as the FAQ "serialize" stage
+    """
+    
+    def get_route_handler(self):
+        endpoint = self.dependant.call
+        if not asyncio.iscoroutinefunction(endpoint):
+            return super().get_route_handler()
+        
+        @functools.wraps(endpoint)
+        async def timed_endpoint(*args, **kwargs):
+            result = await endpoint(*args, **kwargs)
+            _endpoint_returned_at.set(time.perf_counter())
+            return result
+        
+        self.dependant.call = timed_endpoint
+        handler = super().get_route_handler()
+        
+        async def timed_handler(request: Request) -> Response:
+            _endpoint_returned_at.set(None)
+            response = await handler(request)
+            returned_at = _endpoint_returned_at.get()
+            if returned_at is not None:
+                FAQ_STAGE_SECONDS.observe(time.perf_counter() - returned_at, stage="serialize")
+            return response
+        
+        return timed_handler
+
+# FAQ answering routes, whose response serialization is timed
+faq_router = APIRouter(route_class=SerializationTimedRoute)
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """
+    Record request latency per route template (not per raw path, to bound label cardinality)
+    """
+    start_time = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start_time,
+            method=request.method, route=getattr(route, "path", "unmatched"), status=str(status)
+        )
+
+# Admission control per route group. Each group has its own pool with a concurrency limit,
+# a queue-depth limit and a maximum queue wait, so bookings are never stuck behind FAQ encodes.
+# Queued work older than the wait is dropped: the Streamlit client gives up after 10 s anyway.
+faq_executor = BoundedExecutor(
+    max_workers=int(os.getenv("FAQ_MAX_CONCURRENCY", "32")),
+    max_queue_depth=int(os.getenv("FAQ_MAX_QUEUE_DEPTH", "64")),
+    max_queue_wait=float(os.getenv("FAQ_MAX_QUEUE_WAIT", "8")),
+    name="faq-worker"
+)
+booking_executor = BoundedExecutor(
+    max_workers=int(os.getenv("BOOKING_MAX_CONCURRENCY", "8")),
+    max_queue_depth=int(os.getenv("BOOKING_MAX_QUEUE_DEPTH", "32")),
+    max_queue_wait=float(os.getenv("BOOKING_MAX_QUEUE_WAIT", "8")),
+    name="booking-worker"
+)
+
+# Token bucket per user_id (client address when anonymous); a rate of 0 disables limiting
+faq_rate_limiter = RateLimiter(
+    rate=float(os.getenv("FAQ_RATE_LIMIT", "5")), burst=float(os.getenv("FAQ_RATE_BURST", "20"))
+)
+booking_rate_limiter = RateLimiter(
+    rate=float(os.getenv("BOOKING_RATE_LIMIT", "2")), burst=float(os.getenv("BOOKING_RATE_BURST", "10"))
+)
+
+def overloaded_error(e: ExecutorSaturatedError, group: str = "faq") -> HTTPException:
+    """
+    Build the 503 response returned when a route group's executor is saturated
+    """
+    ADMISSION_REJECTED_TOTAL.inc(group=group, reason="overloaded")
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+def check_rate_limit(limiter: RateLimiter, group: str, request: Request, user_id: Optional[str] = None,
+                     amount: float = 1.0):
+    """
+    Take tokens from the caller's bucket or reject with 429 and the wait until it refills
+    """
+    key = user_id or f"ip:{request.client.host if request.client else 'unknown'}"
+    try:
+        limiter.acquire(key, amount)
+    except RateLimitExceededError as e:
+        ADMISSION_REJECTED_TOTAL.inc(group=group, reason="rate_limited")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+
+def is_admin(token: Optional[str]) -> bool:
+    """
+    Check a token against VEXERE_ADMIN_TOKEN; always False while the admin API is disabled
+    """
+    admin_token = os.getenv("VEXERE_ADMIN_TOKEN")
+    return bool(admin_token and token) and secrets.compare_digest(token.encode(), admin_token.encode())
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """
+    Allow admin endpoints only with the token configured in VEXERE_ADMIN_TOKEN
+    """
+    if not os.getenv("VEXERE_ADMIN_TOKEN"):
+        raise HTTPException(status_code=403, detail="Admin API is disabled")
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+# Recent per-request traces of this worker, started with the X-Trace-Request header
+trace_store = TraceStore(max_traces=32)
+
+app.add_middleware(TraceMiddleware, store=trace_store, authorize=is_admin)
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
     print("Initializing Vexere AI Customer Service...")
-    faq_service.initialize()
+    await faq_executor.run(faq_service.initialize)
+    
+    # Optional file-watcher mode: hot-reload faq_data.csv when it changes.
+    # Pre-fork workers leave watching and rebuilding to the master.
+    watch_interval = float(os.getenv("FAQ_WATCH_INTERVAL", "0"))
+    if watch_interval > 0 and prefork.master_pid() is None:
+        faq_service.rag_service.start_watching(watch_interval)
+        print(f"Watching FAQ data for changes every {watch_interval}s")
     print("Services initialized successfully!")
 
 @app.get("/")
@@ -50,62 +193,218 @@ async def health_check():
         "booking_service": "ready"
     }
 
+@app.get("/metrics")
+async def metrics():
+    """
+    Per-stage latency histograms and counters in Prometheus text format. Under the
+    pre-fork launcher these are the totals of all workers, whichever one answers.
+    """
+    metrics_dir = os.getenv(METRICS_DIR_ENV)
+    content = REGISTRY.render_all(metrics_dir) if metrics_dir else REGISTRY.render()
+    return Response(content=content, media_type=CONTENT_TYPE)
+
 # FAQ Endpoints
-@app.post("/api/faq/ask", response_model=FAQResponse)
-async def ask_faq(request: FAQRequest):
+@faq_router.post("/api/faq/ask", response_model=FAQResponse)
+async def ask_faq(request: FAQRequest, http_request: Request):
     """
     Ask a question to the FAQ system
     """
+    check_rate_limit(faq_rate_limiter, "faq", http_request, request.user_id)
+    try:
+        # Concurrent requests run in parallel workers and can be micro-batched
+        response = await faq_executor.run(traced(faq_service.get_faq_answer), request)
+        return response
+    except ExecutorSaturatedError as e:
+        raise overloaded_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@faq_router.post("/api/faq/ask-batch", response_model=FAQBatchResponse)
+async def ask_faq_batch(request: FAQBatchRequest, http_request: Request):
+    """
+    Ask many questions to the FAQ system in one pass
+    """
+    # Every question is encoded, so each one takes a token
+    check_rate_limit(faq_rate_limiter, "faq", http_request, request.user_id, amount=max(1, len(request.questions)))
     try:
-        response = faq_service.get_faq_answer(request)
+        response = await faq_executor.run(traced(faq_service.get_faq_answers), request)
         return response
+    except ExecutorSaturatedError as e:
+        raise overloaded_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/faq/list")
-async def list_faqs():
+async def list_faqs(http_request: Request):
     """
     Get list of all FAQ questions
     """
+    check_rate_limit(faq_rate_limiter, "faq", http_request)
     try:
-        faqs = faq_service.get_all_faqs()
+        faqs = await faq_executor.run(traced(faq_service.get_all_faqs))
         return {"faqs": faqs, "count": len(faqs)}
+    except ExecutorSaturatedError as e:
+        raise overloaded_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/faq/search")
-async def search_faqs(keyword: str):
+@faq_router.get("/api/faq/search")
+async def search_faqs(http_request: Request, keyword: str, limit: int = Query(20, ge=1, le=100),
+                      offset: int = Query(0, ge=0)):
     """
-    Search FAQs by keyword
+    Search FAQs by keyword; count is the total number of matches, results one page of them
     """
+    check_rate_limit(faq_rate_limiter, "faq", http_request)
     try:
-        results = faq_service.search_faqs(keyword)
-        return {"results": results, "count": len(results)}
+        page = await faq_executor.run(traced(faq_service.search_faqs_page), keyword, limit, offset)
+        return {"results": page["results"], "count": page["total"], "limit": limit, "offset": offset}
+    except ExecutorSaturatedError as e:
+        raise overloaded_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+app.include_router(faq_router)
+
+@app.get("/api/faq/stats")
+async def faq_stats():
+    """
+    Get FAQ service statistics
+    """
+    return {
+        "batching": faq_service.get_batching_stats(),
+        "single_flight": faq_service.get_single_flight_stats(),
+        "cache": faq_service.get_cache_stats(),
+        "executor": faq_executor.get_stats(),
+        "rate_limit": faq_rate_limiter.get_stats()
+    }
+
+@app.get("/api/booking/stats")
+async def booking_stats():
+    """
+    Get booking admission statistics
+    """
+    return {
+        "executor": booking_executor.get_stats(),
+        "rate_limit": booking_rate_limiter.get_stats()
+    }
+
+# Admin Endpoints
+@app.post("/api/admin/faq/reload", status_code=202, dependencies=[Depends(require_admin)])
+async def reload_faq_data():
+    """
+    Rebuild the FAQ index in the background and swap it in atomically
+    """
+    # Pre-fork workers forward the reload: the master rebuilds once and has every worker reopen the result
+    if prefork.request_reload():
+        return {"status": "forwarded", "master_pid": prefork.master_pid()}
+    result = faq_service.reload_faq_data()
+    if result["status"] == "not_initialized":
+        raise HTTPException(status_code=409, detail="FAQ service is not initialized")
+    return result
+
+@app.get("/api/admin/faq/reload", dependencies=[Depends(require_admin)])
+async def faq_reload_status():
+    """
+    Get the status of the last FAQ reload
+    """
+    return faq_service.get_reload_status()
+
+@app.get("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def profile_worker(seconds: float = Query(10.0, gt=0, le=120), interval_ms: float = Query(5.0, ge=1, le=1000)):
+    """
+    Sample all threads of this worker for some seconds and return a collapsed-stack file
+    (flamegraph.pl, speedscope)
+    """
+    try:
+        # Sleep in a plain thread, not the FAQ executor, so profiling an overloaded worker still works
+        sampler = await asyncio.to_thread(profile, seconds, interval_ms / 1000)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return Response(
+        content=sampler.collapsed(),
+        media_type="text/plain",
+        headers={"X-Profile-Samples": str(sampler.samples), "X-Profile-Pid": str(os.getpid())}
+    )
+
+@app.get("/api/admin/profile/traces", dependencies=[Depends(require_admin)])
+async def list_request_traces():
+    """
+    List the recent request traces kept by this worker
+    """
+    return {"pid": os.getpid(), "traces": trace_store.list()}
+
+@app.get("/api/admin/profile/traces/{trace_id}", dependencies=[Depends(require_admin)])
+async def get_request_trace(trace_id: str):
+    """
+    Get the collapsed stacks sampled while one traced request ran
+    """
+    trace = trace_store.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found in this worker")
+    return Response(content=trace.sampler.collapsed(), media_type="text/plain")
+
 # After-Service Endpoints
 @app.post("/api/booking/change-time", response_model=BookingChangeResponse)
-async def change_booking_time(request: BookingChangeRequest):
+async def change_booking_time(request: BookingChangeRequest, http_request: Request,
+                              idempotency_key: Optional[str] = Header(None, max_length=255)):
     """
-    Change booking departure time
+    Change booking departure time. Clients that retry send the same Idempotency-Key header
+    and get the first response back instead of a second change.
     """
+    check_rate_limit(booking_rate_limiter, "booking", http_request, request.user_id)
     try:
-        response = booking_service.change_booking_time(request)
+        response = await booking_executor.run(traced(booking_service.change_booking_time), request, idempotency_key)
         return response
+    except ExecutorSaturatedError as e:
+        raise overloaded_error(e, "booking")
+    except IdempotencyKeyMismatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyKeyInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def iter_ndjson(results, chunk_size: int = 1000):
+    """
+    Serialize (index, response) results as JSON lines, a chunk at a time
+    """
+    for start in range(0, len(results), chunk_size):
+        yield "".join(
+            json.dumps({"index": index, **response.model_dump()}, ensure_ascii=False) + "\n"
+            for index, response in results[start:start + chunk_size]
+        )
+
+@app.post("/api/booking/change-time/bulk")
+async def change_booking_times_bulk(request: BookingBulkChangeRequest, http_request: Request):
+    """
+    Change many booking departure times in one store transaction, streaming
+    one JSON line per item: {"index": ..., "success": ..., "message": ..., "new_booking_details": ...}
+    """
+    # Keyed on the caller (ops tooling), not the passengers in the batch
+    check_rate_limit(booking_rate_limiter, "booking", http_request, amount=len(request.changes))
+    try:
+        results = await booking_executor.run(traced(booking_service.change_booking_times_bulk), request.changes)
+    except ExecutorSaturatedError as e:
+        raise overloaded_error(e, "booking")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(
+        iter_ndjson(results), media_type="application/x-ndjson", headers={"X-Total-Count": str(len(results))}
+    )
 
 @app.get("/api/booking/{booking_id}")
-async def get_booking_info(booking_id: str, user_id: str):
+async def get_booking_info(booking_id: str, user_id: str, http_request: Request):
     """
     Get booking information
     """
+    check_rate_limit(booking_rate_limiter, "booking", http_request, user_id)
     try:
-        booking_info = booking_service.get_booking_info(booking_id, user_id)
+        booking_info = await booking_executor.run(traced(booking_service.get_booking_info), booking_id, user_id)
         if "error" in booking_info:
             raise HTTPException(status_code=400, detail=booking_info["error"])
         return booking_info
+    except ExecutorSaturatedError as e:
+        raise overloaded_error(e, "booking")
     except HTTPException:
         raise
     except Exception as e:
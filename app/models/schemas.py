@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -12,12 +12,24 @@ class FAQResponse(BaseModel):
     source_question: Optional[str] = None
     processing_time: float
 
+class FAQBatchRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1, max_length=1000)
+    user_id: Optional[str] = None
+
+class FAQBatchResponse(BaseModel):
+    results: List[FAQResponse]  # processing_time of each item is its share of the batch
+    count: int
+    processing_time: float
+
 class BookingChangeRequest(BaseModel):
     booking_id: str
     new_departure_time: str
     reason: str
     user_id: str
 
+class BookingBulkChangeRequest(BaseModel):
+    changes: List[BookingChangeRequest] = Field(..., min_length=1, max_length=20000)
+
 class BookingChangeResponse(BaseModel):
     success: bool
     message: str
@@ -0,0 +1,358 @@
+"""
+Pre-fork Server
+Loads the model, FAQ store and FAISS index once in a master process, then forks
+worker processes that serve the same listening socket. Workers share the loaded
+weights and the memory-mapped embeddings copy-on-write instead of each loading
+their own copy.
+"""
+
+from typing import Dict, List, Optional
+import gc
+import glob
+import importlib
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from app.services.metrics_service import METRICS_DIR_ENV, REGISTRY
+
+# Environment variables read by OpenMP / BLAS runtimes when they start
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+# Set in the master (and inherited by the workers) to the master's PID
+MASTER_PID_ENV = "PREFORK_MASTER_PID"
+
+# Sent to the master to rebuild the FAQ index, and by the master to the workers once
+# the rebuilt artifacts are published
+RELOAD_SIGNAL = signal.SIGHUP
+REOPEN_SIGNAL = signal.SIGUSR1
+
+# Seconds between metric snapshots published by each worker for /metrics totals
+METRICS_PUBLISH_INTERVAL = 1.0
+
+# Fields of /proc/<pid>/smaps_rollup included in the memory report
+MEMORY_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+def default_threads_per_worker(workers: int) -> int:
+    """
+    Split the machine's cores evenly between workers
+    """
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+def cap_threads(threads: int):
+    """
+    Limit torch/FAISS/OpenMP/BLAS thread pools so N workers do not oversubscribe the CPU.
+    Environment variables cover libraries not imported yet; already imported ones are set directly.
+    """
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    # Tokenizer thread pools do not survive fork
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    
+    if "torch" in sys.modules:
+        torch = sys.modules["torch"]
+        torch.set_num_threads(threads)
+    if "faiss" in sys.modules:
+        sys.modules["faiss"].omp_set_num_threads(threads)
+
+def master_pid() -> Optional[int]:
+    """
+    PID of the pre-fork master when called in one of its workers, None otherwise
+    """
+    pid = os.getenv(MASTER_PID_ENV)
+    if not pid or int(pid) == os.getpid():
+        return None
+    return int(pid)
+
+def request_reload() -> bool:
+    """
+    Ask the pre-fork master to rebuild the FAQ index for all workers; False outside a pre-fork worker
+    """
+    pid = master_pid()
+    if pid is None:
+        return False
+    os.kill(pid, RELOAD_SIGNAL)
+    return True
+
+def read_memory(pid: Optional[int] = None) -> Dict[str, float]:
+    """
+    Memory of a process in MB (Linux): RSS, PSS (RSS with shared pages split between
+    the processes sharing them) and shared/private pages
+    """
+    pid = pid or os.getpid()
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                field, _, value = line.partition(":")
+                if field in MEMORY_FIELDS:
+                    memory[field.lower()] = int(value.split()[0]) / 1024
+    except OSError:
+        # Older kernels: RSS only
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    memory["rss"] = int(line.split()[1]) / 1024
+    return memory
+
+def memory_report(master_pid: int, worker_pids: List[int]) -> Dict[str, object]:
+    """
+    Compare the memory actually used by the pre-forked workers with running the
+    same number of independent processes, each loading its own model and index
+    """
+    master = read_memory(master_pid)
+    workers = {pid: read_memory(pid) for pid in worker_pids}
+    
+    # A fully loaded process that never served a request is the cost of one standalone worker
+    standalone_mb = master.get("rss", 0.0)
+    one_process_per_worker_mb = standalone_mb * len(worker_pids)
+    total_mb = sum(memory.get("pss", memory.get("rss", 0.0)) for memory in [master, *workers.values()])
+    
+    return {
+        "master": master,
+        "workers": workers,
+        "avg_worker_rss_mb": sum(memory.get("rss", 0.0) for memory in workers.values()) / len(workers) if workers else 0.0,
+        "avg_worker_private_mb": sum(
+            memory.get("private_clean", 0.0) + memory.get("private_dirty", 0.0) for memory in workers.values()
+        ) / len(workers) if workers else 0.0,
+        "total_pss_mb": total_mb,
+        "one_process_per_worker_mb": one_process_per_worker_mb,
+        "saved_mb": one_process_per_worker_mb - total_mb
+    }
+
+def format_memory_report(report: Dict[str, object]) -> str:
+    """
+    Render a memory report as a small table for the launcher log
+    """
+    lines = [f"{'process':>12} {'rss_mb':>10} {'pss_mb':>10} {'private_mb':>11}"]
+    rows = [("master", report["master"])] + [(f"worker {pid}", memory) for pid, memory in report["workers"].items()]
+    for name, memory in rows:
+        private = memory.get("private_clean", 0.0) + memory.get("private_dirty", 0.0)
+        lines.append(f"{name:>12} {memory.get('rss', 0.0):>10.1f} {memory.get('pss', 0.0):>10.1f} {private:>11.1f}")
+    lines.append(f"Total (PSS): {report['total_pss_mb']:.1f} MB, "
+                 f"one process per worker: ~{report['one_process_per_worker_mb']:.1f} MB, "
+                 f"saved: ~{report['saved_mb']:.1f} MB")
+    return "\n".join(lines)
+
+class PreforkServer:
+    """
+    Master process that loads shared state, binds the socket and supervises forked uvicorn workers
+    """
+    
+    def __init__(self, app_path: str = "app.main:app", host: str = "0.0.0.0", port: int = 8000,
+                 workers: int = 2, threads_per_worker: Optional[int] = None, report_after: float = 10.0,
+                 watch_interval: Optional[float] = None):
+        self.app_path = app_path
+        self.host = host
+        self.port = port
+        self.workers = max(1, workers)
+        self.threads_per_worker = threads_per_worker or default_threads_per_worker(self.workers)
+        self.report_after = report_after
+        # The master alone watches the FAQ CSV; workers never rebuild on their own
+        if watch_interval is None:
+            watch_interval = float(os.getenv("FAQ_WATCH_INTERVAL", "0"))
+        self.watch_interval = watch_interval
+        self.app = None
+        self.faq_service = None
+        self.metrics_dir = None
+        self.owns_metrics_dir = False
+        self.sock = None
+        self.children = {}
+        self.stopping = False
+        self.reload_requested = False
+    
+    def load(self):
+        """
+        Import the app and load the model, FAQ store and index before forking
+        """
+        # Thread caps must be in the environment before torch/FAISS start their pools
+        cap_threads(self.threads_per_worker)
+        os.environ[MASTER_PID_ENV] = str(os.getpid())
+        self.prepare_metrics_dir()
+        
+        module_name, _, app_name = self.app_path.partition(":")
+        module = importlib.import_module(module_name)
+        self.app = getattr(module, app_name or "app")
+        
+        # Run initialization directly, not through the FAQ executor, so no pool
+        # threads exist in the master when it forks
+        self.faq_service = getattr(module, "faq_service", None)
+        if self.faq_service is not None and not self.faq_service.initialize():
+            raise RuntimeError("FAQ service failed to initialize")
+        cap_threads(self.threads_per_worker)
+        # The master's own metrics (the initial build) count towards the totals once
+        REGISTRY.write_snapshot(self.metrics_dir)
+        
+        # Move everything loaded so far out of the collector's reach, so GC passes
+        # in the workers do not write to (and un-share) those pages
+        gc.collect()
+        gc.freeze()
+    
+    def prepare_metrics_dir(self):
+        """
+        Give the workers a directory to publish their metrics in, so /metrics on any worker
+        reports the totals of all of them. Snapshots of a previous run are dropped.
+        """
+        self.metrics_dir = os.getenv(METRICS_DIR_ENV)
+        if self.metrics_dir:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            for path in glob.glob(os.path.join(self.metrics_dir, "metrics_*.json")):
+                os.remove(path)
+        else:
+            self.metrics_dir = os.environ[METRICS_DIR_ENV] = tempfile.mkdtemp(prefix="faq-metrics-")
+            self.owns_metrics_dir = True
+    
+    def bind(self):
+        """
+        Open the listening socket all workers accept on
+        """
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(2048)
+        self.sock.set_inheritable(True)
+    
+    def spawn(self) -> int:
+        """
+        Fork one worker serving the shared socket
+        """
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.time()
+            return pid
+        
+        # Worker process
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            # Values inherited from the master are already in its own snapshot
+            REGISTRY.clear()
+            REGISTRY.start_publishing(self.metrics_dir, METRICS_PUBLISH_INTERVAL)
+            import uvicorn
+            config = uvicorn.Config(self.app, log_level="info")
+            uvicorn.Server(config).run(sockets=[self.sock])
+        except BaseException as e:
+            print(f"Worker {os.getpid()} failed: {e}")
+            exit_code = 1
+        finally:
+            # The final counts of this worker stay in the totals after it exits
+            try:
+                REGISTRY.write_snapshot(self.metrics_dir)
+            except OSError:
+                pass
+            os._exit(exit_code)
+    
+    def request_reload(self, signum=None, frame=None):
+        """
+        Master signal handler: rebuild the FAQ index on the next supervision pass
+        """
+        self.reload_requested = True
+    
+    def reopen(self, signum=None, frame=None):
+        """
+        Worker signal handler: swap in the artifacts the master published. Installed before
+        forking so no worker can miss the signal; the master itself ignores it.
+        """
+        if master_pid() is None or self.faq_service is None:
+            return
+        # Off the event loop thread, which the handler interrupts
+        threading.Thread(target=self.faq_service.rag_service.reopen_artifacts, name="faq-reopen", daemon=True).start()
+    
+    def reload(self):
+        """
+        Rebuild the FAQ index once, in the master, then have every worker reopen the published
+        artifacts. Workers forked from now on inherit the new snapshot.
+        """
+        self.reload_requested = False
+        if self.faq_service is None:
+            return
+        result = self.faq_service.rag_service.reload()
+        REGISTRY.write_snapshot(self.metrics_dir)
+        if result["status"] != "reloaded":
+            return
+        for pid in list(self.children):
+            try:
+                os.kill(pid, REOPEN_SIGNAL)
+            except ProcessLookupError:
+                pass
+    
+    def stop(self, signum=None, frame=None):
+        """
+        Stop all workers
+        """
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    
+    def run(self):
+        """
+        Load, fork the workers and supervise them until stopped; dead workers are replaced
+        """
+        self.load()
+        self.bind()
+        print(f"Master {os.getpid()} loaded the model; forking {self.workers} workers "
+              f"with {self.threads_per_worker} thread(s) each on {self.host}:{self.port}")
+        
+        signal.signal(REOPEN_SIGNAL, self.reopen)
+        for _ in range(self.workers):
+            self.spawn()
+        
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(RELOAD_SIGNAL, self.request_reload)
+        
+        report_at = time.time() + self.report_after if self.report_after > 0 else None
+        rag_service = self.faq_service.rag_service if self.faq_service is not None else None
+        watch_at = time.time() + self.watch_interval if self.watch_interval > 0 and rag_service else None
+        last_signature = rag_service.csv_signature() if watch_at else None
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            
+            if pid:
+                self.children.pop(pid, None)
+                if not self.stopping:
+                    print(f"Worker {pid} exited with status {status}, restarting")
+                    self.spawn()
+                continue
+            
+            if watch_at is not None and time.time() >= watch_at:
+                watch_at = time.time() + self.watch_interval
+                signature = rag_service.csv_signature()
+                if signature is not None and signature != last_signature:
+                    last_signature = signature
+                    self.reload_requested = True
+            
+            if self.reload_requested and not self.stopping:
+                self.reload()
+            
+            if report_at is not None and time.time() >= report_at:
+                report_at = None
+                try:
+                    print(format_memory_report(memory_report(os.getpid(), list(self.children))))
+                except OSError as e:
+                    print(f"Memory report unavailable: {e}")
+            
+            time.sleep(0.5)
+        
+        self.sock.close()
+        if self.owns_metrics_dir:
+            shutil.rmtree(self.metrics_dir, ignore_errors=True)
+
+def serve(host: str = "0.0.0.0", port: int = 8000, workers: int = 2, threads_per_worker: Optional[int] = None,
+          report_after: float = 10.0):
+    """
+    Run the API with pre-forked workers sharing one loaded model and index
+    """
+    PreforkServer("app.main:app", host, port, workers, threads_per_worker, report_after).run()
@@ -0,0 +1,123 @@
+"""
+Micro-batching Service
+Coalesces concurrent requests into batches so the RAG model encodes them together.
+"""
+
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+import queue
+import threading
+import time
+
+from app.services.profiler_service import current_trace, following
+
+class MicroBatcher:
+    """
+    Gather items submitted from many threads within a short window
+    and process them with a single batch call
+    """
+    
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+    
+    def _ensure_worker(self):
+        """
+        Start the background worker thread on first use
+        """
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="faq-micro-batcher", daemon=True)
+                self._worker.start()
+    
+    def submit(self, item: Any) -> Any:
+        """
+        Submit one item and block until its batch has been processed
+        """
+        self._ensure_worker()
+        future = Future()
+        # A traced request is followed into the batcher thread while its batch runs
+        self._queue.put((item, future, current_trace()))
+        return future.result()
+    
+    def _collect_batch(self) -> list:
+        """
+        Wait for the first item and take whatever else is already queued. A lone item on an
+        idle batcher is dispatched at once; when others are waiting (the previous encode was
+        still running), keep gathering until the batch is full or the window closes.
+        """
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        
+        if len(batch) == 1:
+            return batch
+        
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        return batch
+    
+    def _run(self):
+        """
+        Worker loop: form batches and hand each caller its own result
+        """
+        while True:
+            batch = self._collect_batch()
+            items = [item for item, _, _ in batch]
+            
+            with self._stats_lock:
+                self._batch_sizes[len(batch)] += 1
+            
+            try:
+                with following(trace for _, _, trace in batch):
+                    results = self.process_batch(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"Batch returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get the batch sizes actually formed so far
+        """
+        with self._stats_lock:
+            batch_sizes = dict(sorted(self._batch_sizes.items()))
+        
+        batches = sum(batch_sizes.values())
+        items = sum(size * count for size, count in batch_sizes.items())
+        
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "batches": batches,
+            "items": items,
+            "avg_batch_size": items / batches if batches else 0.0,
+            "max_observed_batch_size": max(batch_sizes) if batch_sizes else 0,
+            "batch_size_histogram": batch_sizes
+        }
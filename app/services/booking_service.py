@@ -1,13 +1,62 @@
 from app.models.schemas import BookingChangeRequest, BookingChangeResponse
+from app.services.booking_store import BookingStore, BookingVersionConflictError, create_booking_store
+from app.services.lazy_import import lazy_import
+from app.services.metrics_service import BOOKING_CHANGE_CONFLICTS_TOTAL, BOOKING_CHANGE_TOTAL
+from collections import Counter
 from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+import hashlib
+import numpy as np
 import re
 import random
 import string
+import time
+
+# Only the bulk path needs pandas; keep it out of startup
+pd = lazy_import("pandas")
+
+TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+# Replies to a rejected change, by outcome label
+REJECTION_MESSAGES = {
+    "invalid_booking_id": "Mã đặt chỗ không hợp lệ. Vui lòng kiểm tra lại.",
+    "not_found": "Không tìm thấy thông tin đặt chỗ. Vui lòng kiểm tra lại mã đặt chỗ.",
+    "forbidden": "Bạn không có quyền thay đổi đặt chỗ này.",
+    "invalid_time_format": "Định dạng thời gian không đúng. Vui lòng sử dụng định dạng YYYY-MM-DD HH:MM",
+    "unavailable": "Thời gian mới không khả dụng hoặc quá gần thời gian hiện tại. Vui lòng chọn thời gian khác.",
+    "conflict": "Đặt chỗ đang được thay đổi bởi một yêu cầu khác. Vui lòng thử lại.",
+}
+
+class IdempotencyKeyMismatchError(Exception):
+    """
+    Raised when an idempotency key is reused for a different request
+    """
+
+class IdempotencyKeyInProgressError(Exception):
+    """
+    Raised when a request with the same idempotency key is still being processed
+    """
+
+def rejection(outcome: str) -> tuple:
+    """
+    (response, outcome label) for a rejected change
+    """
+    return BookingChangeResponse(success=False, message=REJECTION_MESSAGES[outcome]), outcome
 
 class BookingService:
-    def __init__(self):
-        # Mock database for demonstration
-        self.bookings = {}
+    def __init__(self, store: Optional[BookingStore] = None, max_change_attempts: int = 10,
+                 retry_backoff: float = 0.001, max_backoff: float = 0.05,
+                 idempotency_ttl: float = 24 * 3600, idempotency_pending_timeout: float = 30.0):
+        # SQLite when BOOKING_DB_PATH is set, otherwise an in-memory store for demos and tests
+        self.store = store if store is not None else create_booking_store()
+        # Optimistic concurrency: a change that lost a race is re-read, re-validated and retried
+        self.max_change_attempts = max(1, max_change_attempts)
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        # Responses to keyed changes are replayed for this long; an unfinished key is
+        # taken over after the pending timeout, in case its worker died
+        self.idempotency_ttl = idempotency_ttl
+        self.idempotency_pending_timeout = idempotency_pending_timeout
         self.generate_sample_bookings()
     
     def generate_sample_bookings(self):
@@ -37,8 +86,8 @@ class BookingService:
             }
         ]
         
-        for booking in sample_bookings:
-            self.bookings[booking["booking_id"]] = booking
+        # Bookings already in a persistent store keep their changes
+        self.store.seed(sample_bookings)
     
     def validate_booking_id(self, booking_id: str) -> bool:
         """
@@ -82,13 +131,13 @@ class BookingService:
         except:
             return False
     
-    def calculate_change_fee(self, booking_id: str, new_time: str) -> float:
+    def calculate_change_fee(self, booking_id: str, new_time: str, booking: Optional[dict] = None) -> float:
         """
-        Calculate change fee (mock implementation)
+        Calculate change fee (mock implementation), from the given booking version if any
         """
         # Simple fee calculation based on time difference
         try:
-            booking = self.bookings.get(booking_id)
+            booking = booking if booking is not None else self.store.get(booking_id)
             if not booking:
                 return 0.0
             
@@ -105,79 +154,260 @@ class BookingService:
         except:
             return 100000
     
-    def change_booking_time(self, request: BookingChangeRequest) -> BookingChangeResponse:
+    def change_booking_time(self, request: BookingChangeRequest,
+                            idempotency_key: Optional[str] = None) -> BookingChangeResponse:
+        """
+        Process booking time change request. With an idempotency key, a repeated request
+        gets the stored response of the first one without being validated or applied again.
+        """
+        if idempotency_key is None:
+            response, outcome = self.apply_booking_change(request)
+        else:
+            response, outcome = self.apply_idempotent_change(request, idempotency_key)
+        BOOKING_CHANGE_TOTAL.inc(outcome=outcome)
+        return response
+    
+    def apply_idempotent_change(self, request: BookingChangeRequest, idempotency_key: str) -> tuple:
+        """
+        Apply a change once per (user, idempotency key), returning (response, outcome label)
+        """
+        # Scoped per user, so a guessed key never returns someone else's booking
+        key = f"{request.user_id}:{idempotency_key}"
+        fingerprint = hashlib.sha256(request.model_dump_json().encode("utf-8")).hexdigest()
+        
+        entry = self.store.reserve_idempotency_key(
+            key, fingerprint, self.idempotency_ttl, self.idempotency_pending_timeout
+        )
+        if entry is not None:
+            if entry["fingerprint"] != fingerprint:
+                raise IdempotencyKeyMismatchError("Idempotency-Key đã được dùng cho một yêu cầu khác.")
+            if entry["response"] is None:
+                raise IdempotencyKeyInProgressError("Yêu cầu với Idempotency-Key này đang được xử lý.")
+            return BookingChangeResponse(**entry["response"]), "replayed"
+        
+        # A successful change stores its response in the same transaction as the booking update
+        response, outcome = self.apply_booking_change(request, idempotency_key=key)
+        if outcome in ("error", "conflict"):
+            # Transient failures are not remembered, so a retry runs again
+            self.store.release_idempotency_key(key)
+        elif outcome != "success":
+            self.store.complete_idempotency_key(key, response.model_dump())
+        return response, outcome
+    
+    def check_change_allowed(self, request: BookingChangeRequest, booking: Optional[dict]) -> Optional[tuple]:
         """
-        Process booking time change request
+        Check a change against the current booking, returning (response, outcome label) if it is rejected
+        """
+        # Check if booking exists
+        if booking is None:
+            return rejection("not_found")
+        
+        # Check user authorization
+        if booking["user_id"] != request.user_id:
+            return rejection("forbidden")
+        
+        # Validate new time format
+        if not self.validate_time_format(request.new_departure_time):
+            return rejection("invalid_time_format")
+        
+        # Check time availability
+        if not self.check_time_availability(request.new_departure_time):
+            return rejection("unavailable")
+        
+        return None
+    
+    def apply_booking_change(self, request: BookingChangeRequest, idempotency_key: Optional[str] = None) -> tuple:
+        """
+        Validate and apply a booking time change, returning (response, outcome label).
+        The update only succeeds if the booking is still at the version that was validated;
+        otherwise it is re-read and retried. A reserved idempotency key gets the response
+        of a successful change together with the update.
         """
         try:
             # Validate booking ID
             if not self.validate_booking_id(request.booking_id):
-                return BookingChangeResponse(
-                    success=False,
-                    message="Mã đặt chỗ không hợp lệ. Vui lòng kiểm tra lại."
-                )
+                return rejection("invalid_booking_id")
             
-            # Check if booking exists
-            if request.booking_id not in self.bookings:
-                return BookingChangeResponse(
-                    success=False,
-                    message="Không tìm thấy thông tin đặt chỗ. Vui lòng kiểm tra lại mã đặt chỗ."
+            for attempt in range(self.max_change_attempts):
+                booking = self.store.get(request.booking_id)
+                rejected = self.check_change_allowed(request, booking)
+                if rejected is not None:
+                    return rejected
+                
+                # Calculate change fee from the same version that is updated
+                change_fee = self.calculate_change_fee(request.booking_id, request.new_departure_time, booking)
+                
+                # The swap only applies on top of this version, so the reply is known up front
+                response = self.change_succeeded(
+                    request, booking["departure_time"], change_fee, booking["version"] + 1
                 )
+                idempotency = (idempotency_key, response.model_dump()) if idempotency_key is not None else None
+                
+                # Compare-and-swap in one short write transaction
+                try:
+                    previous = self.store.update(request.booking_id, {
+                        "departure_time": request.new_departure_time,
+                        "change_reason": request.reason,
+                        "change_fee": change_fee,
+                        "last_modified": datetime.now().isoformat()
+                    }, expected_version=booking["version"], idempotency=idempotency)
+                except BookingVersionConflictError:
+                    BOOKING_CHANGE_CONFLICTS_TOTAL.inc()
+                    time.sleep(self.backoff(attempt))
+                    continue
+                
+                if previous is None:
+                    return rejection("not_found")
+                
+                return response, "success"
             
-            booking = self.bookings[request.booking_id]
-            
-            # Check user authorization
-            if booking["user_id"] != request.user_id:
-                return BookingChangeResponse(
-                    success=False,
-                    message="Bạn không có quyền thay đổi đặt chỗ này."
-                )
-            
-            # Validate new time format
-            if not self.validate_time_format(request.new_departure_time):
-                return BookingChangeResponse(
-                    success=False,
-                    message="Định dạng thời gian không đúng. Vui lòng sử dụng định dạng YYYY-MM-DD HH:MM"
-                )
-            
-            # Check time availability
-            if not self.check_time_availability(request.new_departure_time):
-                return BookingChangeResponse(
-                    success=False,
-                    message="Thời gian mới không khả dụng hoặc quá gần thời gian hiện tại. Vui lòng chọn thời gian khác."
-                )
-            
-            # Calculate change fee
-            change_fee = self.calculate_change_fee(request.booking_id, request.new_departure_time)
-            
-            # Update booking
-            original_time = booking["departure_time"]
-            booking["departure_time"] = request.new_departure_time
-            booking["change_reason"] = request.reason
-            booking["change_fee"] = change_fee
-            booking["last_modified"] = datetime.now().isoformat()
-            
-            # Generate new booking details
-            new_booking_details = {
-                "booking_id": request.booking_id,
-                "original_departure_time": original_time,
-                "new_departure_time": request.new_departure_time,
-                "change_fee": change_fee,
-                "status": "modified",
-                "confirmation_code": self.generate_confirmation_code()
-            }
-            
-            return BookingChangeResponse(
-                success=True,
-                message=f"Đã thay đổi thời gian bay thành công. Phí thay đổi: {change_fee:,} VND",
-                new_booking_details=new_booking_details
-            )
+            return rejection("conflict")
         
         except Exception as e:
             return BookingChangeResponse(
                 success=False,
                 message=f"Đã xảy ra lỗi khi xử lý yêu cầu: {str(e)}"
-            )
+            ), "error"
+    
+    def backoff(self, attempt: int) -> float:
+        """
+        Seconds to wait before retry number attempt + 1
+        """
+        # Jittered exponential backoff spreads out writers racing for the same booking;
+        # the cap keeps a high max_change_attempts from sleeping for seconds or minutes
+        return random.uniform(0, min(self.max_backoff, self.retry_backoff * 2 ** min(attempt, 32)))
+    
+    def change_succeeded(self, request: BookingChangeRequest, original_time: str, change_fee: float,
+                         version: int) -> BookingChangeResponse:
+        """
+        Build the reply to an applied change
+        """
+        # Generate new booking details
+        new_booking_details = {
+            "booking_id": request.booking_id,
+            "original_departure_time": original_time,
+            "new_departure_time": request.new_departure_time,
+            "change_fee": change_fee,
+            "status": "modified",
+            "version": version,
+            "confirmation_code": self.generate_confirmation_code()
+        }
+        
+        return BookingChangeResponse(
+            success=True,
+            message=f"Đã thay đổi thời gian bay thành công. Phí thay đổi: {change_fee:,} VND",
+            new_booking_details=new_booking_details
+        )
+    
+    def change_booking_times_bulk(self, requests: List[BookingChangeRequest]) -> List[Tuple[int, BookingChangeResponse]]:
+        """
+        Validate and apply many booking time changes at once, returning (index, response) per item.
+        Changes to the same booking apply in request order. Bookings changed concurrently by
+        someone else are re-read and retried like single changes.
+        """
+        results = []
+        pending = list(range(len(requests)))
+        for attempt in range(self.max_change_attempts):
+            done, pending = self.apply_bulk_changes(requests, pending)
+            results.extend(done)
+            if not pending:
+                break
+            BOOKING_CHANGE_CONFLICTS_TOTAL.inc(len(pending))
+            time.sleep(self.backoff(attempt))
+        results.extend((index, rejection("conflict")) for index in pending)
+        
+        results.sort(key=lambda result: result[0])
+        for outcome, count in Counter(outcome for _, (_, outcome) in results).items():
+            BOOKING_CHANGE_TOTAL.inc(count, outcome=outcome)
+        return [(index, response) for index, (response, _) in results]
+    
+    def validate_bulk(self, requests: List[BookingChangeRequest], bookings: dict):
+        """
+        Outcome label per request ("ok" if the change is allowed), checked column-wise
+        in the same order as a single change, plus the parsed new times
+        """
+        booking_ids = pd.Series([request.booking_id for request in requests], dtype=object)
+        user_ids = pd.Series([request.user_id for request in requests], dtype=object)
+        new_times = pd.Series([request.new_departure_time for request in requests], dtype=object)
+        
+        valid_id = booking_ids.str.len().eq(8) & booking_ids.str.startswith("VX")
+        owners = booking_ids.map({booking_id: booking["user_id"] for booking_id, booking in bookings.items()})
+        found = owners.notna()
+        authorized = owners.eq(user_ids)
+        
+        # Strict format (two-digit fields) and a real calendar date
+        parsed = pd.to_datetime(
+            new_times.where(new_times.str.fullmatch(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}").fillna(False).astype(bool)),
+            format=TIME_FORMAT, errors="coerce"
+        )
+        well_formed = parsed.notna()
+        # Same rules as check_time_availability: 2 hours ahead, departing 5:00-23:59
+        available = parsed.gt(datetime.now() + timedelta(hours=2)) & parsed.dt.hour.between(5, 23)
+        
+        outcomes = np.select(
+            [~valid_id, ~found, ~authorized, ~well_formed, ~available],
+            ["invalid_booking_id", "not_found", "forbidden", "invalid_time_format", "unavailable"],
+            default="ok"
+        )
+        return outcomes, parsed
+    
+    def apply_bulk_changes(self, requests: List[BookingChangeRequest], indices: List[int]) -> tuple:
+        """
+        One optimistic pass over the pending requests: read their bookings, validate, compute fees,
+        then write every allowed change in a single transaction.
+        Returns the finished (index, (response, outcome)) items and the indices to retry.
+        """
+        items = [requests[index] for index in indices]
+        bookings = self.store.get_many(request.booking_id for request in items)
+        outcomes, parsed = self.validate_bulk(items, bookings)
+        
+        done = [(indices[position], rejection(outcome))
+                for position, outcome in enumerate(outcomes) if outcome != "ok"]
+        accepted = np.flatnonzero(outcomes == "ok")
+        if len(accepted) == 0:
+            return done, []
+        
+        # Each change builds on the previous change to the same booking
+        current = {}
+        original_times = []
+        versions = []
+        for position in accepted:
+            booking_id = items[position].booking_id
+            booking = bookings[booking_id]
+            original_time, version = current.get(booking_id, (booking["departure_time"], booking["version"]))
+            original_times.append(original_time)
+            versions.append(version + 1)
+            current[booking_id] = (items[position].new_departure_time, version + 1)
+        
+        # Fee: 50k VND within 24h of the original time, 100k otherwise (or if it cannot be parsed)
+        originals = pd.to_datetime(pd.Series(original_times, dtype=object), format=TIME_FORMAT, errors="coerce")
+        hours = (parsed.iloc[accepted].reset_index(drop=True) - originals).abs().dt.total_seconds() / 3600
+        fees = np.where(hours.le(24), 50000, 100000).tolist()
+        
+        # The booking ends up with its last change of the batch
+        modified_at = datetime.now().isoformat()
+        last_change = {}
+        for position, fee in zip(accepted, fees):
+            last_change[items[position].booking_id] = (items[position], fee)
+        updates = [
+            (booking_id, {
+                "departure_time": request.new_departure_time,
+                "change_reason": request.reason,
+                "change_fee": fee,
+                "last_modified": modified_at
+            }, bookings[booking_id]["version"], current[booking_id][1])
+            for booking_id, (request, fee) in last_change.items()
+        ]
+        conflicts = set(self.store.update_many(updates))
+        
+        retry = []
+        for position, original_time, fee, version in zip(accepted, original_times, fees, versions):
+            request = items[position]
+            if request.booking_id in conflicts:
+                retry.append(indices[position])
+            else:
+                done.append((indices[position], (self.change_succeeded(request, original_time, fee, version), "success")))
+        return done, retry
     
     def generate_confirmation_code(self) -> str:
         """
@@ -192,7 +422,7 @@ class BookingService:
         if not self.validate_booking_id(booking_id):
             return {"error": "Mã đặt chỗ không hợp lệ"}
         
-        booking = self.bookings.get(booking_id)
+        booking = self.store.get(booking_id)
         if not booking:
             return {"error": "Không tìm thấy thông tin đặt chỗ"}
         
@@ -0,0 +1,461 @@
+"""
+Booking Store
+Storage backends for bookings: an in-memory dict for tests and demos, and a
+SQLite database shared by all workers that survives restarts. Each backend
+also keeps the idempotency keys of booking changes next to the bookings.
+"""
+
+from contextlib import contextmanager
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Columns of a stored booking; the change_* fields are only set once a booking has been changed.
+# version starts at 1 and is incremented by every update, for compare-and-swap.
+BOOKING_COLUMNS = (
+    "booking_id", "user_id", "flight_number", "departure_time", "arrival_time", "route",
+    "passenger_name", "status", "change_reason", "change_fee", "last_modified", "version"
+)
+
+# SQLite column types; the rest are TEXT
+BOOKING_COLUMN_TYPES = {
+    "booking_id": "TEXT PRIMARY KEY",
+    "user_id": "TEXT NOT NULL",
+    "change_fee": "REAL",
+    "version": "INTEGER NOT NULL DEFAULT 1",
+}
+
+class BookingVersionConflictError(Exception):
+    """
+    Raised when a booking changed since the version the caller read
+    """
+
+class BookingStore:
+    """
+    Interface of a booking storage backend. Bookings are plain dicts; callers get copies
+    and change stored bookings only through update().
+    """
+    
+    def get(self, booking_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+    
+    def list_by_user(self, user_id: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+    
+    def seed(self, bookings: Iterable[Dict[str, Any]]):
+        """
+        Insert bookings that are not stored yet; existing ones keep their changes
+        """
+        raise NotImplementedError
+    
+    def update(self, booking_id: str, changes: Dict[str, Any], expected_version: Optional[int] = None,
+               idempotency: Optional[Tuple[str, Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Apply field changes in one short transaction, incrementing the version, and return the
+        booking as it was before, or None if it does not exist. With expected_version this is a
+        compare-and-swap: BookingVersionConflictError is raised if the stored version differs.
+        With idempotency=(key, response), the response of the reserved key is stored in the
+        same transaction, so a change is never applied without it.
+        """
+        raise NotImplementedError
+    
+    def get_many(self, booking_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the bookings that exist among the ids, by id
+        """
+        raise NotImplementedError
+    
+    def update_many(self, updates: List[Tuple[str, Dict[str, Any], int, int]]) -> List[str]:
+        """
+        Apply (booking_id, changes, expected_version, new_version) updates in one transaction,
+        at most one per booking. Bookings no longer at expected_version (or gone) are left
+        unchanged and their ids returned.
+        """
+        raise NotImplementedError
+    
+    def reserve_idempotency_key(self, key: str, fingerprint: str, ttl: float,
+                                pending_timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Atomically claim an idempotency key for a request. Returns None if the caller now owns
+        the key, otherwise the live entry: {"fingerprint", "response"}, where response is None
+        while the owner is still working. Entries older than ttl, and pending ones older than
+        pending_timeout (their owner died), are treated as absent.
+        """
+        raise NotImplementedError
+    
+    def complete_idempotency_key(self, key: str, response: Dict[str, Any]):
+        """
+        Store the response for a reserved key
+        """
+        raise NotImplementedError
+    
+    def release_idempotency_key(self, key: str):
+        """
+        Drop a reserved key without a response, so a retry runs again
+        """
+        raise NotImplementedError
+    
+    def __contains__(self, booking_id: str) -> bool:
+        return self.get(booking_id) is not None
+    
+    def __len__(self) -> int:
+        raise NotImplementedError
+    
+    def close(self):
+        pass
+
+class InMemoryBookingStore(BookingStore):
+    """
+    Bookings in a process-local dict; changes are lost on restart
+    """
+    
+    def __init__(self, max_idempotency_keys: int = 100000):
+        self._bookings: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.max_idempotency_keys = max_idempotency_keys
+        # key -> [fingerprint, response or None while pending, created_at], oldest first
+        self._idempotency_keys = OrderedDict()
+    
+    def get(self, booking_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            booking = self._bookings.get(booking_id)
+            return dict(booking) if booking is not None else None
+    
+    def list_by_user(self, user_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(booking) for booking in self._bookings.values() if booking["user_id"] == user_id]
+    
+    def get_many(self, booking_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                booking_id: dict(self._bookings[booking_id])
+                for booking_id in booking_ids if booking_id in self._bookings
+            }
+    
+    def update_many(self, updates: List[Tuple[str, Dict[str, Any], int, int]]) -> List[str]:
+        conflicts = []
+        with self._lock:
+            for booking_id, changes, expected_version, new_version in updates:
+                booking = self._bookings.get(booking_id)
+                if booking is None or booking["version"] != expected_version:
+                    conflicts.append(booking_id)
+                    continue
+                booking.update(changes)
+                booking["version"] = new_version
+        return conflicts
+    
+    def seed(self, bookings: Iterable[Dict[str, Any]]):
+        with self._lock:
+            for booking in bookings:
+                self._bookings.setdefault(booking["booking_id"], {"version": 1, **booking})
+    
+    def update(self, booking_id: str, changes: Dict[str, Any], expected_version: Optional[int] = None,
+               idempotency: Optional[Tuple[str, Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+        # Copied before the booking is touched, so a response that cannot be stored changes nothing
+        stored_response = json.loads(json.dumps(idempotency[1])) if idempotency is not None else None
+        with self._lock:
+            booking = self._bookings.get(booking_id)
+            if booking is None:
+                return None
+            if expected_version is not None and booking["version"] != expected_version:
+                raise BookingVersionConflictError(
+                    f"Booking {booking_id} is at version {booking['version']}, expected {expected_version}"
+                )
+            previous = dict(booking)
+            booking.update(changes)
+            booking["version"] = previous["version"] + 1
+            if idempotency is not None:
+                self._store_response(idempotency[0], stored_response)
+            return previous
+    
+    def reserve_idempotency_key(self, key: str, fingerprint: str, ttl: float,
+                                pending_timeout: float) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._idempotency_keys.get(key)
+            if entry is not None:
+                entry_fingerprint, response, created_at = entry
+                if now - created_at <= (ttl if response is not None else pending_timeout):
+                    return {"fingerprint": entry_fingerprint, "response": response}
+                del self._idempotency_keys[key]
+            
+            self._idempotency_keys[key] = [fingerprint, None, now]
+            # Oldest first, so the bound drops the entries closest to expiry
+            while len(self._idempotency_keys) > self.max_idempotency_keys:
+                self._idempotency_keys.popitem(last=False)
+            return None
+    
+    def complete_idempotency_key(self, key: str, response: Dict[str, Any]):
+        # A detached copy, as a database round trip would give
+        response = json.loads(json.dumps(response))
+        with self._lock:
+            self._store_response(key, response)
+    
+    def _store_response(self, key: str, response: Dict[str, Any]):
+        # Callers hold the lock
+        entry = self._idempotency_keys.get(key)
+        if entry is not None:
+            entry[1] = response
+    
+    def release_idempotency_key(self, key: str):
+        with self._lock:
+            entry = self._idempotency_keys.get(key)
+            if entry is not None and entry[1] is None:
+                del self._idempotency_keys[key]
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._bookings)
+
+class SQLiteBookingStore(BookingStore):
+    """
+    Bookings in a SQLite database in WAL mode, so readers in every worker proceed while one writes.
+    Each thread uses its own connection, reused across requests; statements are fixed
+    parameterized SQL, which sqlite3 prepares once per connection and then reuses.
+    """
+    
+    GET_SQL = f"SELECT {', '.join(BOOKING_COLUMNS)} FROM bookings WHERE booking_id = ?"
+    LIST_BY_USER_SQL = f"SELECT {', '.join(BOOKING_COLUMNS)} FROM bookings WHERE user_id = ? ORDER BY booking_id"
+    INSERT_SQL = (f"INSERT OR IGNORE INTO bookings ({', '.join(BOOKING_COLUMNS)}) "
+                  f"VALUES ({', '.join('?' for _ in BOOKING_COLUMNS)})")
+    COUNT_SQL = "SELECT COUNT(*) FROM bookings"
+    
+    # Ids per IN (...) query, below SQLite's default limit of 999 bound variables
+    MAX_IN_IDS = 900
+    
+    SCHEMA = (
+        f"""CREATE TABLE IF NOT EXISTS bookings (
+            {', '.join(f'{column} {BOOKING_COLUMN_TYPES.get(column, "TEXT")}' for column in BOOKING_COLUMNS)}
+        )""",
+        # The primary key is the booking_id index; lookups by user get their own
+        "CREATE INDEX IF NOT EXISTS idx_bookings_user_id ON bookings (user_id)",
+        # Responses of booking changes by idempotency key; response is NULL while pending
+        """CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            response TEXT,
+            created_at REAL NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at ON idempotency_keys (created_at)",
+    )
+    
+    GET_KEY_SQL = "SELECT fingerprint, response, created_at FROM idempotency_keys WHERE key = ?"
+    RESERVE_KEY_SQL = "INSERT OR REPLACE INTO idempotency_keys (key, fingerprint, response, created_at) VALUES (?, ?, NULL, ?)"
+    COMPLETE_KEY_SQL = "UPDATE idempotency_keys SET response = ? WHERE key = ?"
+    RELEASE_KEY_SQL = "DELETE FROM idempotency_keys WHERE key = ? AND response IS NULL"
+    EXPIRE_KEYS_SQL = "DELETE FROM idempotency_keys WHERE created_at < ?"
+    TRIM_KEYS_SQL = ("DELETE FROM idempotency_keys WHERE key IN "
+                     "(SELECT key FROM idempotency_keys ORDER BY created_at DESC LIMIT -1 OFFSET ?)")
+    
+    # Expired and excess keys are pruned once every this many reservations
+    PRUNE_EVERY = 256
+    
+    def __init__(self, path: str, timeout: float = 5.0, max_idempotency_keys: int = 100000):
+        if path == ":memory:":
+            raise ValueError("Each thread would get its own empty database; use InMemoryBookingStore instead")
+        self.path = path
+        self.timeout = timeout
+        self.max_idempotency_keys = max_idempotency_keys
+        self._reservations = 0
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self.transaction() as connection:
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+            # Databases created before a column was added get it with its default
+            existing = {row[1] for row in connection.execute("PRAGMA table_info(bookings)")}
+            for column in BOOKING_COLUMNS:
+                if column not in existing:
+                    connection.execute(
+                        f"ALTER TABLE bookings ADD COLUMN {column} {BOOKING_COLUMN_TYPES.get(column, 'TEXT')}"
+                    )
+    
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode: transactions are opened explicitly and kept short.
+        # Only the owning thread uses a connection; other threads only close it in close()
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                     cached_statements=64, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # Durable at checkpoints; a power loss can only drop the last few commits
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+        return connection
+    
+    def connection(self) -> sqlite3.Connection:
+        """
+        Get this thread's connection, opening it on first use
+        """
+        # Connections must not cross a fork: a pre-forked worker opens its own
+        if os.getpid() != self._pid:
+            with self._lock:
+                if os.getpid() != self._pid:
+                    self._local = threading.local()
+                    self._connections = []
+                    self._pid = os.getpid()
+        
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+    
+    @contextmanager
+    def transaction(self, immediate: bool = True) -> Iterator[sqlite3.Connection]:
+        """
+        Run statements in one transaction; IMMEDIATE takes the write lock up front
+        so read-modify-write sequences cannot deadlock on lock upgrade
+        """
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        else:
+            connection.execute("COMMIT")
+    
+    @staticmethod
+    def _to_dict(row: Optional[tuple]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        return {column: value for column, value in zip(BOOKING_COLUMNS, row) if value is not None}
+    
+    @staticmethod
+    def _to_row(booking: Dict[str, Any]) -> tuple:
+        return tuple(booking.get(column) for column in BOOKING_COLUMNS[:-1]) + (booking.get("version", 1),)
+    
+    def get(self, booking_id: str) -> Optional[Dict[str, Any]]:
+        # A single SELECT in autocommit mode is its own short read transaction
+        return self._to_dict(self.connection().execute(self.GET_SQL, (booking_id,)).fetchone())
+    
+    def list_by_user(self, user_id: str) -> List[Dict[str, Any]]:
+        rows = self.connection().execute(self.LIST_BY_USER_SQL, (user_id,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+    
+    def _select_in(self, connection: sqlite3.Connection, columns: str, booking_ids: List[str]) -> List[tuple]:
+        """
+        Rows for many ids with a few IN queries; full-size chunks share one cached statement
+        """
+        rows = []
+        for start in range(0, len(booking_ids), self.MAX_IN_IDS):
+            chunk = booking_ids[start:start + self.MAX_IN_IDS]
+            sql = f"SELECT {columns} FROM bookings WHERE booking_id IN ({', '.join('?' for _ in chunk)})"
+            rows.extend(connection.execute(sql, chunk).fetchall())
+        return rows
+    
+    def get_many(self, booking_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        booking_ids = list(dict.fromkeys(booking_ids))
+        # One read transaction, so all bookings come from the same database state
+        with self.transaction(immediate=False) as connection:
+            rows = self._select_in(connection, ", ".join(BOOKING_COLUMNS), booking_ids)
+        return {row[0]: self._to_dict(row) for row in rows}
+    
+    def update_many(self, updates: List[Tuple[str, Dict[str, Any], int, int]]) -> List[str]:
+        if not updates:
+            return []
+        columns = sorted(updates[0][1])
+        if any(sorted(changes) != columns for _, changes, _, _ in updates):
+            raise ValueError("All updates of a batch must change the same fields")
+        unknown = set(columns) - set(BOOKING_COLUMNS[1:-1])
+        if unknown:
+            raise ValueError(f"Unknown booking fields: {sorted(unknown)}")
+        
+        update_sql = (f"UPDATE bookings SET {''.join(f'{column} = ?, ' for column in columns)}version = ? "
+                      f"WHERE booking_id = ?")
+        with self.transaction() as connection:
+            # The write lock is held, so versions cannot change between this check and the update
+            versions = dict(self._select_in(connection, "booking_id, version", [update[0] for update in updates]))
+            conflicts = [booking_id for booking_id, _, expected_version, _ in updates
+                         if versions.get(booking_id) != expected_version]
+            conflicted = set(conflicts)
+            connection.executemany(update_sql, [
+                [changes[column] for column in columns] + [new_version, booking_id]
+                for booking_id, changes, _, new_version in updates if booking_id not in conflicted
+            ])
+        return conflicts
+    
+    def seed(self, bookings: Iterable[Dict[str, Any]]):
+        with self.transaction() as connection:
+            connection.executemany(self.INSERT_SQL, [self._to_row(booking) for booking in bookings])
+    
+    def update(self, booking_id: str, changes: Dict[str, Any], expected_version: Optional[int] = None,
+               idempotency: Optional[Tuple[str, Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+        unknown = set(changes) - set(BOOKING_COLUMNS[1:-1])
+        if unknown:
+            raise ValueError(f"Unknown booking fields: {sorted(unknown)}")
+        
+        # Column names come from BOOKING_COLUMNS only, values are bound
+        columns = sorted(changes)
+        update_sql = (f"UPDATE bookings SET {''.join(f'{column} = ?, ' for column in columns)}version = version + 1 "
+                      f"WHERE booking_id = ?")
+        with self.transaction() as connection:
+            previous = self._to_dict(connection.execute(self.GET_SQL, (booking_id,)).fetchone())
+            if previous is None:
+                return None
+            if expected_version is not None and previous["version"] != expected_version:
+                raise BookingVersionConflictError(
+                    f"Booking {booking_id} is at version {previous['version']}, expected {expected_version}"
+                )
+            connection.execute(update_sql, [changes[column] for column in columns] + [booking_id])
+            if idempotency is not None:
+                key, response = idempotency
+                connection.execute(self.COMPLETE_KEY_SQL, (json.dumps(response, ensure_ascii=False), key))
+        return previous
+    
+    def reserve_idempotency_key(self, key: str, fingerprint: str, ttl: float,
+                                pending_timeout: float) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            self._reservations += 1
+            prune = self._reservations % self.PRUNE_EVERY == 0
+        
+        with self.transaction() as connection:
+            row = connection.execute(self.GET_KEY_SQL, (key,)).fetchone()
+            if row is not None:
+                entry_fingerprint, response, created_at = row
+                if now - created_at <= (ttl if response is not None else pending_timeout):
+                    return {"fingerprint": entry_fingerprint, "response": json.loads(response) if response else None}
+            connection.execute(self.RESERVE_KEY_SQL, (key, fingerprint, now))
+            if prune:
+                connection.execute(self.EXPIRE_KEYS_SQL, (now - ttl,))
+                connection.execute(self.TRIM_KEYS_SQL, (self.max_idempotency_keys,))
+        return None
+    
+    def complete_idempotency_key(self, key: str, response: Dict[str, Any]):
+        with self.transaction() as connection:
+            connection.execute(self.COMPLETE_KEY_SQL, (json.dumps(response, ensure_ascii=False), key))
+    
+    def release_idempotency_key(self, key: str):
+        with self.transaction() as connection:
+            connection.execute(self.RELEASE_KEY_SQL, (key,))
+    
+    def __len__(self) -> int:
+        return self.connection().execute(self.COUNT_SQL).fetchone()[0]
+    
+    def close(self):
+        """
+        Close every connection opened by this process
+        """
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for connection in connections:
+            connection.close()
+
+def create_booking_store(path: Optional[str] = None) -> BookingStore:
+    """
+    SQLite store at `path` (default: BOOKING_DB_PATH), or the in-memory store when neither is set
+    """
+    path = path or os.getenv("BOOKING_DB_PATH")
+    return SQLiteBookingStore(path) if path else InMemoryBookingStore()
@@ -0,0 +1,178 @@
+"""
+Cache Service
+Bounded, thread-safe LRU cache with optional TTL expiry and hit/miss counters,
+and a semantic cache that matches near-duplicate query embeddings.
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+import numpy as np
+import threading
+import time
+from app.services.lazy_import import lazy_import
+
+# FAISS is imported on first use
+faiss = lazy_import("faiss")
+
+class LRUCache:
+    """
+    Thread-safe LRU cache evicting by size and, optionally, by age
+    """
+    
+    def __init__(self, max_size: int = 1024, ttl_seconds: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()  # key -> (value, stored_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get a cached value and mark it as recently used
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            
+            value, stored_at = entry
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key: Hashable, value: Any):
+        """
+        Store a value, evicting the least recently used entries when full
+        """
+        if self.max_size <= 0:
+            return
+        
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        """
+        Drop all cached entries
+        """
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+class SemanticAnswerCache:
+    """
+    Small FAISS index of recently answered query embeddings.
+    A new query within the cosine threshold of a cached one reuses its answer.
+    """
+    
+    def __init__(self, max_size: int = 512, similarity_threshold: float = 0.95):
+        self.max_size = max_size
+        self.similarity_threshold = similarity_threshold
+        self.index = None  # Created on first add, once the dimension is known
+        self._entries = OrderedDict()  # id -> cached value, in LRU order
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def lookup(self, embedding: np.ndarray) -> Optional[Any]:
+        """
+        Get the cached value of the closest query if it is similar enough
+        """
+        with self._lock:
+            if self.index is None or not self._entries:
+                self.misses += 1
+                return None
+            
+            scores, ids = self.index.search(embedding.reshape(1, -1).astype('float32'), 1)
+            score, entry_id = float(scores[0][0]), int(ids[0][0])
+            
+            if entry_id == -1 or score < self.similarity_threshold or entry_id not in self._entries:
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return self._entries[entry_id]
+    
+    def add(self, embedding: np.ndarray, value: Any):
+        """
+        Cache a value for a normalized query embedding, evicting the least recently used entry when full
+        """
+        if self.max_size <= 0:
+            return
+        
+        vector = embedding.reshape(1, -1).astype('float32')
+        with self._lock:
+            if self.index is None:
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[1]))
+            
+            entry_id = self._next_id
+            self._next_id += 1
+            self.index.add_with_ids(vector, np.array([entry_id], dtype='int64'))
+            self._entries[entry_id] = value
+            
+            while len(self._entries) > self.max_size:
+                evicted_id, _ = self._entries.popitem(last=False)
+                self.index.remove_ids(np.array([evicted_id], dtype='int64'))
+                self.evictions += 1
+    
+    def clear(self):
+        """
+        Drop all cached answers (e.g. after the FAQ index changes)
+        """
+        with self._lock:
+            self.index = None
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "similarity_threshold": self.similarity_threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions
+            }
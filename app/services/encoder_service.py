@@ -0,0 +1,302 @@
+"""
+Encoder Service
+Interchangeable CPU embedding backends for the RAG model: sentence-transformers
+(PyTorch), an exported ONNX model run with ONNX Runtime, and its dynamically
+quantized int8 variant, plus a parity/latency check to switch between them safely.
+
+An encoder is anything with encode(texts) -> np.ndarray of shape (len(texts), dim).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+import json
+import os
+import time
+import numpy as np
+from app.services.lazy_import import lazy_import
+
+SentenceTransformer = lazy_import("sentence_transformers", "SentenceTransformer")
+
+ENCODER_BACKENDS = ("sentence-transformers", "onnx", "onnx-int8")
+
+ONNX_MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+ENCODER_CONFIG_FILE = "encoder_config.json"
+
+def mean_pool(token_embeddings: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """
+    Average token embeddings over the non-padding tokens
+    """
+    mask = attention_mask[..., None].astype('float32')
+    return (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+def l2_normalize(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Scale rows to unit length
+    """
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.clip(norms, 1e-12, None)
+
+class OnnxEncoder:
+    """
+    Sentence encoder running an exported transformer with ONNX Runtime on CPU,
+    with the same tokenization, pooling and normalization as the source model
+    """
+    
+    def __init__(self, model_dir: str, model_file: str = ONNX_MODEL_FILE, batch_size: int = 32,
+                 threads: Optional[int] = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        
+        with open(os.path.join(model_dir, ENCODER_CONFIG_FILE), encoding='utf-8') as f:
+            self.config = json.load(f)
+        self.model_name = self.config.get("model_name")
+        self.batch_size = batch_size
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config.get("max_length", 256))
+        self.tokenizer.enable_padding(pad_id=self.config.get("pad_token_id", 0))
+    
+    def encode(self, texts: List[str], batch_size: Optional[int] = None, show_progress_bar: bool = False,
+               **kwargs) -> np.ndarray:
+        """
+        Encode texts into sentence embeddings
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        batch_size = batch_size or self.batch_size
+        
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(list(texts[start:start + batch_size]))
+            input_ids = np.array([encoding.ids for encoding in encodings], dtype='int64')
+            attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype='int64')
+            
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+            token_embeddings = self.session.run(None, feeds)[0]
+            
+            if self.config.get("pooling") == "cls":
+                pooled = token_embeddings[:, 0]
+            else:
+                pooled = mean_pool(token_embeddings, attention_mask)
+            outputs.append(pooled.astype('float32'))
+        
+        if not outputs:
+            return np.empty((0, self.config.get("dimension", 0)), dtype='float32')
+        
+        embeddings = np.concatenate(outputs)
+        return l2_normalize(embeddings) if self.config.get("normalize", True) else embeddings
+
+def export_onnx(model_name: str, out_dir: str, quantize: bool = True, opset: int = 14) -> Dict[str, Any]:
+    """
+    Export a sentence-transformers model to ONNX (and optionally an int8 dynamically
+    quantized copy) together with its tokenizer and pooling config
+    """
+    import torch
+    
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    os.makedirs(out_dir, exist_ok=True)
+    
+    # Writes tokenizer.json for fast tokenizers
+    tokenizer.save_pretrained(out_dir)
+    
+    sample = tokenizer(["Làm thế nào để đặt vé?"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    
+    class TokenEmbeddings(torch.nn.Module):
+        """
+        Return only the last hidden state so the graph has a single output
+        """
+        
+        def __init__(self, transformer):
+            super().__init__()
+            self.transformer = transformer
+        
+        def forward(self, *inputs):
+            return self.transformer(**dict(zip(input_names, inputs)))[0]
+    
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+    model_path = os.path.join(out_dir, ONNX_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(transformer), tuple(sample[name] for name in input_names), model_path,
+            input_names=input_names, output_names=["token_embeddings"], dynamic_axes=dynamic_axes,
+            opset_version=opset
+        )
+    
+    pooling = next((module for module in model if hasattr(module, "get_pooling_mode_str")), None)
+    config = {
+        "model_name": model_name,
+        "dimension": model.get_sentence_embedding_dimension(),
+        "max_length": model.max_seq_length,
+        "pad_token_id": tokenizer.pad_token_id or 0,
+        "pooling": pooling.get_pooling_mode_str() if pooling is not None else "mean",
+        "normalize": any(type(module).__name__ == "Normalize" for module in model),
+        "exported_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+    
+    files = [ONNX_MODEL_FILE]
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(model_path, os.path.join(out_dir, QUANTIZED_MODEL_FILE), weight_type=QuantType.QInt8)
+        files.append(QUANTIZED_MODEL_FILE)
+    config["files"] = files
+    
+    with open(os.path.join(out_dir, ENCODER_CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    return config
+
+def create_encoder(backend: str, model_name: str, onnx_dir: Optional[str] = None, threads: Optional[int] = None):
+    """
+    Construct the encoder for a backend name
+    """
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend '{backend}', expected one of {ENCODER_BACKENDS}")
+    if backend == "sentence-transformers":
+        return SentenceTransformer(model_name)
+    if not onnx_dir:
+        raise ValueError(f"Encoder backend '{backend}' needs the directory of an exported ONNX model")
+    
+    model_file = QUANTIZED_MODEL_FILE if backend == "onnx-int8" else ONNX_MODEL_FILE
+    encoder = OnnxEncoder(onnx_dir, model_file, threads=threads)
+    if encoder.model_name and encoder.model_name != model_name:
+        raise ValueError(f"ONNX model in '{onnx_dir}' was exported from '{encoder.model_name}', configured '{model_name}'")
+    return encoder
+
+def encode_corpus(encoder, texts: List[str], batch_size: int = 64, workers: int = 1) -> np.ndarray:
+    """
+    Encode a whole corpus in length-sorted batches (little padding per batch),
+    spread over several processes (sentence-transformers) or threads (ONNX Runtime
+    releases the GIL), and return the embeddings in the original order
+    """
+    texts = list(texts)
+    order = np.argsort([len(text) for text in texts], kind='stable')
+    sorted_texts = [texts[i] for i in order]
+    batches = [sorted_texts[start:start + batch_size] for start in range(0, len(sorted_texts), batch_size)]
+    
+    if workers > 1 and len(batches) > 1 and hasattr(encoder, "start_multi_process_pool"):
+        pool = encoder.start_multi_process_pool(["cpu"] * workers)
+        try:
+            # Chunks are contiguous, so each worker still gets similar-length texts
+            vectors = encoder.encode_multi_process(sorted_texts, pool, batch_size=batch_size)
+        finally:
+            encoder.stop_multi_process_pool(pool)
+    elif workers > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="faq-encode") as executor:
+            vectors = np.concatenate(list(executor.map(lambda batch: np.asarray(encoder.encode(batch)), batches)))
+    else:
+        vectors = np.concatenate([np.asarray(encoder.encode(batch)) for batch in batches]) if batches else None
+    
+    if vectors is None:
+        return np.empty((0, 0), dtype='float32')
+    embeddings = np.empty_like(vectors)
+    embeddings[order] = vectors
+    return embeddings
+
+def measure_latency(encoder, texts: List[str], repeats: int = 1) -> Dict[str, float]:
+    """
+    Single-query latency (as on /api/faq/ask) and whole-batch throughput of an encoder
+    """
+    latencies = []
+    for _ in range(repeats):
+        for text in texts:
+            start_time = time.perf_counter()
+            encoder.encode([text])
+            latencies.append(time.perf_counter() - start_time)
+    latencies_ms = np.array(latencies) * 1000
+    
+    start_time = time.perf_counter()
+    encoder.encode(list(texts))
+    batch_time = time.perf_counter() - start_time
+    
+    return {
+        "latency_ms_avg": float(latencies_ms.mean()) if latencies else 0.0,
+        "latency_ms_p50": float(np.percentile(latencies_ms, 50)) if latencies else 0.0,
+        "latency_ms_p95": float(np.percentile(latencies_ms, 95)) if latencies else 0.0,
+        "batch_texts_per_s": len(texts) / batch_time if batch_time > 0 else 0.0
+    }
+
+def compare_encoders(encoders: Dict[str, Any], corpus: List[str], queries: List[str], reference: str,
+                     min_cosine: float = 0.98, min_top1_agreement: float = 0.95,
+                     latency_repeats: int = 1) -> Dict[str, Dict[str, Any]]:
+    """
+    Check each encoder against the reference: cosine similarity between their embeddings
+    of the same corpus texts, agreement of the top-1 corpus match per query, and latency
+    """
+    encoded = {
+        name: (l2_normalize(np.asarray(encoder.encode(corpus), dtype='float32')),
+               l2_normalize(np.asarray(encoder.encode(queries), dtype='float32')))
+        for name, encoder in encoders.items()
+    }
+    reference_corpus, reference_queries = encoded[reference]
+    reference_top1 = (reference_queries @ reference_corpus.T).argmax(axis=1)
+    
+    reports = {}
+    for name, encoder in encoders.items():
+        corpus_embeddings, query_embeddings = encoded[name]
+        cosines = (corpus_embeddings * reference_corpus).sum(axis=1)
+        top1 = (query_embeddings @ corpus_embeddings.T).argmax(axis=1)
+        top1_agreement = float((top1 == reference_top1).mean()) if len(queries) else 1.0
+        
+        report = {
+            "cosine_mean": float(cosines.mean()),
+            "cosine_min": float(cosines.min()),
+            "top1_agreement": top1_agreement,
+            "parity_ok": bool(cosines.min() >= min_cosine and top1_agreement >= min_top1_agreement)
+        }
+        report.update(measure_latency(encoder, queries, latency_repeats))
+        reports[name] = report
+    
+    return reports
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Command line: export an ONNX model, or compare backends on the FAQ data
+    """
+    import argparse
+    from app.services.faq_store import FAQStore
+    from app.services.rag_service import DEFAULT_CSV_PATH, DEFAULT_ONNX_DIR
+    from app.services.text_processing import fold_diacritics
+    
+    parser = argparse.ArgumentParser(prog="python -m app.services.encoder_service")
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--onnx-dir", default=DEFAULT_ONNX_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Export the model to ONNX and int8 ONNX")
+    export.add_argument("--no-quantize", action="store_true")
+    compare = commands.add_parser("compare", help="Parity and latency of every backend against PyTorch")
+    compare.add_argument("--csv", default=DEFAULT_CSV_PATH)
+    compare.add_argument("--backends", nargs="+", default=list(ENCODER_BACKENDS))
+    compare.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+    
+    if args.command == "export":
+        print(json.dumps(export_onnx(args.model, args.onnx_dir, quantize=not args.no_quantize), indent=2))
+        return
+    
+    import pandas as pd
+    store = FAQStore.from_dataframe(pd.read_csv(args.csv))
+    corpus = list(store.questions)
+    # Unaccented questions, as typed on keyboards without Vietnamese input, make top-1 non-trivial
+    queries = [fold_diacritics(question) for question in corpus]
+    
+    encoders = {backend: create_encoder(backend, args.model, args.onnx_dir) for backend in args.backends}
+    reports = compare_encoders(encoders, corpus, queries, reference=args.backends[0], latency_repeats=args.repeats)
+    print(json.dumps(reports, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Executor Service
+Runs blocking CPU-heavy work (encode, FAISS search, pandas) off the event loop
+in a size-limited thread pool with an explicit queue-depth limit.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import threading
+import time
+
+class ExecutorSaturatedError(Exception):
+    """
+    Raised when the executor already holds its maximum number of queued and running tasks
+    """
+
+class BoundedExecutor:
+    """
+    Thread pool that rejects new work instead of queueing it without bound,
+    and drops queued work that waited longer than its caller is willing to
+    """
+    
+    def __init__(self, max_workers: int = 32, max_queue_depth: int = 64, name: str = "faq-worker",
+                 max_queue_wait: Optional[float] = None):
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.max_queue_wait = max_queue_wait
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        # One slot per running or waiting task
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue_depth)
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._expired = 0
+    
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Submit work, raising ExecutorSaturatedError if the queue is full
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._rejected += 1
+            raise ExecutorSaturatedError("Hệ thống đang quá tải, vui lòng thử lại sau.")
+        
+        with self._stats_lock:
+            self._in_flight += 1
+        
+        try:
+            if self.max_queue_wait is None:
+                future = self._executor.submit(fn, *args, **kwargs)
+            else:
+                future = self._executor.submit(self._run_unless_expired, time.monotonic(), fn, args, kwargs)
+        except Exception:
+            with self._stats_lock:
+                self._in_flight -= 1
+            self._slots.release()
+            raise
+        
+        future.add_done_callback(self._release)
+        return future
+    
+    def _run_unless_expired(self, submitted_at: float, fn: Callable, args: tuple, kwargs: dict) -> Any:
+        """
+        Run queued work only if it has not waited past max_queue_wait; the client has likely given up by then
+        """
+        if time.monotonic() - submitted_at > self.max_queue_wait:
+            with self._stats_lock:
+                self._expired += 1
+            raise ExecutorSaturatedError("Hệ thống đang quá tải, vui lòng thử lại sau.")
+        return fn(*args, **kwargs)
+    
+    def _release(self, future: Future = None):
+        """
+        Free the slot held by a finished task
+        """
+        with self._stats_lock:
+            self._in_flight -= 1
+            self._completed += 1
+        self._slots.release()
+    
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run blocking work in the pool and await its result without blocking the event loop
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get executor load statistics
+        """
+        with self._stats_lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue_depth": self.max_queue_depth,
+                "max_queue_wait": self.max_queue_wait,
+                "in_flight": self._in_flight,
+                "queued": max(0, self._in_flight - self.max_workers),
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "expired": self._expired
+            }
+    
+    def shutdown(self, wait: bool = True):
+        """
+        Stop accepting work and shut the pool down
+        """
+        self._executor.shutdown(wait=wait)
@@ -1,11 +1,20 @@
 from app.services.rag_service import RAGService
-from app.models.schemas import FAQRequest, FAQResponse
+from app.services.batching_service import MicroBatcher
+from app.services.metrics_service import FAQ_SINGLE_FLIGHT_TOTAL
+from app.services.singleflight_service import SingleFlight
+from app.services.text_processing import normalize_query
+from app.models.schemas import FAQRequest, FAQResponse, FAQBatchRequest, FAQBatchResponse
 import time
 
 class FAQService:
-    def __init__(self):
+    def __init__(self, enable_batching: bool = True, max_batch_size: int = 32, max_wait_ms: float = 5.0,
+                 enable_single_flight: bool = True):
         self.rag_service = RAGService()
         self.initialized = False
+        # Coalesce concurrent questions into one encode/search pass
+        self.batcher = MicroBatcher(self.answer_batch, max_batch_size, max_wait_ms) if enable_batching else None
+        # Identical questions in flight at the same time share one answer
+        self.single_flight = SingleFlight() if enable_single_flight else None
     
     def initialize(self):
         """
@@ -26,11 +35,32 @@ class FAQService:
                 processing_time=0.0
             )
         
+        if self.single_flight is None:
+            return self.answer_question(request.question)
+        
+        # Keyed on the snapshot too, so a request arriving after a reload never joins a stale computation
+        key = (self.rag_service.snapshot.version, normalize_query(request.question))
+        response, shared = self.single_flight.do(key, self.answer_question, request.question)
+        FAQ_SINGLE_FLIGHT_TOTAL.inc(role="collapsed" if shared else "executed")
+        return response
+    
+    def answer_question(self, question: str) -> FAQResponse:
+        """
+        Answer one question with the RAG service
+        """
         start_time = time.time()
         
         try:
-            # Get answer from RAG service
-            answer, confidence, source_question = self.rag_service.get_answer(request.question)
+            # Get answer from RAG service, batched with concurrent requests if enabled.
+            # Verbatim and decisive lexical matches are answered here, without waiting for a batch.
+            if self.batcher is not None:
+                fast_answer, miss = self.rag_service.get_fast_answer(question)
+                if fast_answer is None:
+                    # The miss carries the lexical hits, so the batch does not recompute them
+                    fast_answer = self.batcher.submit(miss)
+                answer, confidence, source_question = fast_answer
+            else:
+                answer, confidence, source_question = self.rag_service.get_answer(question)
             
             processing_time = time.time() - start_time
             
@@ -49,6 +79,106 @@ class FAQService:
                 processing_time=processing_time
             )
     
+    def answer_batch(self, questions: list) -> list:
+        """
+        Answer a batch formed by the micro-batcher
+        """
+        return self.rag_service.get_answers(questions)
+    
+    def get_batching_stats(self) -> dict:
+        """
+        Get micro-batching statistics
+        """
+        if self.batcher is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.batcher.get_stats()}
+    
+    def get_single_flight_stats(self) -> dict:
+        """
+        Get statistics of identical in-flight questions collapsed into one computation
+        """
+        if self.single_flight is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.single_flight.get_stats()}
+    
+    def reload_faq_data(self, csv_path: str = None) -> dict:
+        """
+        Start a background rebuild of the FAQ index; the new snapshot is swapped in when ready
+        """
+        if not self.initialized:
+            return {"status": "not_initialized"}
+        return self.rag_service.reload_in_background(csv_path)
+    
+    def get_reload_status(self) -> dict:
+        """
+        Get the result of the last FAQ reload
+        """
+        return {
+            "snapshot_version": self.rag_service.snapshot.version,
+            "last_reload": self.rag_service.last_reload
+        }
+    
+    def get_cache_stats(self) -> dict:
+        """
+        Get RAG cache statistics
+        """
+        return self.rag_service.get_cache_stats()
+    
+    def get_faq_answers(self, request: FAQBatchRequest) -> FAQBatchResponse:
+        """
+        Get FAQ answers for many questions in a single encode/search pass
+        """
+        questions = request.questions
+        
+        if not self.initialized:
+            results = [
+                FAQResponse(
+                    answer="Hệ thống đang khởi tạo, vui lòng thử lại sau.",
+                    confidence=0.0,
+                    processing_time=0.0
+                )
+                for _ in questions
+            ]
+            return FAQBatchResponse(results=results, count=len(results), processing_time=0.0)
+        
+        start_time = time.time()
+        
+        try:
+            # Get all answers from RAG service at once
+            answers = self.rag_service.get_answers(questions)
+            
+            processing_time = time.time() - start_time
+            # Encoding and search are shared, so each item gets an equal share
+            item_time = processing_time / len(questions) if questions else 0.0
+            
+            results = [
+                FAQResponse(
+                    answer=answer,
+                    confidence=confidence,
+                    source_question=source_question,
+                    processing_time=item_time
+                )
+                for answer, confidence, source_question in answers
+            ]
+        
+        except Exception as e:
+            processing_time = time.time() - start_time
+            item_time = processing_time / len(questions) if questions else 0.0
+            results = [
+                FAQResponse(
+                    answer=f"Xin lỗi, đã xảy ra lỗi khi xử lý câu hỏi: {str(e)}",
+                    confidence=0.0,
+                    processing_time=item_time
+                )
+                for _ in questions
+            ]
+        
+        return FAQBatchResponse(
+            results=results,
+            count=len(results),
+            processing_time=processing_time
+        )
+    
     def get_all_faqs(self) -> list:
         """
         Get all FAQ questions for display
@@ -56,19 +186,23 @@ class FAQService:
         if not self.initialized or self.rag_service.faq_data is None:
             return []
         
-        return self.rag_service.faq_data['question'].tolist()
+        # Already an immutable tuple, nothing to convert per call
+        return self.rag_service.faq_data.questions
     
-    def search_faqs(self, keyword: str) -> list:
+    def search_faqs(self, keyword: str, limit: int = None, offset: int = 0) -> list:
         """
-        Search FAQs by keyword
+        Search FAQ questions and answers by keyword, accent-insensitive,
+        returning one page of ranked results
         """
-        if not self.initialized or self.rag_service.faq_data is None:
-            return []
-        
-        # Simple keyword search
-        faq_data = self.rag_service.faq_data
-        matching_faqs = faq_data[
-            faq_data['question'].str.contains(keyword, case=False, na=False)
-        ]
+        return self.search_faqs_page(keyword, limit, offset)["results"]
+    
+    def search_faqs_page(self, keyword: str, limit: int = None, offset: int = 0) -> dict:
+        """
+        One page of ranked keyword search results and the total number of matches
+        """
+        keyword_index = self.rag_service.snapshot.keyword_index
+        if not self.initialized or keyword_index is None:
+            return {"results": [], "total": 0}
         
-        return matching_faqs.to_dict('records')
+        total, records = keyword_index.search(keyword, limit, offset)
+        return {"results": [record.to_dict() for record in records], "total": total}
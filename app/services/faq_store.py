@@ -0,0 +1,75 @@
+"""
+FAQ Store
+Compact immutable in-memory FAQ rows: parallel tuples of interned strings
+with lightweight record objects, built once when the CSV is ingested.
+"""
+
+from typing import Any, Dict, Iterable, Tuple
+import sys
+
+def _clean(value: Any) -> str:
+    """
+    Turn a CSV cell (possibly NaN or a number) into an interned string
+    """
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    return sys.intern(str(value))
+
+class FAQRecord:
+    """
+    One FAQ row
+    """
+    
+    __slots__ = ("question", "answer")
+    
+    def __init__(self, question: str, answer: str):
+        self.question = question
+        self.answer = answer
+    
+    def __getitem__(self, field: str) -> str:
+        return getattr(self, field)
+    
+    def __repr__(self) -> str:
+        return f"FAQRecord(question={self.question!r})"
+    
+    def to_dict(self) -> Dict[str, str]:
+        """
+        Get the row as a JSON-ready dict
+        """
+        return {"question": self.question, "answer": self.answer}
+
+class FAQStore:
+    """
+    Read-only FAQ rows addressed by position, as in the CSV
+    """
+    
+    __slots__ = ("questions", "answers", "records")
+    
+    columns = ("question", "answer")
+    
+    def __init__(self, questions: Iterable[Any], answers: Iterable[Any]):
+        self.questions: Tuple[str, ...] = tuple(_clean(question) for question in questions)
+        self.answers: Tuple[str, ...] = tuple(_clean(answer) for answer in answers)
+        if len(self.questions) != len(self.answers):
+            raise ValueError(f"Got {len(self.questions)} questions but {len(self.answers)} answers")
+        self.records: Tuple[FAQRecord, ...] = tuple(map(FAQRecord, self.questions, self.answers))
+    
+    @classmethod
+    def from_dataframe(cls, faq_data) -> "FAQStore":
+        """
+        Build a store from an ingested CSV DataFrame with a 'question' and optional 'answer' column
+        """
+        if 'question' not in faq_data:
+            raise ValueError("FAQ data must have a 'question' column")
+        questions = faq_data['question'].tolist()
+        answers = faq_data['answer'].tolist() if 'answer' in faq_data else [None] * len(questions)
+        return cls(questions, answers)
+    
+    def __len__(self) -> int:
+        return len(self.records)
+    
+    def __getitem__(self, row: int) -> FAQRecord:
+        return self.records[row]
+    
+    def __iter__(self):
+        return iter(self.records)
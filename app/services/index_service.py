@@ -0,0 +1,178 @@
+"""
+Index Service
+Builds FAISS indexes of a configurable type (Flat, HNSW, IVF, IVF-PQ) over
+normalized embeddings and evaluates their recall/latency against an exact index.
+"""
+
+from typing import Any, Dict, List, Optional
+import numpy as np
+import time
+from app.services.lazy_import import lazy_import
+
+# FAISS is imported on first use
+faiss = lazy_import("faiss")
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+
+# Default parameters per index type
+DEFAULT_INDEX_PARAMS = {
+    "flat": {},
+    "hnsw": {"M": 32, "efConstruction": 200, "efSearch": 64},
+    "ivf": {"nlist": 1024, "nprobe": 16},
+    "ivfpq": {"nlist": 1024, "nprobe": 16, "pq_m": 48, "pq_nbits": 8}
+}
+
+def resolve_index_params(index_type: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Merge user parameters over the defaults of an index type
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+    return {**DEFAULT_INDEX_PARAMS[index_type], **(params or {})}
+
+def build_index(embeddings: np.ndarray, index_type: str = "flat", params: Optional[Dict[str, Any]] = None,
+                ids: Optional[np.ndarray] = None):
+    """
+    Build (and train, if needed) an inner-product index over normalized embeddings.
+    With ids, vectors are stored under those int64 IDs so the index can be patched in place.
+    """
+    params = resolve_index_params(index_type, params)
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    num_rows, dimension = embeddings.shape
+    
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dimension)  # Inner product for cosine similarity
+    
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, params["M"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params["efConstruction"]
+    
+    else:
+        # IVF needs at least one training point per list
+        nlist = max(1, min(params["nlist"], num_rows))
+        quantizer = faiss.IndexFlatIP(dimension)
+        
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            if dimension % params["pq_m"] != 0:
+                raise ValueError(f"pq_m={params['pq_m']} must divide the embedding dimension {dimension}")
+            # Each PQ codebook needs at least 2^nbits training points
+            nbits = params["pq_nbits"]
+            while nbits > 1 and 2 ** nbits > num_rows:
+                nbits -= 1
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, params["pq_m"], nbits, faiss.METRIC_INNER_PRODUCT)
+        
+        index.train(embeddings)
+    
+    if ids is None:
+        index.add(embeddings)
+    else:
+        # IVF indexes carry IDs natively, the others need an ID map
+        if not isinstance(index, faiss.IndexIVF):
+            index = faiss.IndexIDMap2(index)
+        index.add_with_ids(embeddings, np.ascontiguousarray(ids, dtype='int64'))
+    
+    apply_search_params(index, params)
+    return index
+
+def unwrap_index(index):
+    """
+    Get the underlying index of an ID-mapped index
+    """
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+def supports_removal(index) -> bool:
+    """
+    Check whether vectors can be removed from the index in place (HNSW cannot)
+    """
+    return not isinstance(unwrap_index(index), faiss.IndexHNSW)
+
+def apply_search_params(index, params: Dict[str, Any]):
+    """
+    Set query-time parameters (efSearch, nprobe) on a built or loaded index
+    """
+    index = unwrap_index(index)
+    if isinstance(index, faiss.IndexHNSW) and "efSearch" in params:
+        index.hnsw.efSearch = params["efSearch"]
+    elif isinstance(index, faiss.IndexIVF) and "nprobe" in params:
+        index.nprobe = min(params["nprobe"], index.nlist)
+
+def get_index_type(index) -> str:
+    """
+    Identify the configured type name of a FAISS index
+    """
+    index = unwrap_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+def evaluate_index(index, embeddings: np.ndarray, queries: np.ndarray, k: int = 5,
+                   ids: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """
+    Report recall@k against an exact flat index, plus per-query search latency.
+    ids are the IDs the index stores for the embedding rows; row positions by default.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    queries = np.ascontiguousarray(queries, dtype='float32')
+    k = min(k, embeddings.shape[0])
+    
+    exact_index = faiss.IndexFlatIP(embeddings.shape[1])
+    exact_index.add(embeddings)
+    _, exact_ids = exact_index.search(queries, k)
+    if ids is not None:
+        exact_ids = np.asarray(ids, dtype='int64')[exact_ids]
+    
+    latencies = []
+    approx_ids = np.empty_like(exact_ids)
+    for i in range(queries.shape[0]):
+        start_time = time.perf_counter()
+        _, ids = index.search(queries[i:i + 1], k)
+        latencies.append(time.perf_counter() - start_time)
+        approx_ids[i] = ids[0]
+    
+    recalls = [
+        len(set(exact_row) & set(approx_row)) / k
+        for exact_row, approx_row in zip(exact_ids, approx_ids)
+    ]
+    latencies_ms = np.array(latencies) * 1000
+    
+    return {
+        "index_type": get_index_type(index),
+        "k": k,
+        "num_queries": int(queries.shape[0]),
+        f"recall_at_{k}": float(np.mean(recalls)) if recalls else 0.0,
+        "latency_ms_avg": float(latencies_ms.mean()) if latencies else 0.0,
+        "latency_ms_p50": float(np.percentile(latencies_ms, 50)) if latencies else 0.0,
+        "latency_ms_p95": float(np.percentile(latencies_ms, 95)) if latencies else 0.0
+    }
+
+def compare_index_configs(embeddings: np.ndarray, configs: List[Dict[str, Any]], queries: Optional[np.ndarray] = None,
+                          k: int = 5) -> List[Dict[str, Any]]:
+    """
+    Build each {"index_type": ..., "params": {...}} config and evaluate it on the same queries
+    """
+    if queries is None:
+        queries = embeddings
+    
+    reports = []
+    for config in configs:
+        index_type = config.get("index_type", "flat")
+        params = resolve_index_params(index_type, config.get("params"))
+        
+        start_time = time.perf_counter()
+        index = build_index(embeddings, index_type, params)
+        build_time = time.perf_counter() - start_time
+        
+        report = evaluate_index(index, embeddings, queries, k)
+        report["params"] = params
+        report["build_time_s"] = build_time
+        reports.append(report)
+    
+    return reports
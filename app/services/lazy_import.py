@@ -0,0 +1,57 @@
+"""
+Lazy Imports
+Module and attribute proxies that defer importing heavy dependencies
+(faiss, pandas, sentence-transformers/torch) until they are first used.
+"""
+
+from typing import Any, Optional
+import importlib
+import threading
+
+class LazyImport:
+    """
+    Stand-in for a module, or a name inside it, that imports on first attribute access or call
+    """
+    
+    def __init__(self, module_name: str, attribute: Optional[str] = None):
+        self._module_name = module_name
+        self._attribute = attribute
+        self._target = None
+        self._lock = threading.Lock()
+    
+    def _load(self) -> Any:
+        """
+        Import the target once, thread-safely
+        """
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    target = importlib.import_module(self._module_name)
+                    if self._attribute is not None:
+                        target = getattr(target, self._attribute)
+                    self._target = target
+        return self._target
+    
+    @property
+    def loaded(self) -> bool:
+        return self.__dict__.get("_target") is not None
+    
+    def __getattr__(self, name: str) -> Any:
+        # Probes of private and dunder names, such as "__wrapped__" from inspect or copy and
+        # "_is_coroutine" from mock.patch, must not import the module
+        if name.startswith("_") and not self.loaded:
+            raise AttributeError(name)
+        return getattr(self._load(), name)
+    
+    def __call__(self, *args, **kwargs) -> Any:
+        return self._load()(*args, **kwargs)
+    
+    def __repr__(self) -> str:
+        name = f"{self._module_name}.{self._attribute}" if self._attribute else self._module_name
+        return f"<lazy {name}{'' if self.loaded else ' (not imported)'}>"
+
+def lazy_import(module_name: str, attribute: Optional[str] = None) -> LazyImport:
+    """
+    Get a proxy for a module (or one of its attributes) that is imported on first use
+    """
+    return LazyImport(module_name, attribute)
@@ -0,0 +1,242 @@
+"""
+Lexical Search Service
+In-memory BM25 inverted index over FAQ questions and answers with
+diacritics-aware Vietnamese syllable tokenization, plus a character
+trigram index for keyword search.
+"""
+
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import math
+import numpy as np
+from app.services.cache_service import LRUCache
+from app.services.text_processing import fold_diacritics, tokenize
+
+class BM25Index:
+    """
+    Inverted index with BM25 term weights precomputed per posting,
+    so scoring a query is a handful of vectorized adds
+    """
+    
+    def __init__(self, documents: List[str], k1: float = 1.5, b: float = 0.75,
+                 fold: bool = True, bigrams: bool = True):
+        self.k1 = k1
+        self.b = b
+        self.fold = fold
+        self.bigrams = bigrams
+        self.num_docs = len(documents)
+        
+        tokenized = [tokenize(document, fold, bigrams) for document in documents]
+        doc_lengths = np.array([len(tokens) for tokens in tokenized], dtype='float32')
+        avg_length = float(doc_lengths.mean()) if self.num_docs and doc_lengths.sum() else 1.0
+        
+        term_docs = defaultdict(list)
+        for doc_id, tokens in enumerate(tokenized):
+            for term, tf in Counter(tokens).items():
+                term_docs[term].append((doc_id, tf))
+        
+        # term -> (doc ids, BM25 weights)
+        self.postings = {}
+        self.idf = {}
+        for term, docs in term_docs.items():
+            doc_ids = np.array([doc_id for doc_id, _ in docs], dtype='int32')
+            tfs = np.array([tf for _, tf in docs], dtype='float32')
+            idf = math.log(1 + (self.num_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = k1 * (1 - b + b * doc_lengths[doc_ids] / avg_length)
+            self.postings[term] = (doc_ids, (idf * tfs * (k1 + 1) / (tfs + norm)).astype('float32'))
+            self.idf[term] = idf
+        
+        # IDF a term would have if it appeared in no document
+        self.max_idf = math.log(1 + (self.num_docs + 0.5) / 0.5)
+        self.doc_terms = [frozenset(tokens) for tokens in tokenized]
+    
+    def tokenize(self, text: str) -> List[str]:
+        """
+        Tokenize a query the same way documents were indexed
+        """
+        return tokenize(text, self.fold, self.bigrams)
+    
+    def scores(self, terms: List[str]) -> np.ndarray:
+        """
+        BM25 score of every document for the query terms
+        """
+        scores = np.zeros(self.num_docs, dtype='float32')
+        for term in set(terms):
+            posting = self.postings.get(term)
+            if posting is not None:
+                doc_ids, weights = posting
+                scores[doc_ids] += weights
+        return scores
+    
+    def coverage(self, terms: List[str], doc_id: int) -> float:
+        """
+        IDF-weighted share of the query's syllables that appear in a document
+        """
+        unigrams = {term for term in terms if "_" not in term}
+        if not unigrams:
+            return 0.0
+        total = sum(self.idf.get(term, self.max_idf) for term in unigrams)
+        matched = sum(self.idf[term] for term in unigrams if term in self.doc_terms[doc_id])
+        return matched / total if total else 0.0
+
+class LexicalIndex:
+    """
+    BM25 over FAQ questions, with answers as a lower-weighted secondary field
+    """
+    
+    def __init__(self, questions: List[str], answers: List[str], answer_weight: float = 0.3, fold: bool = True):
+        self.answer_weight = answer_weight
+        self.questions = BM25Index(questions, fold=fold)
+        self.answers = BM25Index(answers, fold=fold) if answer_weight > 0 else None
+    
+    def __len__(self) -> int:
+        return self.questions.num_docs
+    
+    def matched_query_terms(self, query: str, row: int) -> int:
+        """
+        Number of distinct query syllables that appear in a FAQ question
+        """
+        terms = {term for term in self.questions.tokenize(query) if "_" not in term}
+        return len(terms & self.questions.doc_terms[row])
+    
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[int, float, float]]:
+        """
+        Get (row, bm25_score, question_coverage) for the best matching FAQ rows
+        """
+        terms = self.questions.tokenize(query)
+        if not terms or not len(self):
+            return []
+        
+        scores = self.questions.scores(terms)
+        if self.answers is not None:
+            scores += self.answer_weight * self.answers.scores(terms)
+        
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        
+        return [
+            (int(row), float(scores[row]), self.questions.coverage(terms, int(row)))
+            for row in candidates
+        ]
+    
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Get index size statistics
+        """
+        return {"documents": len(self), "question_terms": len(self.questions.postings)}
+
+class KeywordIndex:
+    """
+    Character trigram index for accent-insensitive substring search over
+    FAQ questions and answers, serving the prebuilt records it was given
+    """
+    
+    NGRAM = 3
+    
+    def __init__(self, records: Sequence[Any], fields: Tuple[str, ...] = ("question", "answer"),
+                 cache_size: int = 256):
+        self.records = records
+        self.fields = fields
+        # The index never changes, so ranked matches per keyword can be reused until it is replaced
+        self.match_cache = LRUCache(max_size=cache_size)
+        # Folded text per field, in ranking order (question matches first)
+        self.texts = [[self.normalize(record[field]) for record in records] for field in fields]
+        
+        gram_rows = defaultdict(set)
+        for texts in self.texts:
+            for row, text in enumerate(texts):
+                for gram in self.ngrams(text):
+                    gram_rows[gram].add(row)
+        self.postings = {gram: np.array(sorted(rows), dtype='int32') for gram, rows in gram_rows.items()}
+    
+    def __len__(self) -> int:
+        return len(self.records)
+    
+    @staticmethod
+    def normalize(text: Any) -> str:
+        """
+        Lowercase, diacritic-folded text with collapsed whitespace
+        """
+        if not isinstance(text, str):
+            return ""
+        return fold_diacritics(" ".join(text.lower().split()))
+    
+    @classmethod
+    def ngrams(cls, text: str) -> set:
+        """
+        Distinct character n-grams of a normalized text
+        """
+        return {text[i:i + cls.NGRAM] for i in range(len(text) - cls.NGRAM + 1)}
+    
+    def candidates(self, keyword: str) -> Optional[np.ndarray]:
+        """
+        Rows containing every n-gram of the keyword (None when it is too short to use the index)
+        """
+        grams = self.ngrams(keyword)
+        if not grams:
+            return None
+        postings = [self.postings.get(gram) for gram in grams]
+        if any(posting is None for posting in postings):
+            return np.empty(0, dtype='int32')
+        
+        # Intersect from the rarest n-gram up
+        postings.sort(key=len)
+        rows = postings[0]
+        for posting in postings[1:]:
+            rows = np.intersect1d(rows, posting, assume_unique=True)
+            if not len(rows):
+                break
+        return rows
+    
+    def rank_key(self, keyword: str, row: int) -> Optional[tuple]:
+        """
+        Sort key for a confirmed match: field, whole-word match, match position;
+        None if the keyword does not actually occur in the row
+        """
+        for field_rank, texts in enumerate(self.texts):
+            text = texts[row]
+            position = text.find(keyword)
+            if position < 0:
+                continue
+            end = position + len(keyword)
+            whole_word = (position == 0 or not text[position - 1].isalnum()) and \
+                (end == len(text) or not text[end].isalnum())
+            return (field_rank, not whole_word, position, row)
+        return None
+    
+    def match(self, keyword: str) -> List[int]:
+        """
+        All rows containing a normalized keyword, best match first
+        """
+        if not keyword:
+            return list(range(len(self.records)))
+        
+        rows = self.candidates(keyword)
+        if rows is None:
+            # Keywords shorter than one n-gram fall back to a scan of the folded text
+            rows = range(len(self.records))
+        keys = [key for key in (self.rank_key(keyword, int(row)) for row in rows) if key is not None]
+        keys.sort()
+        return [key[-1] for key in keys]
+    
+    def search(self, keyword: str, limit: Optional[int] = None, offset: int = 0) -> Tuple[int, List[Any]]:
+        """
+        Get (total matches, one page of matching records) ranked best first
+        """
+        keyword = self.normalize(keyword).strip()
+        matches = self.match_cache.get(keyword)
+        if matches is None:
+            matches = self.match(keyword)
+            self.match_cache.put(keyword, matches)
+        
+        offset = max(0, offset)
+        end = len(matches) if limit is None else offset + max(0, limit)
+        return len(matches), [self.records[row] for row in matches[offset:end]]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get index size statistics
+        """
+        return {"documents": len(self), "ngrams": len(self.postings), "match_cache": self.match_cache.get_stats()}
@@ -0,0 +1,359 @@
+"""
+Metrics Service
+Thread-safe counters and histograms with labels, rendered in the Prometheus
+text exposition format for the /metrics endpoint. Pre-forked workers share
+their metrics through snapshot files, so any worker can render the totals.
+"""
+
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import bisect
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Directory where the processes of one server publish their metric snapshots (set by the pre-fork master)
+METRICS_DIR_ENV = "FAQ_METRICS_DIR"
+
+# Latency buckets in seconds, from sub-millisecond lookups to multi-second encodes
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    """
+    Escape a label value for the text format
+    """
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    """
+    Render {name="value",...} for a sample, or "" without labels
+    """
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    """
+    Render a sample value: integers without a decimal point, infinities as +Inf
+    """
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Metric:
+    """
+    A metric family: one value (or histogram) per combination of label values
+    """
+    
+    kind = "untyped"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+    
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        """
+        Label values in declaration order
+        """
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+    
+    def clear(self):
+        """
+        Drop all recorded values
+        """
+        with self._lock:
+            self._values.clear()
+    
+    def state(self) -> List[list]:
+        """
+        JSON-serializable [label values, value] pairs
+        """
+        raise NotImplementedError
+    
+    def merge(self, state: List[list]):
+        """
+        Add the values of a state taken from the same metric in another process
+        """
+        raise NotImplementedError
+    
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+    
+    def render(self) -> str:
+        """
+        HELP/TYPE header and all samples of the family
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(Metric):
+    """
+    Monotonically increasing count
+    """
+    
+    kind = "counter"
+    
+    def inc(self, amount: float = 1.0, **labels):
+        """
+        Add to the counter for these label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+    
+    def get(self, **labels) -> float:
+        """
+        Current value for these label values
+        """
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+    
+    def state(self) -> List[list]:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+    
+    def merge(self, state: List[list]):
+        with self._lock:
+            for key, value in state:
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0.0) + value
+    
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+class Histogram(Metric):
+    """
+    Distribution of observations in cumulative buckets, with sum and count
+    """
+    
+    kind = "histogram"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, value: float, **labels):
+        """
+        Record one observation for these label values
+        """
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts plus the +Inf overflow, sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][position] += 1
+            state[1] += value
+    
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the duration of a with-block
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+    
+    def get_count(self, **labels) -> int:
+        """
+        Number of observations for these label values
+        """
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return sum(state[0]) if state else 0
+    
+    def state(self) -> List[list]:
+        with self._lock:
+            return [[list(key), [list(counts), total]] for key, (counts, total) in self._values.items()]
+    
+    def merge(self, state: List[list]):
+        with self._lock:
+            for key, (counts, total) in state:
+                if len(counts) != len(self.buckets) + 1:
+                    raise ValueError(f"{self.name} snapshot has {len(counts) - 1} buckets, expected {len(self.buckets)}")
+                current = self._values.setdefault(tuple(key), [[0] * (len(self.buckets) + 1), 0.0])
+                current[0] = [a + b for a, b in zip(current[0], counts)]
+                current[1] += total
+    
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Named collection of metrics rendered together
+    """
+    
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+    
+    def register(self, metric: Metric) -> Metric:
+        """
+        Add a metric, or return the one already registered under its name
+        """
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} is already registered with a different type or labels")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+    
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+    
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+    
+    def metrics(self) -> List[Metric]:
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+    
+    def clear(self):
+        """
+        Drop the values of every metric, e.g. those a forked worker inherited from its master
+        """
+        for metric in self.metrics():
+            metric.clear()
+    
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format
+        """
+        return "\n".join(metric.render() for metric in self.metrics()) + "\n"
+    
+    def snapshot(self) -> Dict[str, List[list]]:
+        """
+        State of every metric, by name
+        """
+        return {metric.name: metric.state() for metric in self.metrics()}
+    
+    def write_snapshot(self, directory: str, pid: Optional[int] = None):
+        """
+        Publish this process's metrics as metrics_<pid>.json; replaced atomically, so
+        readers never see a partial file
+        """
+        fd, tmp_path = tempfile.mkstemp(prefix=".metrics_", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, os.path.join(directory, f"metrics_{pid or os.getpid()}.json"))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def render_all(self, directory: str) -> str:
+        """
+        Totals over every process that published to directory, this one included. Files of
+        exited workers are kept, so counters never go backwards when a worker is replaced.
+        """
+        # Publish first, so no later scrape through another worker reads an older value of ours
+        self.write_snapshot(directory)
+        
+        totals = MetricsRegistry()
+        for metric in self.metrics():
+            if isinstance(metric, Histogram):
+                totals.histogram(metric.name, metric.documentation, metric.labelnames, metric.buckets)
+            else:
+                totals.register(type(metric)(metric.name, metric.documentation, metric.labelnames))
+        
+        for path in sorted(glob.glob(os.path.join(directory, "metrics_*.json"))):
+            try:
+                with open(path) as f:
+                    snapshot: Dict[str, Any] = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for metric in totals.metrics():
+                if metric.name in snapshot:
+                    metric.merge(snapshot[metric.name])
+        return totals.render()
+    
+    def start_publishing(self, directory: str, interval: float = 1.0) -> threading.Thread:
+        """
+        Publish this process's snapshot every interval seconds from a daemon thread
+        """
+        def publish():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write_snapshot(directory)
+                except OSError as e:
+                    print(f"Could not publish metrics to {directory}: {e}")
+        
+        thread = threading.Thread(target=publish, name="metrics-publisher", daemon=True)
+        thread.start()
+        return thread
+
+# Content type of the text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REGISTRY = MetricsRegistry()
+
+# Request path metrics shared by the services
+FAQ_STAGE_SECONDS = REGISTRY.histogram(
+    "faq_stage_seconds",
+    "Time spent in each FAQ answering stage (normalize, cache_lookup, lexical, encode, search, fusion, store_lookup, serialize)",
+    ("stage",)
+)
+FAQ_RETRIEVAL_TOTAL = REGISTRY.counter(
+    "faq_retrieval_total",
+    "FAQ questions by the path that answered them (exact_match, lexical_fast_path, answer_cache, dense)",
+    ("path",)
+)
+FAQ_SINGLE_FLIGHT_TOTAL = REGISTRY.counter(
+    "faq_single_flight_total",
+    "FAQ questions computed (executed) or served from an identical in-flight question (collapsed)",
+    ("role",)
+)
+FAQ_CACHE_TOTAL = REGISTRY.counter(
+    "faq_cache_requests_total", "FAQ cache lookups by cache and result", ("cache", "result")
+)
+FAQ_LOW_CONFIDENCE_TOTAL = REGISTRY.counter(
+    "faq_low_confidence_total", "FAQ answers below the confidence threshold or without any match"
+)
+BOOKING_CHANGE_TOTAL = REGISTRY.counter(
+    "booking_change_total", "Booking time change requests by outcome", ("outcome",)
+)
+ADMISSION_REJECTED_TOTAL = REGISTRY.counter(
+    "admission_rejected_total", "Requests shed before doing any work, by route group and reason", ("group", "reason")
+)
+BOOKING_CHANGE_CONFLICTS_TOTAL = REGISTRY.counter(
+    "booking_change_conflicts_total", "Booking changes retried because the booking changed concurrently"
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
@@ -0,0 +1,292 @@
+"""
+Profiler Service
+On-demand stack sampling for a live worker process. A sampler thread reads the
+stacks of the other threads every few milliseconds and aggregates them in the
+collapsed-stack format used by flamegraph.pl and speedscope. Nothing runs
+unless a profile or a request trace has been started.
+"""
+
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, Optional
+import functools
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+# Pool threads are named like "faq-worker_3"; samples are grouped per pool
+_THREAD_SUFFIX = re.compile(r"[-_]\d+$")
+
+class ProfilerBusyError(Exception):
+    """
+    Raised when a profile is requested while another one is running in this process
+    """
+
+def frame_label(frame) -> str:
+    """
+    One collapsed-stack frame: file name and function
+    """
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+def collapse_stack(frame, thread_name: str = "", max_depth: int = 128) -> str:
+    """
+    Render a stack root-first as "thread;file:function;..." for a collapsed-stack file
+    """
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    if thread_name:
+        labels.insert(0, _THREAD_SUFFIX.sub("", thread_name))
+    # ";" separates frames and the last space separates the count
+    return ";".join(labels).replace(" ", "_")
+
+class StackSampler:
+    """
+    Background thread sampling the stacks of all threads, or only of the given ones
+    """
+    
+    def __init__(self, interval: float = 0.005, thread_ids: Optional[Iterable[int]] = None):
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.duration = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def add_thread(self, thread_id: int):
+        with self._lock:
+            if self.thread_ids is not None:
+                self.thread_ids.add(thread_id)
+    
+    def remove_thread(self, thread_id: int):
+        with self._lock:
+            if self.thread_ids is not None:
+                self.thread_ids.discard(thread_id)
+    
+    def sample(self):
+        """
+        Take one sample of every selected thread
+        """
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        with self._lock:
+            selected = None if self.thread_ids is None else set(self.thread_ids)
+        
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or (selected is not None and thread_id not in selected):
+                continue
+            stacks.append(collapse_stack(frame, names.get(thread_id, str(thread_id))))
+        
+        with self._lock:
+            self.stacks.update(stacks)
+            self.samples += 1
+    
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+    
+    def start(self) -> "StackSampler":
+        """
+        Start sampling in a daemon thread
+        """
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self) -> "StackSampler":
+        """
+        Stop sampling and wait for the sampler thread
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.started_at is not None:
+            self.duration = time.perf_counter() - self.started_at
+        return self
+    
+    def collapsed(self) -> str:
+        """
+        Aggregated samples as "stack count" lines, most frequent first
+        """
+        with self._lock:
+            stacks = self.stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+_profile_lock = threading.Lock()
+
+def profile(seconds: float, interval: float = 0.005) -> StackSampler:
+    """
+    Sample every thread of this process for a number of seconds; one profile runs at a time
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusyError("Another profile is already running in this worker")
+    try:
+        sampler = StackSampler(interval).start()
+        time.sleep(seconds)
+        return sampler.stop()
+    finally:
+        _profile_lock.release()
+
+class RequestTrace:
+    """
+    Sampler restricted to the threads currently working on one request
+    """
+    
+    def __init__(self, interval: float = 0.001):
+        self.trace_id = uuid.uuid4().hex
+        self.sampler = StackSampler(interval, thread_ids=())
+    
+    def start(self) -> "RequestTrace":
+        self.sampler.add_thread(threading.get_ident())
+        self.sampler.start()
+        return self
+    
+    def stop(self) -> "RequestTrace":
+        self.sampler.stop()
+        return self
+    
+    def wrap(self, fn: Callable) -> Callable:
+        """
+        Include the thread that runs fn (e.g. an executor worker) while it runs; work it
+        hands over again (e.g. to the micro-batcher) finds the trace with current_trace()
+        """
+        @functools.wraps(fn)
+        def traced_fn(*args, **kwargs):
+            thread_id = threading.get_ident()
+            self.sampler.add_thread(thread_id)
+            token = _current_trace.set(self)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _current_trace.reset(token)
+                self.sampler.remove_thread(thread_id)
+        return traced_fn
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+def current_trace() -> Optional[RequestTrace]:
+    """
+    The trace of the request being handled by this thread, if it is traced
+    """
+    return _current_trace.get()
+
+def traced(fn: Callable) -> Callable:
+    """
+    Follow fn into another thread when the current request is traced; fn itself otherwise
+    """
+    trace = _current_trace.get()
+    return fn if trace is None else trace.wrap(fn)
+
+@contextmanager
+def following(traces: Iterable[Optional[RequestTrace]]) -> Iterator[None]:
+    """
+    Include the current thread in every given trace while it does shared work, such as
+    a micro-batch holding questions of several requests
+    """
+    traces = [trace for trace in dict.fromkeys(traces) if trace is not None]
+    thread_id = threading.get_ident()
+    for trace in traces:
+        trace.sampler.add_thread(thread_id)
+    try:
+        yield
+    finally:
+        for trace in traces:
+            trace.sampler.remove_thread(thread_id)
+
+class TraceStore:
+    """
+    The most recent request traces, kept for retrieval by id
+    """
+    
+    def __init__(self, max_traces: int = 32):
+        self.max_traces = max_traces
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def start(self, interval: float = 0.001) -> RequestTrace:
+        """
+        Start tracing the current request (and any work it hands over through traced())
+        """
+        trace = RequestTrace(interval).start()
+        _current_trace.set(trace)
+        return trace
+    
+    def finish(self, trace: RequestTrace):
+        """
+        Stop a trace and keep its result, dropping the oldest one beyond max_traces
+        """
+        trace.stop()
+        if _current_trace.get() is trace:
+            _current_trace.set(None)
+        with self._lock:
+            self._traces[trace.trace_id] = trace
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+    
+    def get(self, trace_id: str) -> Optional[RequestTrace]:
+        with self._lock:
+            return self._traces.get(trace_id)
+    
+    def list(self) -> Dict[str, Dict[str, float]]:
+        """
+        Summary of the kept traces, oldest first
+        """
+        with self._lock:
+            traces = list(self._traces.values())
+        return {
+            trace.trace_id: {"samples": trace.sampler.samples, "duration": trace.sampler.duration}
+            for trace in traces
+        }
+
+class TraceMiddleware:
+    """
+    ASGI middleware tracing a request that carries X-Trace-Request and an admin token accepted
+    by authorize; the trace id is returned in X-Trace-Id. The header is ignored for other
+    callers, and untraced requests go straight to the app.
+    """
+    
+    def __init__(self, app, store: TraceStore, authorize: Callable[[Optional[str]], bool]):
+        self.app = app
+        self.store = store
+        self.authorize = authorize
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        requested = False
+        token = None
+        for name, value in scope["headers"]:
+            if name == b"x-trace-request":
+                requested = True
+            elif name == b"x-admin-token":
+                token = value.decode("latin-1")
+        if not requested or not self.authorize(token):
+            return await self.app(scope, receive, send)
+        
+        trace = self.store.start()
+        
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-trace-id", trace.trace_id.encode())]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            self.store.finish(trace)
+
@@ -1,155 +1,1142 @@
-import pandas as pd
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import faiss
-import pickle
+import hashlib
+import argparse
+import json
 import os
-from typing import List, Tuple
+import shutil
+import tempfile
+from collections import Counter
+from typing import Any, List, NamedTuple, Optional, Tuple
+import threading
 import time
+from app.services.cache_service import LRUCache, SemanticAnswerCache
+from app.services.text_processing import normalize_query
+from app.services.lexical_service import KeywordIndex, LexicalIndex
+from app.services.faq_store import FAQStore
+from app.services.lazy_import import lazy_import
+from app.services.encoder_service import ENCODER_BACKENDS, create_encoder, encode_corpus
+from app.services.metrics_service import (
+    FAQ_CACHE_TOTAL, FAQ_LOW_CONFIDENCE_TOTAL, FAQ_RETRIEVAL_TOTAL, FAQ_STAGE_SECONDS
+)
+from app.services.index_service import (
+    build_index, apply_search_params, get_index_type, resolve_index_params, evaluate_index, compare_index_configs,
+    supports_removal
+)
+import unicodedata
+
+# Default paths resolve against the project root, not the working directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_CSV_PATH = os.path.join(PROJECT_ROOT, "faq_data.csv")
+DEFAULT_ARTIFACT_DIR = os.path.join(PROJECT_ROOT, "data", "embeddings")
+DEFAULT_ONNX_DIR = os.path.join(PROJECT_ROOT, "data", "onnx")
+
+# File names inside an artifact directory; the manifest records the ones actually used
+EMBEDDINGS_FILE = "faq_embeddings.npy"
+INDEX_FILE = "faq_index.faiss"
+ROW_IDS_FILE = "faq_row_ids.npy"
+MANIFEST_FILE = "faq_manifest.json"
+SOURCE_FILE = "faq_data.csv"
+
+# Heavy dependencies are imported on first use, so importing this module stays cheap
+pd = lazy_import("pandas")
+faiss = lazy_import("faiss")
+SentenceTransformer = lazy_import("sentence_transformers", "SentenceTransformer")
+
+# Bump when the on-disk artifact layout changes
+ARTIFACT_FORMAT_VERSION = 2
+
+def file_sha256(path: str) -> str:
+    """
+    Hash a file's contents
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def question_row_ids(questions: List[str]) -> np.ndarray:
+    """
+    Stable per-row IDs: the first 63 bits of the SHA-256 of each (NFC) question.
+    Used both as FAISS IDs and to detect added/changed rows.
+    """
+    ids = np.empty(len(questions), dtype='int64')
+    for i, question in enumerate(questions):
+        digest = hashlib.sha256(unicodedata.normalize("NFC", str(question)).encode('utf-8')).digest()
+        ids[i] = int.from_bytes(digest[:8], 'big') >> 1
+    return ids
+
+def normalize_rows(vectors) -> np.ndarray:
+    """
+    L2-normalize embedding rows as float32
+    """
+    vectors_f32 = np.asarray(vectors, dtype='float32')
+    # Manual L2 normalization to avoid FAISS issues
+    norms = np.linalg.norm(vectors_f32, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors_f32 / norms
+
+def build_id_to_row(row_ids: np.ndarray) -> dict:
+    """
+    Map FAISS IDs back to faq_data rows (first row wins for duplicate questions)
+    """
+    id_to_row = {}
+    for row, row_id in enumerate(row_ids.tolist()):
+        id_to_row.setdefault(row_id, row)
+    return id_to_row
+
+def unique_rows(row_ids: np.ndarray) -> np.ndarray:
+    """
+    Get the first row of each distinct question (duplicate questions share one index entry)
+    """
+    _, first_rows = np.unique(row_ids, return_index=True)
+    return np.sort(first_rows)
+
+class FAQSnapshot(NamedTuple):
+    """
+    Immutable FAQ data, embeddings and index that are served together.
+    Requests read one snapshot; reloads publish a new one atomically.
+    """
+    faq_data: Any = None
+    embeddings: Any = None
+    index: Any = None
+    row_ids: Any = None
+    id_to_row: Optional[dict] = None
+    source_hash: Optional[str] = None
+    lexical_index: Any = None
+    keyword_index: Any = None
+    exact_match: Optional[dict] = None
+    version: int = 0
+
+class FastPathMiss(NamedTuple):
+    """
+    A query the fast path could not answer, with the lexical hits it already computed,
+    so dense retrieval of the same snapshot does not repeat them
+    """
+    query: str
+    version: int
+    hits: list
 
 class RAGService:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 embedding_cache_size: int = 1024, embedding_cache_ttl: Optional[float] = 3600.0,
+                 answer_cache_size: int = 512, answer_cache_threshold: float = 0.95,
+                 index_type: str = "flat", index_params: Optional[dict] = None,
+                 embeddings_dtype: str = "float32", hybrid_mode: str = "rrf", dense_weight: float = 0.7,
+                 rrf_k: int = 60, lexical_candidates: int = 10, fast_path_coverage: float = 0.9,
+                 fast_path_margin: float = 2.0, fast_path_min_terms: int = 3,
+                 fast_path_max_confidence: float = 0.6, encoder_backend: Optional[str] = None,
+                 onnx_dir: Optional[str] = None, artifact_dir: Optional[str] = None,
+                 read_only: Optional[bool] = None, build_batch_size: int = 64, build_workers: int = 1):
         """
         Initialize RAG service with sentence transformer model
         """
-        self.model = SentenceTransformer(model_name)
-        self.index = None
-        self.faq_data = None
-        self.embeddings = None
-        self.embeddings_path = "data/embeddings/faq_embeddings.pkl"
-        self.index_path = "data/embeddings/faq_index.faiss"
+        self.model_name = model_name
+        # "sentence-transformers" (PyTorch), "onnx" or "onnx-int8" (ONNX Runtime)
+        self.encoder_backend = encoder_backend or os.getenv("FAQ_ENCODER_BACKEND", "sentence-transformers")
+        if self.encoder_backend not in ENCODER_BACKENDS:
+            raise ValueError(f"Unknown encoder backend '{self.encoder_backend}', expected one of {ENCODER_BACKENDS}")
+        self.onnx_dir = onnx_dir or os.getenv("FAQ_ONNX_DIR", DEFAULT_ONNX_DIR)
+        # The encoder (and torch or ONNX Runtime) is loaded on first encode or by initialize()
+        self._model = None
+        self._model_lock = threading.Lock()
+        # Normalized query -> normalized embedding, so repeated questions skip the transformer
+        self.embedding_cache = LRUCache(max_size=embedding_cache_size, ttl_seconds=embedding_cache_ttl)
+        # Near-duplicate query embeddings -> (answer, confidence, source_question)
+        self.answer_cache = SemanticAnswerCache(max_size=answer_cache_size, similarity_threshold=answer_cache_threshold)
+        # ANN index type ("flat", "hnsw", "ivf", "ivfpq") and its parameters (M, efSearch, nlist, nprobe, pq_m, ...)
+        self.index_type = index_type
+        self.index_params = resolve_index_params(index_type, index_params)
+        # Current FAQ data/embeddings/index, swapped as one unit
+        self._snapshot = FAQSnapshot()
+        self._snapshot_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self.last_reload = None
+        self._watcher = None
+        self._watch_stop = None
+        # Normalized embeddings stored as float32 or float16 and memory-mapped on load
+        if embeddings_dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported embeddings dtype '{embeddings_dtype}'")
+        self.embeddings_dtype = embeddings_dtype
+        self.csv_path = os.getenv("FAQ_CSV_PATH", DEFAULT_CSV_PATH)
+        # Hybrid retrieval: "rrf" or "weighted" fusion of BM25 and dense results, or "off"
+        if hybrid_mode not in ("rrf", "weighted", "off"):
+            raise ValueError(f"Unknown hybrid mode '{hybrid_mode}'")
+        self.hybrid_mode = hybrid_mode
+        self.dense_weight = dense_weight
+        self.rrf_k = rrf_k
+        self.lexical_candidates = lexical_candidates
+        # A lexical hit covering this share of the query, matching at least this many of its
+        # syllables and beating the runner-up by this factor is answered without the transformer
+        self.fast_path_coverage = fast_path_coverage
+        self.fast_path_margin = fast_path_margin
+        self.fast_path_min_terms = fast_path_min_terms
+        # Such answers have no cosine similarity, so their confidence (a coverage, not a
+        # similarity) is capped well below that of a verified match
+        self.fast_path_max_confidence = fast_path_max_confidence
+        self.retrieval_counts = Counter()
+        self._counts_lock = threading.Lock()
+        # A prebuilt artifact directory (see the build command) is served read-only:
+        # it is never rebuilt, patched or rewritten by the server
+        artifact_dir = artifact_dir or os.getenv("FAQ_ARTIFACT_DIR")
+        self.read_only = bool(artifact_dir) if read_only is None else read_only
+        self.set_artifact_dir(artifact_dir or DEFAULT_ARTIFACT_DIR)
+        # Length-sorted encoding batches and parallel encoders for full builds
+        self.build_batch_size = build_batch_size
+        self.build_workers = build_workers
+    
+    @property
+    def model(self):
+        """
+        The encoder of the configured backend, loaded on first use
+        """
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    if self.encoder_backend == "sentence-transformers":
+                        self._model = SentenceTransformer(self.model_name)
+                    else:
+                        self._model = create_encoder(self.encoder_backend, self.model_name, self.onnx_dir)
+        return self._model
+    
+    @model.setter
+    def model(self, value):
+        self._model = value
+    
+    @property
+    def model_loaded(self) -> bool:
+        return self._model is not None
+    
+    @property
+    def snapshot(self) -> FAQSnapshot:
+        """
+        The FAQ snapshot currently being served
+        """
+        return self._snapshot
+    
+    def publish(self, snapshot: Optional[FAQSnapshot] = None, **fields):
+        """
+        Atomically swap in a new snapshot (or the current one with some fields replaced)
+        """
+        with self._snapshot_lock:
+            current = self._snapshot
+            if snapshot is None:
+                snapshot = current._replace(**fields)
+            # Request-time code reads the compact store, never a DataFrame
+            if snapshot.faq_data is not None and not isinstance(snapshot.faq_data, FAQStore):
+                snapshot = snapshot._replace(faq_data=FAQStore.from_dataframe(snapshot.faq_data))
+            # Keep the search indexes in step with the FAQ rows they point at
+            if snapshot.faq_data is not current.faq_data and snapshot.lexical_index is current.lexical_index:
+                snapshot = snapshot._replace(**self.build_search_indexes(snapshot.faq_data))
+            self._snapshot = snapshot._replace(version=current.version + 1)
+        # Cached answers may point at rows of the old snapshot
+        self.answer_cache.clear()
+    
+    # Snapshot fields, readable and (for initialization) replaceable one at a time
+    faq_data = property(lambda self: self._snapshot.faq_data,
+                        lambda self, value: self.publish(faq_data=value))
+    embeddings = property(lambda self: self._snapshot.embeddings,
+                          lambda self, value: self.publish(embeddings=value))
+    index = property(lambda self: self._snapshot.index,
+                     lambda self, value: self.publish(index=value))
+    row_ids = property(lambda self: self._snapshot.row_ids,
+                       lambda self, value: self.publish(row_ids=value))
+    id_to_row = property(lambda self: self._snapshot.id_to_row,
+                         lambda self, value: self.publish(id_to_row=value))
+    source_hash = property(lambda self: self._snapshot.source_hash,
+                           lambda self, value: self.publish(source_hash=value))
+    
+    def build_search_indexes(self, faq_data: Optional[FAQStore]) -> dict:
+        """
+        Build the exact-match table, BM25 index and keyword search index over FAQ questions and answers
+        """
+        if faq_data is None:
+            return {"lexical_index": None, "keyword_index": None, "exact_match": None}
+        
+        # Normalized question -> row, first row wins for duplicates
+        exact_match = {}
+        for row, question in enumerate(faq_data.questions):
+            exact_match.setdefault(normalize_query(question), row)
         
-    def load_faq_data(self, csv_path: str = "faq_data.csv"):
+        return {
+            "lexical_index": LexicalIndex(faq_data.questions, faq_data.answers),
+            "keyword_index": KeywordIndex(faq_data.records),
+            "exact_match": exact_match
+        }
+    
+    def set_artifact_dir(self, artifact_dir: str):
+        """
+        Point the embeddings, index, row ID and manifest files at a directory
+        """
+        self.embeddings_path = os.path.join(artifact_dir, EMBEDDINGS_FILE)
+        self.index_path = os.path.join(artifact_dir, INDEX_FILE)
+    
+    @property
+    def artifact_dir(self) -> str:
+        return os.path.dirname(self.embeddings_path)
+    
+    @property
+    def manifest_path(self) -> str:
+        """
+        JSON manifest stored next to the embeddings file
+        """
+        return os.path.join(self.artifact_dir, MANIFEST_FILE)
+    
+    @property
+    def row_ids_path(self) -> str:
+        """
+        Per-row question hashes stored next to the embeddings file
+        """
+        return os.path.join(self.artifact_dir, ROW_IDS_FILE)
+    
+    def read_faq_data(self, csv_path: str) -> Tuple[FAQStore, str]:
+        """
+        Read FAQ data and its content hash without publishing it
+        """
+        return FAQStore.from_dataframe(pd.read_csv(csv_path)), file_sha256(csv_path)
+    
+    def load_faq_data(self, csv_path: Optional[str] = None):
         """
         Load FAQ data from CSV file
         """
+        csv_path = csv_path or self.csv_path
         try:
-            self.faq_data = pd.read_csv(csv_path)
-            print(f"Loaded {len(self.faq_data)} FAQ entries")
+            faq_data, source_hash = self.read_faq_data(csv_path)
+            self.publish(faq_data=faq_data, source_hash=source_hash)
+            self.csv_path = csv_path
+            print(f"Loaded {len(faq_data)} FAQ entries")
             return True
         except Exception as e:
             print(f"Error loading FAQ data: {e}")
             return False
     
+    def build_artifacts(self, faq_data: FAQStore) -> dict:
+        """
+        Encode all FAQ questions and build the configured index, keyed by question hash
+        """
+        questions = list(faq_data.questions)
+        
+        # Create normalized embeddings for cosine similarity
+        embeddings_f32 = normalize_rows(
+            encode_corpus(self.model, questions, self.build_batch_size, self.build_workers)
+        )
+        
+        # Create (and train, for IVF types) the configured FAISS index
+        row_ids = question_row_ids(questions)
+        first_rows = unique_rows(row_ids)
+        index = build_index(embeddings_f32[first_rows], self.index_type, self.index_params, ids=row_ids[first_rows])
+        
+        return {
+            "embeddings": embeddings_f32.astype(self.embeddings_dtype),
+            "index": index,
+            "row_ids": row_ids,
+            "id_to_row": build_id_to_row(row_ids)
+        }
+    
     def create_embeddings(self):
         """
         Create embeddings for FAQ questions and save to disk
         """
-        if self.faq_data is None:
+        snapshot = self.snapshot
+        if snapshot.faq_data is None:
             print("No FAQ data loaded")
             return False
-            
+        
         print("Creating embeddings...")
-        questions = self.faq_data['question'].tolist()
+        fields = self.build_artifacts(snapshot.faq_data)
+        self.publish(snapshot._replace(**fields))
         
-        # Create embeddings
-        self.embeddings = self.model.encode(questions, show_progress_bar=True)
+        # Save embeddings, index and manifest
+        self.save_artifacts()
         
-        # Create FAISS index
-        dimension = self.embeddings.shape[1]
-        self.index = faiss.IndexFlatIP(dimension)  # Inner product for cosine similarity
+        print(f"Created and saved embeddings for {len(snapshot.faq_data)} questions")
+        return True
+    
+    def update_artifacts(self, faq_data: FAQStore, embeddings: np.ndarray, row_ids: np.ndarray, index,
+                         in_place: bool = True) -> Tuple[dict, dict]:
+        """
+        Re-encode only added or changed questions and patch the index by ID.
+        With in_place=False the given index is left untouched (it may still be serving requests).
+        """
+        questions = faq_data.questions
+        new_row_ids = question_row_ids(questions)
+        
+        # Reuse stored vectors for questions whose hash is unchanged
+        old_rows = build_id_to_row(row_ids)
+        vectors = np.empty((len(questions), embeddings.shape[1]), dtype='float32')
+        missing = []
+        for row, row_id in enumerate(new_row_ids.tolist()):
+            old_row = old_rows.get(row_id)
+            if old_row is None:
+                missing.append(row)
+            else:
+                vectors[row] = embeddings[old_row]
         
-        # Normalize embeddings for cosine similarity
-        embeddings_f32 = self.embeddings.astype('float32')
-        # Manual L2 normalization to avoid FAISS issues
-        norms = np.linalg.norm(embeddings_f32, axis=1, keepdims=True)
-        embeddings_f32 = embeddings_f32 / norms
-        self.index.add(embeddings_f32)
+        if missing:
+            vectors[missing] = normalize_rows(self.model.encode([questions[row] for row in missing]))
         
-        # Save embeddings and index
-        os.makedirs("data/embeddings", exist_ok=True)
-        with open(self.embeddings_path, 'wb') as f:
-            pickle.dump(self.embeddings, f)
-        faiss.write_index(self.index, self.index_path)
+        old_ids = set(old_rows)
+        new_unique_rows = unique_rows(new_row_ids)
+        removed_ids = np.array(sorted(old_ids - set(new_row_ids.tolist())), dtype='int64')
+        added_rows = [row for row in new_unique_rows if int(new_row_ids[row]) not in old_ids]
         
-        print(f"Created and saved embeddings for {len(questions)} questions")
+        if supports_removal(index):
+            # Patch the ID-mapped index (a private copy if the original is live)
+            if not in_place:
+                index = faiss.clone_index(index)
+            if len(removed_ids):
+                index.remove_ids(removed_ids)
+            if added_rows:
+                index.add_with_ids(vectors[added_rows], new_row_ids[added_rows])
+        else:
+            # HNSW cannot delete: rebuild from vectors (no re-encoding needed)
+            index = build_index(vectors[new_unique_rows], self.index_type, self.index_params,
+                                ids=new_row_ids[new_unique_rows])
+        apply_search_params(index, self.index_params)
+        
+        fields = {
+            "embeddings": vectors.astype(self.embeddings_dtype),
+            "index": index,
+            "row_ids": new_row_ids,
+            "id_to_row": build_id_to_row(new_row_ids)
+        }
+        stats = {"rows": len(questions), "reembedded": len(missing),
+                 "added": len(added_rows), "removed": int(len(removed_ids))}
+        return fields, stats
+    
+    def refresh_embeddings(self, embeddings: np.ndarray, row_ids: np.ndarray, index) -> bool:
+        """
+        Bring stored embeddings up to date with the current FAQ data:
+        re-encode only added or changed questions and patch the index in place
+        """
+        snapshot = self.snapshot
+        fields, stats = self.update_artifacts(snapshot.faq_data, embeddings, row_ids, index)
+        self.publish(snapshot._replace(**fields))
+        self.save_artifacts()
+        
+        print(f"Re-embedded {stats['reembedded']} of {stats['rows']} questions "
+              f"({stats['added']} added, {stats['removed']} removed from index)")
         return True
     
-    def load_embeddings(self):
+    def reload(self, csv_path: Optional[str] = None) -> dict:
         """
-        Load pre-computed embeddings and FAISS index
+        Rebuild or patch the FAQ index from the CSV off to the side, then swap it in
+        atomically. Requests already running finish on the old snapshot.
         """
+        if not self._reload_lock.acquire(blocking=False):
+            return {"status": "busy"}
+        
+        start_time = time.time()
         try:
-            if os.path.exists(self.embeddings_path) and os.path.exists(self.index_path):
-                with open(self.embeddings_path, 'rb') as f:
-                    self.embeddings = pickle.load(f)
-                self.index = faiss.read_index(self.index_path)
-                print("Loaded pre-computed embeddings")
-                return True
+            csv_path = csv_path or self.csv_path
+            faq_data, source_hash = self.read_faq_data(csv_path)
+            current = self.snapshot
+            
+            if source_hash == current.source_hash and current.index is not None:
+                result = {"status": "unchanged", "version": current.version}
             else:
-                print("No pre-computed embeddings found")
+                if current.index is None or current.row_ids is None:
+                    fields = self.build_artifacts(faq_data)
+                    stats = {"rows": len(faq_data), "reembedded": len(faq_data)}
+                else:
+                    fields, stats = self.update_artifacts(
+                        faq_data, current.embeddings, current.row_ids, current.index, in_place=False
+                    )
+                
+                snapshot = current._replace(faq_data=faq_data, source_hash=source_hash, **fields)
+                self.save_artifacts(snapshot)
+                self.publish(snapshot)
+                self.csv_path = csv_path
+                result = {"status": "reloaded", "version": self.snapshot.version, **stats}
+        except Exception as e:
+            result = {"status": "error", "error": str(e)}
+        finally:
+            self._reload_lock.release()
+        
+        result["duration_s"] = time.time() - start_time
+        result["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.last_reload = result
+        print(f"FAQ reload: {result}")
+        return result
+    
+    def reload_in_background(self, csv_path: Optional[str] = None) -> dict:
+        """
+        Start a reload on a background thread
+        """
+        if self._reload_lock.locked():
+            return {"status": "busy"}
+        threading.Thread(target=self.reload, args=(csv_path,), name="faq-reload", daemon=True).start()
+        return {"status": "started"}
+    
+    def csv_signature(self) -> Optional[Tuple[int, int]]:
+        """
+        Cheap change marker for the FAQ CSV file
+        """
+        try:
+            stat = os.stat(self.csv_path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+    
+    def start_watching(self, interval: float = 5.0):
+        """
+        Poll the FAQ CSV and hot-reload it whenever it changes
+        """
+        if self._watcher is not None:
+            return
+        
+        self._watch_stop = threading.Event()
+        
+        def watch(stop: threading.Event):
+            last_signature = self.csv_signature()
+            while not stop.wait(interval):
+                signature = self.csv_signature()
+                if signature is not None and signature != last_signature:
+                    last_signature = signature
+                    self.reload()
+        
+        self._watcher = threading.Thread(target=watch, args=(self._watch_stop,), name="faq-watcher", daemon=True)
+        self._watcher.start()
+    
+    def stop_watching(self):
+        """
+        Stop the FAQ CSV watcher
+        """
+        if self._watcher is not None:
+            self._watch_stop.set()
+            self._watcher.join()
+            self._watcher = None
+    
+    def replace_file(self, path: str, write):
+        """
+        Write a file through a temporary path and rename it into place, so processes
+        that still memory-map the old file keep a valid copy
+        """
+        # A unique name per writer, so concurrent writers never share a temporary file
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                        dir=os.path.dirname(path) or ".")
+        os.close(fd)
+        try:
+            # mkstemp creates the file private to its owner; artifacts are read by other processes
+            os.chmod(tmp_path, 0o644)
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def save_artifacts(self, snapshot: Optional[FAQSnapshot] = None):
+        """
+        Write the normalized .npy embeddings, row IDs, FAISS index and JSON manifest
+        """
+        if self.read_only:
+            print(f"Artifact directory {self.artifact_dir} is read-only, not saving")
+            return
+        snapshot = snapshot or self.snapshot
+        os.makedirs(os.path.dirname(self.embeddings_path) or ".", exist_ok=True)
+        
+        def write_npy(array):
+            def write(path):
+                # Write through a file handle so np.save keeps the configured name
+                with open(path, 'wb') as f:
+                    np.save(f, np.ascontiguousarray(array), allow_pickle=False)
+            return write
+        
+        self.replace_file(self.embeddings_path, write_npy(snapshot.embeddings))
+        self.replace_file(self.row_ids_path, write_npy(snapshot.row_ids))
+        self.replace_file(self.index_path, lambda path: faiss.write_index(snapshot.index, path))
+        
+        manifest = {
+            "format_version": ARTIFACT_FORMAT_VERSION,
+            "model_name": self.model_name,
+            "encoder_backend": self.encoder_backend,
+            "dimension": int(snapshot.index.d),
+            "row_count": int(len(snapshot.row_ids)),
+            "embeddings_dtype": self.embeddings_dtype,
+            "index_type": self.index_type,
+            "index_params": self.index_params,
+            "source_sha256": snapshot.source_hash,
+            "row_id_scheme": "sha256(question)[:63 bits]",
+            "source_file": SOURCE_FILE if os.path.exists(os.path.join(self.artifact_dir, SOURCE_FILE)) else None,
+            "embeddings_file": os.path.basename(self.embeddings_path),
+            "row_ids_file": os.path.basename(self.row_ids_path),
+            "index_file": os.path.basename(self.index_path),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+        }
+        # Content checksums identify the exact bits every node should load
+        checksums = {
+            name: file_sha256(os.path.join(self.artifact_dir, name))
+            for name in (manifest["source_file"], manifest["embeddings_file"],
+                         manifest["row_ids_file"], manifest["index_file"])
+            if name
+        }
+        manifest["checksums"] = checksums
+        manifest["artifact_version"] = hashlib.sha256(
+            json.dumps(checksums, sort_keys=True).encode('utf-8')
+        ).hexdigest()[:16]
+        
+        def write_manifest(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+        
+        # Write the manifest last: it marks the artifact as complete
+        self.replace_file(self.manifest_path, write_manifest)
+    
+    def load_manifest(self) -> Optional[dict]:
+        """
+        Read the artifact manifest, if present
+        """
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def open_artifacts(self) -> Optional[dict]:
+        """
+        Memory-map the stored embeddings and read the row IDs, index and manifest,
+        or return None if they are missing or do not fit the configured model and index
+        """
+        manifest = self.load_manifest()
+        if manifest is None:
+            print("No pre-computed embeddings found")
+            return None
+        if manifest.get("format_version") != ARTIFACT_FORMAT_VERSION:
+            print("Embeddings manifest outdated")
+            return None
+        
+        # File names come from the manifest, relative to its directory, so the
+        # artifact can be moved or mounted anywhere
+        embeddings_path, row_ids_path, index_path = (
+            os.path.join(self.artifact_dir, manifest.get(key) or default)
+            for key, default in (("embeddings_file", EMBEDDINGS_FILE), ("row_ids_file", ROW_IDS_FILE),
+                                 ("index_file", INDEX_FILE))
+        )
+        if not (os.path.exists(embeddings_path) and os.path.exists(index_path) and os.path.exists(row_ids_path)):
+            print("No pre-computed embeddings found")
+            return None
+        if manifest.get("model_name") != self.model_name:
+            print(f"Embeddings were built with '{manifest.get('model_name')}', configured '{self.model_name}'")
+            return None
+        # Backends agree closely but not exactly; query and corpus vectors must come from the same one
+        if manifest.get("encoder_backend", "sentence-transformers") != self.encoder_backend:
+            print(f"Embeddings were built with the '{manifest.get('encoder_backend')}' encoder, "
+                  f"configured '{self.encoder_backend}'")
+            return None
+        
+        # Read-only mapping: pages are loaded lazily and shared between processes
+        embeddings = np.load(embeddings_path, mmap_mode='r', allow_pickle=False)
+        row_ids = np.load(row_ids_path, allow_pickle=False)
+        index = faiss.read_index(index_path)
+        if get_index_type(index) != self.index_type:
+            print(f"Stored index is '{get_index_type(index)}', configured '{self.index_type}'")
+            return None
+        if not (embeddings.shape[0] == len(row_ids) == manifest.get("row_count")
+                and embeddings.shape[1] == index.d == manifest.get("dimension")):
+            print("Embeddings, index and manifest do not match")
+            return None
+        
+        apply_search_params(index, self.index_params)
+        return {"manifest": manifest, "embeddings": embeddings, "row_ids": row_ids, "index": index}
+    
+    def load_embeddings(self):
+        """
+        Load pre-computed embeddings (memory-mapped) and FAISS index,
+        incrementally re-embedding rows that changed in the FAQ data
+        """
+        try:
+            artifacts = self.open_artifacts()
+            if artifacts is None:
                 return False
+            embeddings, row_ids, index = artifacts["embeddings"], artifacts["row_ids"], artifacts["index"]
+            
+            if self.faq_data is not None and (artifacts["manifest"].get("source_sha256") != self.source_hash
+                                              or len(self.faq_data) != len(row_ids)):
+                if self.read_only:
+                    print("FAQ data does not match the prebuilt artifact; rebuild it with the build command")
+                    return False
+                print("FAQ data changed since embeddings were built, updating changed rows")
+                return self.refresh_embeddings(embeddings, row_ids, index)
+            
+            self.publish(embeddings=embeddings, index=index, row_ids=row_ids, id_to_row=build_id_to_row(row_ids))
+            print("Loaded pre-computed embeddings")
+            return True
         except Exception as e:
             print(f"Error loading embeddings: {e}")
             return False
     
-    def search_similar_questions(self, query: str, top_k: int = 3) -> List[Tuple[int, float]]:
+    def reopen_artifacts(self) -> dict:
         """
-        Search for similar questions using vector similarity
+        Swap in the FAQ data and artifacts another process has published (the pre-fork
+        master after a reload), without encoding anything
         """
-        if self.index is None:
-            print("No index available")
+        start_time = time.time()
+        with self._reload_lock:
+            try:
+                faq_data, source_hash = self.read_faq_data(self.csv_path)
+                artifacts = self.open_artifacts()
+                if artifacts is None or artifacts["manifest"].get("source_sha256") != source_hash:
+                    result = {"status": "stale"}
+                elif source_hash == self.source_hash:
+                    result = {"status": "unchanged", "version": self.snapshot.version}
+                else:
+                    self.publish(self.snapshot._replace(
+                        faq_data=faq_data, source_hash=source_hash, embeddings=artifacts["embeddings"],
+                        index=artifacts["index"], row_ids=artifacts["row_ids"],
+                        id_to_row=build_id_to_row(artifacts["row_ids"])
+                    ))
+                    result = {"status": "reopened", "version": self.snapshot.version, "rows": len(faq_data)}
+            except Exception as e:
+                result = {"status": "error", "error": str(e)}
+        
+        result["duration_s"] = time.time() - start_time
+        result["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.last_reload = result
+        print(f"FAQ reopen: {result}")
+        return result
+    
+    def evaluate_index(self, configs: Optional[List[dict]] = None, k: int = 5,
+                       num_queries: Optional[int] = None) -> List[dict]:
+        """
+        Report recall@k against the exact flat index and query latency, for the
+        current index or for each {"index_type": ..., "params": {...}} config
+        """
+        snapshot = self.snapshot
+        if snapshot.embeddings is None:
+            print("No embeddings available")
             return []
         
-        # Encode query
-        query_embedding = self.model.encode([query])
-        query_embedding_f32 = query_embedding.astype('float32')
-        # Manual L2 normalization to avoid FAISS issues
-        query_norm = np.linalg.norm(query_embedding_f32, axis=1, keepdims=True)
-        query_embedding_f32 = query_embedding_f32 / query_norm
+        embeddings_f32 = normalize_rows(snapshot.embeddings)
         
-        # Search
-        scores, indices = self.index.search(query_embedding_f32, top_k)
+        if configs is None:
+            ids = None
+            if snapshot.id_to_row is not None:
+                # The live index holds one entry per distinct question, under its question hash
+                rows = unique_rows(snapshot.row_ids)
+                embeddings_f32 = embeddings_f32[rows]
+                ids = snapshot.row_ids[rows]
+            queries = embeddings_f32[:num_queries] if num_queries else embeddings_f32
+            report = evaluate_index(snapshot.index, embeddings_f32, queries, k, ids=ids)
+            report["params"] = self.index_params
+            return [report]
         
-        # Return results as list of (index, score) tuples
-        results = []
-        for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-            if idx != -1:  # Valid index
-                results.append((int(idx), float(score)))
+        queries = embeddings_f32[:num_queries] if num_queries else embeddings_f32
         
-        return results
+        return compare_index_configs(embeddings_f32, configs, queries, k)
     
-    def get_answer(self, query: str, top_k: int = 3) -> Tuple[str, float, str]:
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
         """
-        Get answer for a query using RAG approach
+        Encode queries with a single model call and L2-normalize them,
+        reusing cached embeddings for previously seen (normalized) queries
         """
-        start_time = time.time()
+        with FAQ_STAGE_SECONDS.time(stage="normalize"):
+            keys = [normalize_query(query) for query in queries]
+        
+        embeddings = {}
+        missing = []
+        with FAQ_STAGE_SECONDS.time(stage="cache_lookup"):
+            for key in keys:
+                if key in embeddings:
+                    continue
+                cached = self.embedding_cache.get(key)
+                if cached is not None:
+                    embeddings[key] = cached
+                else:
+                    embeddings[key] = None
+                    missing.append(key)
+        FAQ_CACHE_TOTAL.inc(len(embeddings) - len(missing), cache="embedding", result="hit")
+        FAQ_CACHE_TOTAL.inc(len(missing), cache="embedding", result="miss")
+        
+        if missing:
+            # Encode only cache misses, all in one model call
+            with FAQ_STAGE_SECONDS.time(stage="encode"):
+                query_embeddings_f32 = normalize_rows(self.model.encode(missing))
+            
+            for key, embedding in zip(missing, query_embeddings_f32):
+                # Own copy per row so cached entries do not pin the whole batch matrix
+                embedding = embedding.copy()
+                embedding.flags.writeable = False
+                embeddings[key] = embedding
+                self.embedding_cache.put(key, embedding)
+        
+        return np.stack([embeddings[key] for key in keys]).astype('float32', copy=False)
+    
+    def search_embeddings(self, query_embeddings: np.ndarray, top_k: int = 3,
+                          snapshot: Optional[FAQSnapshot] = None) -> List[List[Tuple[int, float]]]:
+        """
+        Search the FAQ index with a matrix of normalized query embeddings
+        """
+        snapshot = snapshot or self.snapshot
+        with FAQ_STAGE_SECONDS.time(stage="search"):
+            scores, indices = snapshot.index.search(query_embeddings, top_k)
+        
+        # Return results as one list of (faq_data row, score) tuples per query
+        batch_results = []
+        for row_scores, row_indices in zip(scores, indices):
+            results = []
+            for score, idx in zip(row_scores, row_indices):
+                if idx == -1:  # Invalid index
+                    continue
+                # Map question-hash IDs back to rows; plain indexes are positional
+                row = int(idx) if snapshot.id_to_row is None else snapshot.id_to_row.get(int(idx))
+                if row is not None:
+                    results.append((row, float(score)))
+            batch_results.append(results)
+        
+        return batch_results
+    
+    def search_similar_questions_batch(self, queries: List[str], top_k: int = 3) -> List[List[Tuple[int, float]]]:
+        """
+        Search similar questions for many queries with one encode and one index search
+        """
+        snapshot = self.snapshot
+        if snapshot.index is None:
+            print("No index available")
+            return [[] for _ in queries]
+        
+        if not queries:
+            return []
         
-        # Search for similar questions
-        similar_questions = self.search_similar_questions(query, top_k)
+        # Encode all queries at once and search the whole query matrix
+        return self.search_embeddings(self.encode_queries(queries), top_k, snapshot)
+    
+    def search_similar_questions(self, query: str, top_k: int = 3) -> List[Tuple[int, float]]:
+        """
+        Search for similar questions using vector similarity
+        """
+        if self.index is None:
+            print("No index available")
+            return []
         
+        return self.search_similar_questions_batch([query], top_k)[0]
+    
+    def build_answer(self, similar_questions: List[Tuple[int, float]],
+                     snapshot: Optional[FAQSnapshot] = None) -> Tuple[str, float, str]:
+        """
+        Turn ranked search results into (answer, confidence, source_question)
+        """
         if not similar_questions:
+            FAQ_LOW_CONFIDENCE_TOTAL.inc()
             return "Xin lỗi, tôi không tìm thấy câu trả lời phù hợp cho câu hỏi của bạn.", 0.0, ""
         
         # Get the best match
         best_idx, best_score = similar_questions[0]
-        best_question = self.faq_data.iloc[best_idx]['question']
-        best_answer = self.faq_data.iloc[best_idx]['answer']
+        with FAQ_STAGE_SECONDS.time(stage="store_lookup"):
+            record = (snapshot or self.snapshot).faq_data[best_idx]
+            best_question = record.question
+            best_answer = record.answer
         
         # Calculate confidence based on similarity score
         confidence = min(best_score * 100, 100.0)  # Convert to percentage
         
-        processing_time = time.time() - start_time
-        
         # If confidence is too low, provide a generic response
         if confidence < 30:
+            FAQ_LOW_CONFIDENCE_TOTAL.inc()
             return "Xin lỗi, tôi không hiểu rõ câu hỏi của bạn. Bạn có thể hỏi lại một cách cụ thể hơn không?", confidence, best_question
         
         return best_answer, confidence, best_question
     
+    def get_answer(self, query: str, top_k: int = 3) -> Tuple[str, float, str]:
+        """
+        Get answer for a query using RAG approach
+        """
+        return self.get_answers([query], top_k)[0]
+    
+    def match_fast_path(self, query: str, snapshot: FAQSnapshot) -> Tuple[Optional[str], Any, list]:
+        """
+        Answer a query without the transformer if it is an FAQ question verbatim or has a
+        decisive lexical hit. Returns (path, answer, lexical hits), path and answer being None
+        when dense retrieval is needed.
+        """
+        # Questions that are FAQ questions verbatim (e.g. picked from the FAQ list) need no retrieval
+        if snapshot.exact_match:
+            with FAQ_STAGE_SECONDS.time(stage="normalize"):
+                row = snapshot.exact_match.get(normalize_query(query))
+            if row is not None:
+                return "exact_match", self.build_answer([(row, 1.0)], snapshot), []
+        
+        # Lexical side next: a decisive BM25 hit skips the transformer entirely
+        lexical_index = snapshot.lexical_index if self.hybrid_mode != "off" else None
+        if lexical_index is None:
+            return None, None, []
+        with FAQ_STAGE_SECONDS.time(stage="lexical"):
+            hits = lexical_index.search(query, self.lexical_candidates)
+        if self.is_decisive(query, hits, lexical_index):
+            confidence = min(hits[0][2], self.fast_path_max_confidence)
+            return "lexical_fast_path", self.build_answer([(hits[0][0], confidence)], snapshot), hits
+        return None, None, hits
+    
+    def get_fast_answer(self, query: str) -> Tuple[Optional[Tuple[str, float, str]], Optional[FastPathMiss]]:
+        """
+        Answer a query from the exact-match table or a decisive lexical hit. Returns
+        (answer, None), or (None, miss) if it needs the encoder: pass the miss to
+        get_answers in place of the query.
+        """
+        snapshot = self.snapshot
+        if snapshot.index is None:
+            return None, FastPathMiss(query, snapshot.version, [])
+        path, answer, hits = self.match_fast_path(query, snapshot)
+        if path is None:
+            return None, FastPathMiss(query, snapshot.version, hits)
+        self.count("queries")
+        self.count(path)
+        return answer, None
+    
+    def count(self, key: str, amount: int = 1):
+        """
+        Increment a retrieval path counter
+        """
+        if amount:
+            with self._counts_lock:
+                self.retrieval_counts[key] += amount
+            if key != "queries":
+                FAQ_RETRIEVAL_TOTAL.inc(amount, path=key)
+    
+    def is_decisive(self, query: str, hits: list, lexical_index: LexicalIndex) -> bool:
+        """
+        Check whether the top lexical hit is clear enough to skip dense retrieval
+        """
+        if not hits or hits[0][2] < self.fast_path_coverage:
+            return False
+        # A match on one or two syllables fits too many rows to be trusted alone
+        if lexical_index.matched_query_terms(query, hits[0][0]) < self.fast_path_min_terms:
+            return False
+        return len(hits) == 1 or hits[0][1] >= self.fast_path_margin * hits[1][1]
+    
+    def fuse_results(self, dense: List[Tuple[int, float]], lexical: list, query_embedding: np.ndarray,
+                     snapshot: FAQSnapshot) -> List[Tuple[int, float]]:
+        """
+        Fuse dense (row, cosine) and lexical (row, bm25, coverage) results into
+        (row, similarity) ordered by fused score
+        """
+        if not lexical:
+            return dense
+        
+        cosines = dict(dense)
+        coverages = {row: coverage for row, _, coverage in lexical}
+        
+        def cosine(row: int) -> Optional[float]:
+            if row not in cosines and snapshot.embeddings is not None:
+                cosines[row] = float(np.dot(np.asarray(snapshot.embeddings[row], dtype='float32'), query_embedding))
+            return cosines.get(row)
+        
+        fused = Counter()
+        if self.hybrid_mode == "weighted":
+            max_bm25 = lexical[0][1] or 1.0
+            bm25_scores = {row: score / max_bm25 for row, score, _ in lexical}
+            for row in set(cosines) | set(bm25_scores):
+                fused[row] = self.dense_weight * (cosine(row) or 0.0) + (1 - self.dense_weight) * bm25_scores.get(row, 0.0)
+        else:
+            # Reciprocal rank fusion
+            for rank, (row, _) in enumerate(dense):
+                fused[row] += 1.0 / (self.rrf_k + rank + 1)
+            for rank, (row, _, _) in enumerate(lexical):
+                fused[row] += 1.0 / (self.rrf_k + rank + 1)
+        
+        results = []
+        for row, _ in fused.most_common():
+            similarity = cosine(row)
+            results.append((row, similarity if similarity is not None else coverages.get(row, 0.0)))
+        return results
+    
+    def get_answers(self, queries: List[Any], top_k: int = 3) -> List[Tuple[str, float, str]]:
+        """
+        Get answers for many queries using one encode call and one index search. Queries
+        may be FastPathMiss results of get_fast_answer, which skip the fast path here.
+        """
+        # Everything below reads this one snapshot, even if a reload swaps in another
+        snapshot = self.snapshot
+        if snapshot.index is None:
+            print("No index available")
+            return [self.build_answer([], snapshot) for _ in queries]
+        
+        if not queries:
+            return []
+        
+        answers = [None] * len(queries)
+        lexical_results = [[] for _ in queries]
+        fast_paths = Counter()
+        self.count("queries", len(queries))
+        
+        queries = list(queries)
+        for i, query in enumerate(queries):
+            if isinstance(query, FastPathMiss):
+                queries[i] = query.query
+                # Hits of another snapshot point at other rows; those are matched again
+                if query.version == snapshot.version:
+                    lexical_results[i] = query.hits
+                    continue
+            path, answer, lexical_results[i] = self.match_fast_path(queries[i], snapshot)
+            if path is not None:
+                answers[i] = answer
+                fast_paths[path] += 1
+        self.count("exact_match", fast_paths["exact_match"])
+        self.count("lexical_fast_path", fast_paths["lexical_fast_path"])
+        
+        remaining = [i for i, answer in enumerate(answers) if answer is None]
+        if not remaining:
+            return answers
+        
+        lexical_index = snapshot.lexical_index if self.hybrid_mode != "off" else None
+        query_embeddings = self.encode_queries([queries[i] for i in remaining])
+        
+        # Near-duplicates of recently answered queries skip the main index entirely;
+        # entries are tagged with the snapshot version they were answered from
+        pending = []
+        positions = []
+        with FAQ_STAGE_SECONDS.time(stage="cache_lookup"):
+            for position, (i, embedding) in enumerate(zip(remaining, query_embeddings)):
+                cached = self.answer_cache.lookup(embedding)
+                if cached is not None and cached[0] == snapshot.version:
+                    answers[i] = cached[1]
+                else:
+                    pending.append(i)
+                    positions.append(position)
+        FAQ_CACHE_TOTAL.inc(len(remaining) - len(pending), cache="answer", result="hit")
+        FAQ_CACHE_TOTAL.inc(len(pending), cache="answer", result="miss")
+        self.count("answer_cache", len(remaining) - len(pending))
+        
+        if pending:
+            dense_k = max(top_k, self.lexical_candidates) if lexical_index is not None else top_k
+            batch_results = self.search_embeddings(query_embeddings[positions], dense_k, snapshot)
+            for i, position, similar_questions in zip(pending, positions, batch_results):
+                if lexical_index is not None:
+                    with FAQ_STAGE_SECONDS.time(stage="fusion"):
+                        similar_questions = self.fuse_results(
+                            similar_questions, lexical_results[i], query_embeddings[position], snapshot
+                        )
+                answers[i] = self.build_answer(similar_questions, snapshot)
+                if similar_questions:
+                    self.answer_cache.add(query_embeddings[position], (snapshot.version, answers[i]))
+        self.count("dense", len(pending))
+        
+        return answers
+    
+    def get_cache_stats(self) -> dict:
+        """
+        Get query cache statistics
+        """
+        with self._counts_lock:
+            retrieval = dict(self.retrieval_counts)
+        # Share of queries answered without encoding, per fast path
+        queries = retrieval.get("queries", 0)
+        for path in ("exact_match", "lexical_fast_path"):
+            retrieval[f"{path}_rate"] = retrieval.get(path, 0) / queries if queries else 0.0
+        return {
+            "embedding_cache": self.embedding_cache.get_stats(),
+            "answer_cache": self.answer_cache.get_stats(),
+            "retrieval": retrieval
+        }
+    
+    def artifact_source_path(self) -> Optional[str]:
+        """
+        Path of the FAQ CSV copied into the artifact directory, if there is one
+        """
+        manifest = self.load_manifest()
+        if manifest and manifest.get("source_file"):
+            path = os.path.join(self.artifact_dir, manifest["source_file"])
+            if os.path.exists(path):
+                return path
+        return None
+    
+    def build_artifact(self, csv_path: str, out_dir: str) -> dict:
+        """
+        Build a self-contained artifact directory offline: the source CSV, embeddings,
+        row IDs, index and a manifest describing how they were made
+        """
+        faq_data, source_hash = self.read_faq_data(csv_path)
+        self.set_artifact_dir(out_dir)
+        os.makedirs(out_dir, exist_ok=True)
+        
+        start_time = time.time()
+        fields = self.build_artifacts(faq_data)
+        encode_time = time.time() - start_time
+        
+        source_path = os.path.join(out_dir, SOURCE_FILE)
+        if os.path.abspath(csv_path) != os.path.abspath(source_path):
+            self.replace_file(source_path, lambda path: shutil.copyfile(csv_path, path))
+        self.save_artifacts(self.snapshot._replace(faq_data=faq_data, source_hash=source_hash, **fields))
+        
+        manifest = self.load_manifest()
+        print(f"Built artifact {manifest['artifact_version']} for {len(faq_data)} questions "
+              f"in {out_dir} (encoding took {encode_time:.1f}s)")
+        return manifest
+    
     def initialize(self):
         """
         Initialize the RAG service - load data and embeddings
         """
-        # Load FAQ data
-        if not self.load_faq_data():
+        # Load FAQ data; a prebuilt artifact carries the exact CSV it was built from
+        source_path = self.artifact_source_path() if self.read_only else None
+        if not self.load_faq_data(source_path):
             return False
         
         # Try to load existing embeddings, if not available, create new ones
         if not self.load_embeddings():
+            if self.read_only:
+                print(f"No usable prebuilt artifact in {self.artifact_dir}")
+                return False
             print("Creating new embeddings...")
             if not self.create_embeddings():
                 return False
         
+        # Load the model now rather than on the first request
+        self.model
+        
         print("RAG service initialized successfully")
         return True
+
+def verify_artifact(artifact_dir: str) -> dict:
+    """
+    Check every file of an artifact directory against the manifest checksums
+    """
+    with open(os.path.join(artifact_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    mismatched = [
+        name for name, checksum in manifest.get("checksums", {}).items()
+        if not os.path.exists(os.path.join(artifact_dir, name))
+        or file_sha256(os.path.join(artifact_dir, name)) != checksum
+    ]
+    return {"artifact_version": manifest.get("artifact_version"), "ok": not mismatched, "mismatched": mismatched}
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Command line: build an artifact directory offline, or verify one
+    """
+    parser = argparse.ArgumentParser(prog="python -m app.services.rag_service")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    build = commands.add_parser("build", help="Encode the FAQ CSV and write a relocatable artifact directory")
+    build.add_argument("--csv", default=DEFAULT_CSV_PATH)
+    build.add_argument("--out", required=True, help="Artifact directory to write")
+    build.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    build.add_argument("--encoder-backend", default="sentence-transformers", choices=ENCODER_BACKENDS)
+    build.add_argument("--onnx-dir", default=DEFAULT_ONNX_DIR)
+    build.add_argument("--index-type", default="flat")
+    build.add_argument("--index-params", type=json.loads, default=None, help='JSON, e.g. \'{"M": 32}\'')
+    build.add_argument("--embeddings-dtype", default="float32", choices=("float32", "float16"))
+    build.add_argument("--batch-size", type=int, default=64)
+    # Each encoder process already uses every core, so more than one only pays off on large machines
+    build.add_argument("--workers", type=int, default=1, help="Parallel encoders")
+    
+    verify = commands.add_parser("verify", help="Check an artifact directory against its manifest checksums")
+    verify.add_argument("artifact_dir")
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == "verify":
+        result = verify_artifact(args.artifact_dir)
+        print(json.dumps(result, indent=2))
+        return 0 if result["ok"] else 1
+    
+    rag_service = RAGService(
+        model_name=args.model, index_type=args.index_type, index_params=args.index_params,
+        embeddings_dtype=args.embeddings_dtype, encoder_backend=args.encoder_backend, onnx_dir=args.onnx_dir,
+        artifact_dir=args.out, read_only=False, build_batch_size=args.batch_size, build_workers=args.workers
+    )
+    manifest = rag_service.build_artifact(args.csv, args.out)
+    print(json.dumps(manifest, ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
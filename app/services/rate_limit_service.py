@@ -0,0 +1,109 @@
+"""
+Rate Limit Service
+Per-client token buckets: each user gets a burst of requests that refills at a
+steady rate, so one chatty client cannot use up a route group's capacity.
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import threading
+import time
+
+class RateLimitExceededError(Exception):
+    """
+    Raised when a client has no tokens left; retry_after is the wait in seconds for the next one
+    """
+    
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """
+    Holds up to `burst` tokens, refilled at `rate` tokens per second
+    """
+    
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+    
+    def __init__(self, rate: float, burst: float, now: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic() if now is None else now
+    
+    def take(self, now: float, amount: float = 1.0) -> float:
+        """
+        Take tokens if available and return 0, or return the seconds until they will be
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+class RateLimiter:
+    """
+    Token bucket per key (user id), keeping the most recently seen keys only
+    """
+    
+    def __init__(self, rate: float = 5.0, burst: float = 20.0, max_keys: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._allowed = 0
+        self._limited = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+    
+    def acquire(self, key: str, amount: float = 1.0):
+        """
+        Take tokens for a key, raising RateLimitExceededError when its bucket is empty
+        """
+        if not self.enabled:
+            return
+        
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+                # A key evicted here had been idle the longest; it comes back with a full bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            
+            # Requests larger than the burst could never be admitted, so they only need a full bucket
+            wait = bucket.take(now, min(amount, self.burst))
+            if wait:
+                self._limited += 1
+            else:
+                self._allowed += 1
+        
+        if wait:
+            raise RateLimitExceededError("Bạn gửi quá nhiều yêu cầu, vui lòng thử lại sau.", wait)
+    
+    def reset(self):
+        """
+        Forget all buckets
+        """
+        with self._lock:
+            self._buckets.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get rate limiter statistics
+        """
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "tracked_keys": len(self._buckets),
+                "allowed": self._allowed,
+                "limited": self._limited
+            }
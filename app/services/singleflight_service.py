@@ -0,0 +1,65 @@
+"""
+Single-flight Service
+Collapses concurrent calls with the same key into one execution: the first
+caller computes the result and everyone who arrives while it runs waits for
+and shares that result.
+"""
+
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Tuple
+import threading
+
+class SingleFlight:
+    """
+    In-flight calls by key, each backed by a future that concurrent callers share
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._executed = 0
+        self._collapsed = 0
+    
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        Run fn for the key unless a call with the same key is in flight, in which case
+        wait for that call. Returns (result, shared); exceptions are shared too.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._collapsed += 1
+                leader = False
+            else:
+                future = self._in_flight[key] = Future()
+                self._executed += 1
+                leader = True
+        
+        if not leader:
+            return future.result(), True
+        
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            # Callers arriving from now on start a new computation
+            with self._lock:
+                del self._in_flight[key]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get single-flight statistics
+        """
+        with self._lock:
+            total = self._executed + self._collapsed
+            return {
+                "in_flight": len(self._in_flight),
+                "executed": self._executed,
+                "collapsed": self._collapsed,
+                "collapse_rate": self._collapsed / total if total else 0.0
+            }
@@ -0,0 +1,57 @@
+"""
+Text Processing Utilities
+Normalization helpers for Vietnamese customer questions.
+"""
+
+from typing import List
+import re
+import unicodedata
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TOKEN_RE = re.compile(r"\w+")
+# "đ" is a separate letter, not a combining mark, so NFD does not split it
+_FOLD_TABLE = str.maketrans({"đ": "d", "Đ": "D"})
+
+def _is_punctuation(char: str) -> bool:
+    """
+    Check whether a character is Unicode punctuation or a symbol
+    """
+    return unicodedata.category(char)[0] in ("P", "S")
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize a question for cache and lookup keys:
+    Unicode NFC, lowercase, collapsed whitespace, trimmed punctuation
+    """
+    text = unicodedata.normalize("NFC", text or "")
+    text = _WHITESPACE_RE.sub(" ", text.lower()).strip()
+    
+    # Trim leading/trailing punctuation such as "?", "...", quotes
+    start, end = 0, len(text)
+    while start < end and (_is_punctuation(text[start]) or text[start].isspace()):
+        start += 1
+    while end > start and (_is_punctuation(text[end - 1]) or text[end - 1].isspace()):
+        end -= 1
+    
+    return text[start:end]
+
+def fold_diacritics(text: str) -> str:
+    """
+    Strip Vietnamese diacritics: "hoàn vé" -> "hoan ve", "đổi" -> "doi"
+    """
+    decomposed = unicodedata.normalize("NFD", text.translate(_FOLD_TABLE))
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return unicodedata.normalize("NFC", stripped)
+
+def tokenize(text: str, fold: bool = True, bigrams: bool = False) -> List[str]:
+    """
+    Split text into lowercase Vietnamese syllables (optionally diacritic-folded),
+    plus adjacent-syllable bigrams so phrases like "hoàn vé" score as a unit
+    """
+    text = unicodedata.normalize("NFC", text or "").lower()
+    if fold:
+        text = fold_diacritics(text)
+    tokens = _TOKEN_RE.findall(text)
+    if bigrams:
+        tokens += [f"{first}_{second}" for first, second in zip(tokens, tokens[1:])]
+    return tokens
@@ -0,0 +1,31 @@
+import pytest
+import sys
+import os
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.booking_store import InMemoryBookingStore, SQLiteBookingStore
+
+def pytest_addoption(parser):
+    parser.addoption("--run-benchmarks", action="store_true", default=False,
+                     help="run the wall-clock timing tests marked benchmark")
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: wall-clock timing test, skipped unless --run-benchmarks")
+
+def pytest_collection_modifyitems(config, items):
+    # Timings depend on the machine, so they stay out of normal and CI runs
+    if config.getoption("--run-benchmarks"):
+        return
+    skip_benchmark = pytest.mark.skip(reason="benchmark, run with --run-benchmarks")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip_benchmark)
+
+@pytest.fixture(params=["memory", "sqlite"])
+def booking_store(request, tmp_path):
+    """An empty booking store of each backend"""
+    store = InMemoryBookingStore() if request.param == "memory" else SQLiteBookingStore(str(tmp_path / "bookings.db"))
+    yield store
+    store.close()
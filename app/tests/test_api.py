@@ -1,13 +1,17 @@
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import Mock, patch
+import json
+import signal
 import sys
 import os
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.main import app
+from app.main import app, booking_rate_limiter, faq_rate_limiter
+from app.services.executor_service import ExecutorSaturatedError
+from app.models.schemas import BookingChangeResponse
 
 class TestAPI:
     """Test cases for FastAPI endpoints"""
@@ -15,6 +19,8 @@ class TestAPI:
     @pytest.fixture
     def client(self):
         """Create test client"""
+        faq_rate_limiter.reset()
+        booking_rate_limiter.reset()
         return TestClient(app)
     
     def test_root_endpoint(self, client):
@@ -81,6 +87,160 @@ class TestAPI:
         data = response.json()
         assert "detail" in data
     
+    @patch('app.main.faq_service.get_faq_answers')
+    def test_ask_faq_batch_success(self, mock_get_faq_answers, client):
+        """Test successful batch FAQ question"""
+        mock_get_faq_answers.return_value = {
+            "results": [
+                {"answer": "Answer 1", "confidence": 90.0, "source_question": "Q1", "processing_time": 0.1},
+                {"answer": "Answer 2", "confidence": 80.0, "source_question": "Q2", "processing_time": 0.1}
+            ],
+            "count": 2,
+            "processing_time": 0.2
+        }
+        
+        request_data = {"questions": ["Q1?", "Q2?"], "user_id": "user001"}
+        
+        response = client.post("/api/faq/ask-batch", json=request_data)
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["count"] == 2
+        assert data["results"][0]["answer"] == "Answer 1"
+        assert data["processing_time"] == 0.2
+    
+    def test_ask_faq_batch_size_bounds(self, client):
+        """Test empty and oversized batches are rejected before reaching the FAQ executor"""
+        assert client.post("/api/faq/ask-batch", json={"questions": []}).status_code == 422
+        
+        response = client.post("/api/faq/ask-batch", json={"questions": ["Q?"] * 1001})
+        assert response.status_code == 422
+    
+    @patch('app.main.faq_executor.submit')
+    def test_ask_faq_overloaded(self, mock_submit, client):
+        """Test FAQ question is rejected fast when the FAQ executor is saturated"""
+        from app.services.executor_service import ExecutorSaturatedError
+        mock_submit.side_effect = ExecutorSaturatedError("overloaded")
+        
+        response = client.post("/api/faq/ask", json={"question": "Test question"})
+        
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+    
+    @patch('app.prefork.os.kill')
+    def test_admin_reload_forwarded_to_prefork_master(self, mock_kill, client, monkeypatch):
+        """Test a pre-fork worker hands the reload to its master instead of rebuilding itself"""
+        monkeypatch.setenv("VEXERE_ADMIN_TOKEN", "secret")
+        monkeypatch.setenv("PREFORK_MASTER_PID", str(os.getpid() + 1))
+        
+        response = client.post("/api/admin/faq/reload", headers={"X-Admin-Token": "secret"})
+        
+        assert response.status_code == 202
+        assert response.json()["status"] == "forwarded"
+        mock_kill.assert_called_once_with(os.getpid() + 1, signal.SIGHUP)
+    
+    def test_admin_reload_requires_token(self, client, monkeypatch):
+        """Test admin endpoints are disabled without a configured token and reject bad tokens"""
+        monkeypatch.delenv("VEXERE_ADMIN_TOKEN", raising=False)
+        assert client.post("/api/admin/faq/reload").status_code == 403
+        
+        monkeypatch.setenv("VEXERE_ADMIN_TOKEN", "secret")
+        response = client.post("/api/admin/faq/reload", headers={"X-Admin-Token": "wrong"})
+        assert response.status_code == 401
+        
+        # Header values are decoded as latin-1, so a token need not be ASCII
+        response = client.post("/api/admin/faq/reload", headers={"X-Admin-Token": "sécret".encode("latin-1")})
+        assert response.status_code == 401
+    
+    @patch('app.main.faq_service.reload_faq_data')
+    def test_admin_reload_started(self, mock_reload, client, monkeypatch):
+        """Test an authorized reload is started in the background"""
+        monkeypatch.setenv("VEXERE_ADMIN_TOKEN", "secret")
+        mock_reload.return_value = {"status": "started"}
+        
+        response = client.post("/api/admin/faq/reload", headers={"X-Admin-Token": "secret"})
+        
+        assert response.status_code == 202
+        assert response.json()["status"] == "started"
+    
+    @patch('app.main.booking_service.change_booking_time')
+    def test_metrics_endpoint(self, mock_change_booking_time, client):
+        """Test request latency and per-stage metrics are exposed in the Prometheus text format"""
+        mock_change_booking_time.return_value = {"success": False, "message": "x"}
+        client.post("/api/booking/change-time", json={
+            "booking_id": "VX001234",
+            "new_departure_time": "2024-01-20 10:30",
+            "reason": "Personal emergency",
+            "user_id": "user001"
+        })
+        
+        response = client.get("/metrics")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "# TYPE faq_stage_seconds histogram" in response.text
+        assert 'http_request_duration_seconds_count{method="POST",route="/api/booking/change-time",status="200"}' in response.text
+    
+    @patch('app.main.faq_service.get_faq_answer')
+    def test_faq_serialization_is_timed(self, mock_get_faq_answer, client):
+        """Test response validation, encoding and rendering after the endpoint are one serialize observation"""
+        mock_get_faq_answer.return_value = {"answer": "A", "confidence": 90.0, "processing_time": 0.1}
+        
+        with patch('app.main.FAQ_STAGE_SECONDS.observe') as mock_observe:
+            response = client.post("/api/faq/ask", json={"question": "Q?"})
+        
+        assert response.status_code == 200
+        mock_observe.assert_called_once()
+        assert mock_observe.call_args.kwargs == {"stage": "serialize"}
+        assert mock_observe.call_args.args[0] >= 0
+    
+    def test_admin_profile(self, client, monkeypatch):
+        """Test the sampling profiler requires the admin token and returns collapsed stacks"""
+        monkeypatch.delenv("VEXERE_ADMIN_TOKEN", raising=False)
+        assert client.get("/api/admin/profile?seconds=0.05").status_code == 403
+        
+        monkeypatch.setenv("VEXERE_ADMIN_TOKEN", "secret")
+        response = client.get("/api/admin/profile?seconds=0.05", headers={"X-Admin-Token": "secret"})
+        
+        assert response.status_code == 200
+        assert int(response.headers["X-Profile-Samples"]) > 0
+        assert ";" in response.text
+    
+    def test_trace_request_header(self, client, monkeypatch):
+        """Test a single request is traced with the header and an admin token"""
+        monkeypatch.setenv("VEXERE_ADMIN_TOKEN", "secret")
+        # Without a valid token the header is ignored rather than failing the request
+        response = client.get("/", headers={"X-Trace-Request": "1", "X-Admin-Token": "wrong"})
+        assert response.status_code == 200
+        assert "X-Trace-Id" not in response.headers
+        
+        response = client.get("/", headers={"X-Trace-Request": "1", "X-Admin-Token": "secret"})
+        assert response.status_code == 200
+        trace_id = response.headers["X-Trace-Id"]
+        
+        trace = client.get(f"/api/admin/profile/traces/{trace_id}", headers={"X-Admin-Token": "secret"})
+        assert trace.status_code == 200
+        assert "X-Trace-Id" not in client.get("/").headers
+    
+    def test_rate_limit_per_user(self, client):
+        """Test a user over their token bucket gets 429 with Retry-After, other users do not"""
+        with patch.object(booking_rate_limiter, "rate", 0.01), patch.object(booking_rate_limiter, "burst", 1):
+            assert client.get("/api/booking/VX001234?user_id=user001").status_code == 200
+            
+            response = client.get("/api/booking/VX001234?user_id=user001")
+            assert response.status_code == 429
+            assert int(response.headers["Retry-After"]) >= 1
+            
+            assert client.get("/api/booking/VX001235?user_id=user002").status_code == 200
+    
+    @patch('app.main.faq_executor.submit')
+    def test_booking_has_own_capacity(self, mock_submit, client):
+        """Test booking requests are still served while the FAQ pool is saturated"""
+        mock_submit.side_effect = ExecutorSaturatedError("overloaded")
+        
+        assert client.post("/api/faq/ask", json={"question": "Test question"}).status_code == 503
+        assert client.get("/api/booking/VX001234?user_id=user001").status_code == 200
+    
     @patch('app.main.faq_service.get_all_faqs')
     def test_list_faqs_success(self, mock_get_all_faqs, client):
         """Test successful FAQ list retrieval"""
@@ -97,7 +257,7 @@ class TestAPI:
         assert data["count"] == 3
         assert data["faqs"] == mock_faqs
     
-    @patch('app.main.faq_service.search_faqs')
+    @patch('app.main.faq_service.search_faqs_page')
     def test_search_faqs_success(self, mock_search_faqs, client):
         """Test successful FAQ search"""
         # Mock search results
@@ -105,7 +265,7 @@ class TestAPI:
             {"question": "How to book?", "answer": "Answer 1"},
             {"question": "Booking process", "answer": "Answer 2"}
         ]
-        mock_search_faqs.return_value = mock_results
+        mock_search_faqs.return_value = {"results": mock_results, "total": 2}
         
         response = client.get("/api/faq/search?keyword=book")
         
@@ -116,6 +276,18 @@ class TestAPI:
         assert data["count"] == 2
         assert data["results"] == mock_results
     
+    @patch('app.main.faq_service.search_faqs_page')
+    def test_search_faqs_count_is_total(self, mock_search_faqs, client):
+        """Test count reports every match, not only the returned page"""
+        mock_search_faqs.return_value = {"results": [{"question": "Q3", "answer": "A3"}], "total": 25}
+        
+        response = client.get("/api/faq/search?keyword=book&limit=1&offset=2")
+        
+        data = response.json()
+        assert data["count"] == 25
+        assert len(data["results"]) == 1
+        mock_search_faqs.assert_called_once_with("book", 1, 2)
+    
     @patch('app.main.booking_service.change_booking_time')
     def test_change_booking_time_success(self, mock_change_booking_time, client):
         """Test successful booking time change"""
@@ -170,6 +342,55 @@ class TestAPI:
         assert data["success"] is False
         assert "không hợp lệ" in data["message"]
     
+    @patch('app.main.booking_service.change_booking_time')
+    def test_change_booking_time_idempotency_key(self, mock_change_booking_time, client):
+        """Test the Idempotency-Key header is passed on and key errors map to 409/422"""
+        from app.services.booking_service import IdempotencyKeyInProgressError, IdempotencyKeyMismatchError
+        request_data = {
+            "booking_id": "VX001234",
+            "new_departure_time": "2024-01-20 10:30",
+            "reason": "Personal emergency",
+            "user_id": "user001"
+        }
+        mock_change_booking_time.return_value = BookingChangeResponse(success=True, message="Thay đổi thành công")
+        
+        response = client.post("/api/booking/change-time", json=request_data, headers={"Idempotency-Key": "abc"})
+        assert response.status_code == 200
+        assert mock_change_booking_time.call_args[0][1] == "abc"
+        
+        mock_change_booking_time.side_effect = IdempotencyKeyInProgressError("in progress")
+        response = client.post("/api/booking/change-time", json=request_data, headers={"Idempotency-Key": "abc"})
+        assert response.status_code == 409
+        assert response.headers["Retry-After"] == "1"
+        
+        mock_change_booking_time.side_effect = IdempotencyKeyMismatchError("mismatch")
+        response = client.post("/api/booking/change-time", json=request_data, headers={"Idempotency-Key": "abc"})
+        assert response.status_code == 422
+    
+    @patch('app.main.booking_service.change_booking_times_bulk')
+    def test_change_booking_times_bulk(self, mock_bulk, client):
+        """Test bulk changes stream one JSON line per item"""
+        mock_bulk.return_value = [
+            (0, BookingChangeResponse(success=True, message="Thay đổi thành công", new_booking_details={"booking_id": "VX001234"})),
+            (1, BookingChangeResponse(success=False, message="Không tìm thấy"))
+        ]
+        change = {"booking_id": "VX001234", "new_departure_time": "2024-01-20 10:30", "reason": "Airline", "user_id": "user001"}
+        
+        response = client.post("/api/booking/change-time/bulk", json={"changes": [change, dict(change, booking_id="VX999999")]})
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert response.headers["X-Total-Count"] == "2"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["index"] for line in lines] == [0, 1]
+        assert lines[0]["success"] is True
+        assert lines[1]["message"] == "Không tìm thấy"
+        assert len(mock_bulk.call_args[0][0]) == 2
+    
+    def test_change_booking_times_bulk_empty(self, client):
+        """Test an empty bulk request is rejected"""
+        assert client.post("/api/booking/change-time/bulk", json={"changes": []}).status_code == 422
+    
     @patch('app.main.booking_service.get_booking_info')
     def test_get_booking_info_success(self, mock_get_booking_info, client):
         """Test successful booking info retrieval"""
@@ -0,0 +1,83 @@
+import pytest
+import threading
+import sys
+import os
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.batching_service import MicroBatcher
+
+class TestMicroBatcher:
+    """Test cases for Micro-batching Service"""
+    
+    def test_submit_single_item(self):
+        """Test a single submitted item gets its own result"""
+        batcher = MicroBatcher(lambda items: [item * 2 for item in items], max_wait_ms=1)
+        
+        assert batcher.submit(21) == 42
+        
+        stats = batcher.get_stats()
+        assert stats["batches"] == 1
+        assert stats["items"] == 1
+    
+    def test_lone_item_skips_the_window(self):
+        """Test an item submitted to an idle batcher is dispatched without waiting the window"""
+        batcher = MicroBatcher(lambda items: items, max_wait_ms=10000)
+        
+        thread = threading.Thread(target=batcher.submit, args=("question",), daemon=True)
+        thread.start()
+        thread.join(timeout=5)
+        
+        assert not thread.is_alive()
+        assert batcher.get_stats()["batch_size_histogram"] == {1: 1}
+    
+    def test_concurrent_items_are_coalesced(self):
+        """Test concurrent submissions are merged into batches and results routed back"""
+        batch_calls = []
+        
+        def process(items):
+            batch_calls.append(list(items))
+            return [item.upper() for item in items]
+        
+        batcher = MicroBatcher(process, max_batch_size=8, max_wait_ms=50)
+        results = {}
+        start = threading.Barrier(8)
+        
+        def worker(i):
+            start.wait()
+            results[i] = batcher.submit(f"q{i}")
+        
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert results == {i: f"Q{i}" for i in range(8)}
+        assert len(batch_calls) < 8
+        stats = batcher.get_stats()
+        assert stats["items"] == 8
+        assert stats["max_observed_batch_size"] > 1
+        assert stats["max_observed_batch_size"] <= 8
+    
+    def test_batch_size_limit(self):
+        """Test batches never exceed max_batch_size"""
+        batcher = MicroBatcher(lambda items: items, max_batch_size=2, max_wait_ms=20)
+        threads = [threading.Thread(target=batcher.submit, args=(i,)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert max(batcher.get_stats()["batch_size_histogram"]) <= 2
+    
+    def test_exception_propagates_to_callers(self):
+        """Test batch errors are raised in every caller"""
+        def process(items):
+            raise ValueError("encode failed")
+        
+        batcher = MicroBatcher(process, max_wait_ms=1)
+        
+        with pytest.raises(ValueError):
+            batcher.submit("question")
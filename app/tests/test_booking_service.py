@@ -1,13 +1,24 @@
 import pytest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
 from datetime import datetime, timedelta
 import sys
 import os
+import threading
+import time
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.services.booking_service import BookingService
+from app.services.booking_service import BookingService, IdempotencyKeyInProgressError, IdempotencyKeyMismatchError
+from app.services.booking_store import InMemoryBookingStore, SQLiteBookingStore
 from app.models.schemas import BookingChangeRequest, BookingChangeResponse
+from app.services.metrics_service import BOOKING_CHANGE_TOTAL
+
+@pytest.fixture
+def booking_service(booking_store):
+    """Create a booking service on each store backend"""
+    return BookingService(booking_store)
 
 class TestBookingService:
     """Test cases for Booking Service"""
@@ -138,6 +149,32 @@ class TestBookingService:
         assert response.new_booking_details["booking_id"] == "VX001234"
         assert response.new_booking_details["new_departure_time"] == future_time
     
+    def test_retry_backoff_is_capped(self):
+        """Test late retries never sleep longer than max_backoff"""
+        service = BookingService(InMemoryBookingStore(), retry_backoff=0.001, max_backoff=0.05)
+        
+        assert all(service.backoff(attempt) <= 0.05 for attempt in (0, 10, 100, 10000))
+    
+    def test_change_booking_time_persisted_in_sqlite(self, tmp_path):
+        """Test a change made through the SQLite store is seen after a restart"""
+        path = str(tmp_path / "bookings.db")
+        future_time = (datetime.now() + timedelta(days=1)).replace(hour=10, minute=0).strftime("%Y-%m-%d %H:%M")
+        request = BookingChangeRequest(
+            booking_id="VX001234",
+            new_departure_time=future_time,
+            reason="Personal emergency",
+            user_id="user001"
+        )
+        
+        response = BookingService(SQLiteBookingStore(path)).change_booking_time(request)
+        assert response.success is True
+        assert response.new_booking_details["original_departure_time"] == "2024-01-15 08:30"
+        
+        restarted = BookingService(SQLiteBookingStore(path))
+        booking = restarted.get_booking_info("VX001234", "user001")
+        assert booking["departure_time"] == future_time
+        assert booking["change_reason"] == "Personal emergency"
+    
     def test_change_booking_time_invalid_booking_id(self, booking_service):
         """Test booking time change with invalid booking ID"""
         request = BookingChangeRequest(
@@ -166,6 +203,20 @@ class TestBookingService:
         assert response.success is False
         assert "không tìm thấy" in response.message.lower()
     
+    def test_change_booking_time_counts_outcome(self, booking_service):
+        """Test each booking change is counted by outcome"""
+        before = BOOKING_CHANGE_TOTAL.get(outcome="not_found")
+        request = BookingChangeRequest(
+            booking_id="VX999999",
+            new_departure_time="2024-01-20 10:30",
+            reason="Test reason",
+            user_id="user001"
+        )
+        
+        booking_service.change_booking_time(request)
+        
+        assert BOOKING_CHANGE_TOTAL.get(outcome="not_found") == before + 1
+    
     def test_change_booking_time_unauthorized_user(self, booking_service):
         """Test booking time change with unauthorized user"""
         request = BookingChangeRequest(
@@ -262,3 +313,237 @@ class TestBookingService:
         assert len(code) == 6
         assert code.isalnum()
         assert code.isupper()
+
+class TestIdempotentBookingChange:
+    """Test cases for booking changes with an idempotency key"""
+    
+    @pytest.fixture
+    def change_request(self):
+        future_time = (datetime.now() + timedelta(days=1)).replace(hour=10, minute=0).strftime("%Y-%m-%d %H:%M")
+        return BookingChangeRequest(booking_id="VX001234", new_departure_time=future_time,
+                                    reason="Personal emergency", user_id="user001")
+    
+    def test_retry_replays_first_response(self, booking_service, change_request):
+        """Test a retried change is not applied, charged or confirmed again"""
+        first = booking_service.change_booking_time(change_request, "retry-1")
+        booking_service.apply_booking_change = Mock(side_effect=AssertionError("must not run again"))
+        retried = booking_service.change_booking_time(change_request, "retry-1")
+        
+        assert retried == first
+        assert retried.new_booking_details["confirmation_code"] == first.new_booking_details["confirmation_code"]
+        assert booking_service.get_booking_info("VX001234", "user001")["version"] == 2
+    
+    def test_response_stored_with_the_change(self, booking_service, change_request):
+        """Test a successful change is remembered by the update itself, not by a later write"""
+        booking_service.store.complete_idempotency_key = Mock(side_effect=AssertionError("separate write"))
+        first = booking_service.change_booking_time(change_request, "retry-1")
+        
+        booking_service.apply_booking_change = Mock(side_effect=AssertionError("must not run again"))
+        retried = booking_service.change_booking_time(change_request, "retry-1")
+        
+        assert first.success is True
+        assert retried == first
+    
+    def test_key_reused_for_other_request(self, booking_service, change_request):
+        """Test a key cannot be replayed for a different request"""
+        booking_service.change_booking_time(change_request, "retry-1")
+        
+        with pytest.raises(IdempotencyKeyMismatchError):
+            booking_service.change_booking_time(change_request.model_copy(update={"reason": "Other"}), "retry-1")
+    
+    def test_keys_are_scoped_per_user(self, booking_service, change_request):
+        """Test another user's request with the same key is processed on its own"""
+        booking_service.change_booking_time(change_request, "retry-1")
+        other = change_request.model_copy(update={"booking_id": "VX001235", "user_id": "user002"})
+        
+        response = booking_service.change_booking_time(other, "retry-1")
+        
+        assert response.success is True
+        assert response.new_booking_details["booking_id"] == "VX001235"
+    
+    def test_concurrent_duplicate_is_rejected(self, booking_service, change_request):
+        """Test a duplicate arriving while the first is still running does not run in parallel"""
+        calculate_change_fee = booking_service.calculate_change_fee
+        started = threading.Event()
+        release = threading.Event()
+        
+        def slow_fee(*args):
+            started.set()
+            release.wait(5)
+            return calculate_change_fee(*args)
+        
+        with patch.object(booking_service, "calculate_change_fee", side_effect=slow_fee):
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                first = pool.submit(booking_service.change_booking_time, change_request, "retry-1")
+                started.wait(5)
+                try:
+                    with pytest.raises(IdempotencyKeyInProgressError):
+                        booking_service.change_booking_time(change_request, "retry-1")
+                finally:
+                    release.set()
+                assert first.result().success is True
+        
+        assert booking_service.change_booking_time(change_request, "retry-1") == first.result()
+    
+    def test_transient_failure_is_not_remembered(self, booking_service, change_request):
+        """Test a retry after an internal error runs the change again"""
+        with patch.object(booking_service, "calculate_change_fee", side_effect=RuntimeError("db down")):
+            assert booking_service.change_booking_time(change_request, "retry-1").success is False
+        
+        assert booking_service.change_booking_time(change_request, "retry-1").success is True
+
+class TestBulkBookingChange:
+    """Test cases for bulk booking changes"""
+    
+    def test_bulk_matches_single_changes(self, booking_service):
+        """Test every item gets the same outcome, fee and chaining as one-by-one changes"""
+        day = (datetime.now() + timedelta(days=2)).replace(hour=10, minute=0)
+        requests = [
+            BookingChangeRequest(booking_id="VX001234", new_departure_time=day.strftime("%Y-%m-%d %H:%M"),
+                                 reason="First", user_id="user001"),
+            BookingChangeRequest(booking_id="VX12", new_departure_time="2024-01-20 10:30",
+                                 reason="Bad id", user_id="user001"),
+            BookingChangeRequest(booking_id="VX999999", new_departure_time="2024-01-20 10:30",
+                                 reason="Missing", user_id="user001"),
+            BookingChangeRequest(booking_id="VX001235", new_departure_time="2024-01-20 10:30",
+                                 reason="Not mine", user_id="user001"),
+            BookingChangeRequest(booking_id="VX001235", new_departure_time="2024-13-45 10:30",
+                                 reason="Bad date", user_id="user002"),
+            BookingChangeRequest(booking_id="VX001235", new_departure_time="2020-01-20 10:30",
+                                 reason="Past", user_id="user002"),
+            BookingChangeRequest(booking_id="VX001234", new_departure_time=(day + timedelta(hours=3)).strftime("%Y-%m-%d %H:%M"),
+                                 reason="Second", user_id="user001"),
+        ]
+        single_service = BookingService(InMemoryBookingStore())
+        expected = [single_service.change_booking_time(request) for request in requests]
+        
+        results = booking_service.change_booking_times_bulk(requests)
+        
+        assert [index for index, _ in results] == list(range(len(requests)))
+        for (_, response), single in zip(results, expected):
+            assert response.success == single.success
+            assert response.message == single.message
+            if single.success:
+                details = dict(response.new_booking_details, confirmation_code=None)
+                assert details == dict(single.new_booking_details, confirmation_code=None)
+        
+        # The second change builds on the first
+        assert results[6][1].new_booking_details["original_departure_time"] == requests[0].new_departure_time
+        assert results[6][1].new_booking_details["change_fee"] == 50000
+        booking = booking_service.get_booking_info("VX001234", "user001")
+        assert booking["departure_time"] == requests[6].new_departure_time
+        assert booking["change_reason"] == "Second"
+        assert booking["version"] == 3
+    
+    @pytest.mark.benchmark
+    def test_bulk_10k_changes_in_seconds(self, booking_service):
+        """Test a 10k-item reschedule finishes in seconds"""
+        total = 10000
+        booking_service.store.seed([
+            {"booking_id": f"VX{100000 + i}", "user_id": f"user{i}", "departure_time": "2030-01-01 10:00", "status": "confirmed"}
+            for i in range(total)
+        ])
+        new_time = (datetime.now() + timedelta(days=3)).replace(hour=12, minute=0).strftime("%Y-%m-%d %H:%M")
+        requests = [
+            BookingChangeRequest(booking_id=f"VX{100000 + i}", new_departure_time=new_time, reason="Airline schedule change",
+                                 user_id=f"user{i}")
+            for i in range(total)
+        ]
+        
+        start_time = time.perf_counter()
+        results = booking_service.change_booking_times_bulk(requests)
+        elapsed = time.perf_counter() - start_time
+        
+        assert elapsed < 10
+        assert all(response.success for _, response in results)
+        assert booking_service.store.get(f"VX{100000 + total - 1}")["departure_time"] == new_time
+    
+    def test_bulk_retries_concurrent_changes(self, booking_service):
+        """Test items whose booking changed after it was read are re-validated and applied"""
+        store = booking_service.store
+        update_many = store.update_many
+        calls = []
+        
+        def update_many_after_concurrent_change(updates):
+            if not calls:
+                # Someone else changes the booking between the read and the write
+                store.update("VX001234", {"departure_time": "2024-01-15 20:00"})
+            calls.append(updates)
+            return update_many(updates)
+        
+        new_time = (datetime.now() + timedelta(days=2)).replace(hour=10, minute=0).strftime("%Y-%m-%d %H:%M")
+        request = BookingChangeRequest(booking_id="VX001234", new_departure_time=new_time, reason="Bulk", user_id="user001")
+        store.update_many = update_many_after_concurrent_change
+        
+        [(_, response)] = booking_service.change_booking_times_bulk([request])
+        
+        assert len(calls) == 2
+        assert response.success is True
+        assert response.new_booking_details["original_departure_time"] == "2024-01-15 20:00"
+        assert response.new_booking_details["version"] == 3
+
+class TestBookingContention:
+    """Many threads changing the same booking at once"""
+    
+    THREADS = 16
+    CHANGES_PER_THREAD = 20
+    
+    @pytest.fixture
+    def booking_service(self, booking_store):
+        """Create a booking service on each store backend that retries long enough for any contention"""
+        return BookingService(booking_store, max_change_attempts=100)
+    
+    def contended_requests(self) -> list:
+        """Changes of one booking to a distinct time each"""
+        base_time = (datetime.now() + timedelta(days=2)).replace(hour=10, minute=0, second=0, microsecond=0)
+        return [
+            BookingChangeRequest(
+                booking_id="VX001234",
+                new_departure_time=(base_time + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M"),
+                reason=f"Change {i}",
+                user_id="user001"
+            )
+            for i in range(self.THREADS * self.CHANGES_PER_THREAD)
+        ]
+    
+    @pytest.mark.benchmark
+    def test_contended_change_throughput(self, booking_service):
+        """Test contended changes to one booking still sustain over 100 changes per second"""
+        requests = self.contended_requests()
+        
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            responses = list(pool.map(booking_service.change_booking_time, requests))
+        elapsed = time.perf_counter() - start_time
+        
+        assert all(response.success for response in responses)
+        assert len(requests) / elapsed > 100
+    
+    def test_concurrent_changes_to_one_booking(self, booking_service):
+        """Test no change is lost or mixed with another under contention"""
+        requests = self.contended_requests()
+        total = len(requests)
+        
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            responses = list(pool.map(booking_service.change_booking_time, requests))
+        
+        assert all(response.success for response in responses)
+        
+        # Every change applied exactly once, each on top of the one before it
+        details = sorted((response.new_booking_details for response in responses), key=lambda d: d["version"])
+        assert [d["version"] for d in details] == list(range(2, total + 2))
+        previous_time = "2024-01-15 08:30"
+        for d in details:
+            assert d["original_departure_time"] == previous_time
+            assert d["change_fee"] == booking_service.calculate_change_fee(
+                "VX001234", d["new_departure_time"], {"departure_time": previous_time}
+            )
+            previous_time = d["new_departure_time"]
+        
+        # Fee, time and reason in the store all come from the same (last) change
+        booking = booking_service.get_booking_info("VX001234", "user001")
+        assert booking["version"] == total + 1
+        assert booking["departure_time"] == details[-1]["new_departure_time"]
+        assert booking["change_fee"] == details[-1]["change_fee"]
+        reasons = {request.new_departure_time: request.reason for request in requests}
+        assert booking["change_reason"] == reasons[booking["departure_time"]]
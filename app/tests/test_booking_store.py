@@ -0,0 +1,252 @@
+import pytest
+import sqlite3
+import sys
+import os
+import threading
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.booking_store import (
+    BookingVersionConflictError, InMemoryBookingStore, SQLiteBookingStore, create_booking_store
+)
+
+SAMPLE_BOOKINGS = [
+    {"booking_id": "VX001234", "user_id": "user001", "departure_time": "2024-01-15 08:30", "status": "confirmed"},
+    {"booking_id": "VX001235", "user_id": "user002", "departure_time": "2024-01-16 14:00", "status": "confirmed"},
+    {"booking_id": "VX001236", "user_id": "user001", "departure_time": "2024-01-17 09:00", "status": "confirmed"},
+]
+
+class TestBookingStore:
+    """Test cases shared by the in-memory and SQLite booking stores"""
+    
+    @pytest.fixture
+    def store(self, booking_store):
+        """Create a seeded store of each backend"""
+        booking_store.seed(SAMPLE_BOOKINGS)
+        return booking_store
+    
+    def test_get(self, store):
+        """Test bookings are returned by id, unknown ids give None"""
+        assert store.get("VX001234") == {**SAMPLE_BOOKINGS[0], "version": 1}
+        assert store.get("VX999999") is None
+        assert "VX001235" in store
+        assert len(store) == 3
+    
+    def test_get_returns_copy(self, store):
+        """Test changing a returned booking does not change the store"""
+        store.get("VX001234")["departure_time"] = "2030-01-01 00:00"
+        
+        assert store.get("VX001234")["departure_time"] == "2024-01-15 08:30"
+    
+    def test_list_by_user(self, store):
+        """Test bookings are listed per user"""
+        assert [booking["booking_id"] for booking in store.list_by_user("user001")] == ["VX001234", "VX001236"]
+    
+    def test_update_returns_previous(self, store):
+        """Test update applies changes and returns the booking as it was"""
+        previous = store.update("VX001234", {"departure_time": "2024-02-01 10:00", "change_fee": 50000})
+        
+        assert previous["departure_time"] == "2024-01-15 08:30"
+        assert store.get("VX001234")["departure_time"] == "2024-02-01 10:00"
+        assert store.get("VX001234")["change_fee"] == 50000
+        assert store.update("VX999999", {"status": "modified"}) is None
+    
+    def test_seed_keeps_existing_changes(self, store):
+        """Test seeding again does not overwrite changed bookings"""
+        store.update("VX001234", {"status": "modified"})
+        store.seed(SAMPLE_BOOKINGS)
+        
+        assert store.get("VX001234")["status"] == "modified"
+    
+    def test_update_increments_version(self, store):
+        """Test every update bumps the version"""
+        store.update("VX001234", {"status": "modified"})
+        store.update("VX001234", {"status": "confirmed"})
+        
+        assert store.get("VX001234")["version"] == 3
+    
+    def test_compare_and_swap(self, store):
+        """Test an update against a stale version is rejected and changes nothing"""
+        booking = store.get("VX001234")
+        store.update("VX001234", {"departure_time": "2024-02-01 10:00"}, expected_version=booking["version"])
+        
+        with pytest.raises(BookingVersionConflictError):
+            store.update("VX001234", {"departure_time": "2024-03-01 10:00"}, expected_version=booking["version"])
+        
+        current = store.get("VX001234")
+        assert current["departure_time"] == "2024-02-01 10:00"
+        assert current["version"] == booking["version"] + 1
+    
+    def test_get_many(self, store):
+        """Test existing bookings are returned by id, missing ones skipped"""
+        bookings = store.get_many(["VX001234", "VX999999", "VX001236", "VX001234"])
+        
+        assert sorted(bookings) == ["VX001234", "VX001236"]
+        assert bookings["VX001236"]["departure_time"] == "2024-01-17 09:00"
+    
+    def test_update_many_skips_conflicts(self, store):
+        """Test a batch applies matching versions and reports stale or missing bookings"""
+        store.update("VX001235", {"status": "modified"})
+        
+        conflicts = store.update_many([
+            ("VX001234", {"status": "modified"}, 1, 3),
+            ("VX001235", {"status": "cancelled"}, 1, 2),
+            ("VX999999", {"status": "cancelled"}, 1, 2),
+        ])
+        
+        assert conflicts == ["VX001235", "VX999999"]
+        assert store.get("VX001234")["status"] == "modified"
+        assert store.get("VX001234")["version"] == 3
+        assert store.get("VX001235")["status"] == "modified"
+    
+    def test_idempotency_key_lifecycle(self, store):
+        """Test a key is reserved once, replays its response and can be released while pending"""
+        assert store.reserve_idempotency_key("user001:k1", "fp", ttl=60, pending_timeout=30) is None
+        assert store.reserve_idempotency_key("user001:k1", "fp", ttl=60, pending_timeout=30) == {
+            "fingerprint": "fp", "response": None
+        }
+        
+        store.complete_idempotency_key("user001:k1", {"success": True, "message": "Thành công"})
+        entry = store.reserve_idempotency_key("user001:k1", "fp", ttl=60, pending_timeout=30)
+        assert entry == {"fingerprint": "fp", "response": {"success": True, "message": "Thành công"}}
+        
+        # Completed keys are kept; pending ones can be released for a retry
+        store.release_idempotency_key("user001:k1")
+        assert store.reserve_idempotency_key("user001:k1", "fp", ttl=60, pending_timeout=30) is not None
+        assert store.reserve_idempotency_key("user001:k2", "fp", ttl=60, pending_timeout=30) is None
+        store.release_idempotency_key("user001:k2")
+        assert store.reserve_idempotency_key("user001:k2", "fp", ttl=60, pending_timeout=30) is None
+    
+    def test_update_stores_idempotent_response(self, store):
+        """Test the response is stored by a successful update, and not by a conflicting one"""
+        store.reserve_idempotency_key("user001:k1", "fp", ttl=60, pending_timeout=30)
+        
+        with pytest.raises(BookingVersionConflictError):
+            store.update("VX001234", {"change_fee": 1.0}, expected_version=5,
+                         idempotency=("user001:k1", {"success": True}))
+        assert store.reserve_idempotency_key("user001:k1", "fp", ttl=60, pending_timeout=30)["response"] is None
+        
+        store.update("VX001234", {"change_fee": 1.0}, expected_version=1, idempotency=("user001:k1", {"success": True}))
+        assert store.reserve_idempotency_key("user001:k1", "fp", ttl=60, pending_timeout=30)["response"] == {"success": True}
+    
+    def test_idempotency_key_expiry(self, store):
+        """Test expired responses and abandoned reservations are taken over"""
+        store.reserve_idempotency_key("user001:k1", "fp", ttl=60, pending_timeout=30)
+        store.complete_idempotency_key("user001:k1", {"success": True})
+        store.reserve_idempotency_key("user001:k2", "fp", ttl=60, pending_timeout=30)
+        
+        assert store.reserve_idempotency_key("user001:k1", "other", ttl=0, pending_timeout=30) is None
+        assert store.reserve_idempotency_key("user001:k2", "other", ttl=60, pending_timeout=0) is None
+
+class TestSQLiteBookingStore:
+    """Test cases specific to the SQLite booking store"""
+    
+    def test_persists_across_reopen(self, tmp_path):
+        """Test changes survive a restart"""
+        path = str(tmp_path / "bookings.db")
+        store = SQLiteBookingStore(path)
+        store.seed(SAMPLE_BOOKINGS)
+        store.update("VX001234", {"departure_time": "2024-02-01 10:00"})
+        store.close()
+        
+        reopened = SQLiteBookingStore(path)
+        assert reopened.get("VX001234")["departure_time"] == "2024-02-01 10:00"
+        reopened.close()
+    
+    def test_adds_version_to_existing_database(self, tmp_path):
+        """Test a database created without the version column is migrated"""
+        path = str(tmp_path / "bookings.db")
+        connection = sqlite3.connect(path)
+        connection.execute("CREATE TABLE bookings (booking_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, status TEXT)")
+        connection.execute("INSERT INTO bookings VALUES ('VX001234', 'user001', 'confirmed')")
+        connection.commit()
+        connection.close()
+        
+        store = SQLiteBookingStore(path)
+        assert store.get("VX001234") == {"booking_id": "VX001234", "user_id": "user001", "status": "confirmed", "version": 1}
+        store.close()
+    
+    def test_idempotency_keys_persist_and_are_bounded(self, tmp_path):
+        """Test stored responses survive a restart and old keys are trimmed"""
+        path = str(tmp_path / "bookings.db")
+        store = SQLiteBookingStore(path, max_idempotency_keys=10)
+        store.reserve_idempotency_key("user001:k", "fp", ttl=60, pending_timeout=30)
+        store.complete_idempotency_key("user001:k", {"success": True, "message": "Đã thay đổi"})
+        store.close()
+        
+        store = SQLiteBookingStore(path, max_idempotency_keys=10)
+        assert store.reserve_idempotency_key("user001:k", "fp", ttl=60, pending_timeout=30)["response"] == {
+            "success": True, "message": "Đã thay đổi"
+        }
+        # The last of these reservations prunes
+        for i in range(store.PRUNE_EVERY - 1):
+            store.reserve_idempotency_key(f"user002:{i}", "fp", ttl=60, pending_timeout=30)
+        assert store.connection().execute("SELECT COUNT(*) FROM idempotency_keys").fetchone()[0] <= 10
+        store.close()
+    
+    def test_wal_mode_and_indexes(self, tmp_path):
+        """Test the database uses WAL and lookups use the indexes"""
+        store = SQLiteBookingStore(str(tmp_path / "bookings.db"))
+        connection = store.connection()
+        
+        assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        by_id = " ".join(str(row) for row in connection.execute("EXPLAIN QUERY PLAN " + store.GET_SQL, ("VX001234",)))
+        by_user = " ".join(str(row) for row in connection.execute("EXPLAIN QUERY PLAN " + store.LIST_BY_USER_SQL, ("user001",)))
+        assert "USING INDEX" in by_id or "PRIMARY KEY" in by_id
+        assert "idx_bookings_user_id" in by_user
+        store.close()
+    
+    def test_connection_per_thread(self, tmp_path):
+        """Test each thread reuses its own connection"""
+        store = SQLiteBookingStore(str(tmp_path / "bookings.db"))
+        store.seed(SAMPLE_BOOKINGS)
+        connections = []
+        
+        def worker():
+            connections.append(store.connection())
+            assert store.connection() is connections[-1]
+            assert store.get("VX001234") is not None
+        
+        threads = [threading.Thread(target=worker) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert len({id(connection) for connection in connections}) == 3
+        assert store.connection() not in connections
+        store.close()
+    
+    def test_failed_transaction_rolls_back(self, tmp_path):
+        """Test a transaction that raises leaves no partial writes"""
+        store = SQLiteBookingStore(str(tmp_path / "bookings.db"))
+        store.seed(SAMPLE_BOOKINGS)
+        
+        with pytest.raises(sqlite3.IntegrityError):
+            with store.transaction() as connection:
+                connection.execute("UPDATE bookings SET status = 'modified' WHERE booking_id = 'VX001234'")
+                connection.execute("INSERT INTO bookings (booking_id, user_id) VALUES ('VX001235', 'user002')")
+        
+        assert store.get("VX001234")["status"] == "confirmed"
+        store.close()
+    
+    def test_rejects_unknown_fields_and_memory_path(self, tmp_path):
+        """Test updates cannot name arbitrary columns and :memory: is refused"""
+        store = SQLiteBookingStore(str(tmp_path / "bookings.db"))
+        with pytest.raises(ValueError):
+            store.update("VX001234", {"status = 'x' --": 1})
+        store.close()
+        
+        with pytest.raises(ValueError):
+            SQLiteBookingStore(":memory:")
+    
+    def test_create_booking_store_from_env(self, tmp_path, monkeypatch):
+        """Test BOOKING_DB_PATH selects the SQLite store"""
+        monkeypatch.delenv("BOOKING_DB_PATH", raising=False)
+        assert isinstance(create_booking_store(), InMemoryBookingStore)
+        
+        monkeypatch.setenv("BOOKING_DB_PATH", str(tmp_path / "bookings.db"))
+        store = create_booking_store()
+        assert isinstance(store, SQLiteBookingStore)
+        store.close()
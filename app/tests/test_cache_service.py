@@ -0,0 +1,93 @@
+import numpy as np
+import sys
+import os
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.cache_service import LRUCache, SemanticAnswerCache
+
+class TestLRUCache:
+    """Test cases for Cache Service"""
+    
+    def test_get_put_and_counters(self):
+        """Test hits and misses are counted"""
+        cache = LRUCache(max_size=2)
+        
+        assert cache.get("a") is None
+        cache.put("a", 1)
+        assert cache.get("a") == 1
+        
+        stats = cache.get_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+    
+    def test_lru_eviction(self):
+        """Test least recently used entry is evicted first"""
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.get_stats()["evictions"] == 1
+    
+    def test_ttl_expiry(self):
+        """Test entries older than the TTL are dropped"""
+        cache = LRUCache(max_size=2, ttl_seconds=10)
+        
+        with patch('app.services.cache_service.time.monotonic', return_value=100.0):
+            cache.put("a", 1)
+        with patch('app.services.cache_service.time.monotonic', return_value=105.0):
+            assert cache.get("a") == 1
+        with patch('app.services.cache_service.time.monotonic', return_value=111.0):
+            assert cache.get("a") is None
+        
+        assert cache.get_stats()["expirations"] == 1
+        assert len(cache) == 0
+
+class TestSemanticAnswerCache:
+    """Test cases for the semantic answer cache"""
+    
+    def unit(self, vector):
+        """Normalize a vector to unit length"""
+        vector = np.asarray(vector, dtype='float32')
+        return vector / np.linalg.norm(vector)
+    
+    def test_near_duplicate_hit(self):
+        """Test a query within the threshold reuses the cached answer"""
+        cache = SemanticAnswerCache(max_size=4, similarity_threshold=0.95)
+        cache.add(self.unit([1.0, 0.0, 0.0]), ("Answer", 90.0, "Question"))
+        
+        assert cache.lookup(self.unit([1.0, 0.1, 0.0])) == ("Answer", 90.0, "Question")
+        assert cache.lookup(self.unit([0.0, 1.0, 0.0])) is None
+        
+        stats = cache.get_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+    
+    def test_lru_eviction_removes_from_index(self):
+        """Test evicted entries are no longer matched"""
+        cache = SemanticAnswerCache(max_size=2, similarity_threshold=0.99)
+        cache.add(self.unit([1.0, 0.0, 0.0]), "a")
+        cache.add(self.unit([0.0, 1.0, 0.0]), "b")
+        cache.lookup(self.unit([1.0, 0.0, 0.0]))
+        cache.add(self.unit([0.0, 0.0, 1.0]), "c")
+        
+        assert len(cache) == 2
+        assert cache.lookup(self.unit([0.0, 1.0, 0.0])) is None
+        assert cache.lookup(self.unit([1.0, 0.0, 0.0])) == "a"
+        assert cache.get_stats()["evictions"] == 1
+    
+    def test_clear(self):
+        """Test clearing drops all cached answers"""
+        cache = SemanticAnswerCache()
+        cache.add(self.unit([1.0, 0.0]), "a")
+        cache.clear()
+        
+        assert cache.lookup(self.unit([1.0, 0.0])) is None
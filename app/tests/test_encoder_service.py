@@ -0,0 +1,88 @@
+import pytest
+import numpy as np
+from unittest.mock import patch
+from app.services.encoder_service import compare_encoders, create_encoder, encode_corpus, l2_normalize, main, mean_pool
+from app.services.rag_service import DEFAULT_ONNX_DIR
+
+class FakeEncoder:
+    """Deterministic bag-of-characters encoder, optionally perturbed"""
+    
+    def __init__(self, noise: float = 0.0, seed: int = 0):
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+    
+    def encode(self, texts, **kwargs):
+        embeddings = np.zeros((len(texts), 64), dtype='float32')
+        for i, text in enumerate(texts):
+            for char in text:
+                embeddings[i, ord(char) % 64] += 1
+        if self.noise:
+            embeddings += self.noise * self.rng.standard_normal(embeddings.shape).astype('float32')
+        return embeddings
+
+class TestEncoderService:
+    """Test cases for encoder backends and the parity check"""
+    
+    @pytest.fixture
+    def corpus(self):
+        return ['dat ve may bay', 'huy ve xe khach', 'hoan tien bao lau', 'check-in online']
+    
+    def test_mean_pool_ignores_padding(self):
+        """Test padded positions do not shift the average"""
+        token_embeddings = np.array([[[1.0, 1.0], [3.0, 3.0], [100.0, 100.0]]])
+        attention_mask = np.array([[1, 1, 0]])
+        
+        np.testing.assert_allclose(mean_pool(token_embeddings, attention_mask), [[2.0, 2.0]])
+    
+    def test_l2_normalize(self):
+        """Test rows are scaled to unit length"""
+        normalized = l2_normalize(np.array([[3.0, 4.0], [0.0, 0.0]]))
+        
+        np.testing.assert_allclose(normalized[0], [0.6, 0.8])
+        np.testing.assert_allclose(normalized[1], [0.0, 0.0])
+    
+    def test_compare_encoders_parity(self, corpus):
+        """Test a slightly perturbed backend passes and reports latency"""
+        reports = compare_encoders(
+            {"reference": FakeEncoder(), "close": FakeEncoder(noise=0.01)},
+            corpus, queries=['ve may bay', 'hoan tien'], reference="reference"
+        )
+        
+        assert reports["reference"]["cosine_min"] == pytest.approx(1.0)
+        assert reports["close"]["cosine_min"] > 0.99
+        assert reports["close"]["top1_agreement"] == 1.0
+        assert reports["close"]["parity_ok"] is True
+        assert reports["close"]["latency_ms_avg"] >= 0.0
+    
+    def test_compare_encoders_detects_drift(self, corpus):
+        """Test an unrelated backend fails the parity check"""
+        reports = compare_encoders(
+            {"reference": FakeEncoder(), "noisy": FakeEncoder(noise=50.0, seed=1)},
+            corpus, queries=corpus, reference="reference"
+        )
+        
+        assert reports["noisy"]["parity_ok"] is False
+    
+    def test_create_encoder_validates_backend(self):
+        """Test unknown backends and ONNX without a model directory are rejected"""
+        with pytest.raises(ValueError):
+            create_encoder("tensorflow", "model")
+        with pytest.raises(ValueError):
+            create_encoder("onnx", "model", onnx_dir=None)
+    
+    def test_encode_corpus_restores_order(self, corpus):
+        """Test length-sorted, parallel batches come back in input order"""
+        expected = FakeEncoder().encode(corpus)
+        
+        for workers in (1, 3):
+            embeddings = encode_corpus(FakeEncoder(), corpus, batch_size=1, workers=workers)
+            np.testing.assert_allclose(embeddings, expected)
+    
+    def test_cli_defaults_resolve_against_project_root(self, tmp_path, monkeypatch):
+        """Test the default ONNX directory does not depend on the working directory"""
+        monkeypatch.chdir(tmp_path)
+        
+        with patch('app.services.encoder_service.export_onnx', return_value={}) as mock_export:
+            main(["export"])
+        
+        assert mock_export.call_args[0][1] == DEFAULT_ONNX_DIR
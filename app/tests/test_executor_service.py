@@ -0,0 +1,71 @@
+import pytest
+import asyncio
+import threading
+import time
+import sys
+import os
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.executor_service import BoundedExecutor, ExecutorSaturatedError
+
+class TestBoundedExecutor:
+    """Test cases for Executor Service"""
+    
+    @pytest.fixture
+    def executor(self):
+        """Create a small executor for testing"""
+        executor = BoundedExecutor(max_workers=1, max_queue_depth=1)
+        yield executor
+        executor.shutdown()
+    
+    def test_run_returns_result(self, executor):
+        """Test awaiting work returns its result"""
+        result = asyncio.run(executor.run(sum, [1, 2, 3]))
+        
+        assert result == 6
+        assert executor.get_stats()["completed"] == 1
+    
+    def test_rejects_when_queue_full(self, executor):
+        """Test work beyond workers + queue depth is rejected"""
+        release = threading.Event()
+        running = executor.submit(release.wait)
+        queued = executor.submit(lambda: None)
+        
+        with pytest.raises(ExecutorSaturatedError):
+            executor.submit(lambda: None)
+        
+        stats = executor.get_stats()
+        assert stats["rejected"] == 1
+        assert stats["in_flight"] == 2
+        
+        release.set()
+        running.result()
+        queued.result()
+        deadline = time.monotonic() + 1
+        while executor.get_stats()["in_flight"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        
+        # Slots are freed once work finishes
+        assert executor.submit(lambda: 42).result() == 42
+    
+    def test_drops_work_that_waited_too_long(self):
+        """Test queued work past max_queue_wait is rejected without running"""
+        executor = BoundedExecutor(max_workers=1, max_queue_depth=1, max_queue_wait=0.05)
+        try:
+            release = threading.Event()
+            ran = []
+            running = executor.submit(release.wait)
+            queued = executor.submit(ran.append, 1)
+            time.sleep(0.1)
+            release.set()
+            running.result()
+            
+            with pytest.raises(ExecutorSaturatedError):
+                queued.result()
+            assert ran == []
+            assert executor.get_stats()["expired"] == 1
+            assert executor.submit(lambda: 42).result() == 42
+        finally:
+            executor.shutdown()
@@ -1,13 +1,17 @@
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import Mock, patch
 import sys
 import os
+import threading
+import time
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.services.faq_service import FAQService
-from app.models.schemas import FAQRequest, FAQResponse
+from app.services.rag_service import FastPathMiss
+from app.models.schemas import FAQRequest, FAQResponse, FAQBatchRequest, FAQBatchResponse
 
 class TestFAQService:
     """Test cases for FAQ Service"""
@@ -54,8 +58,8 @@ class TestFAQService:
         mock_confidence = 85.5
         mock_source = "Câu hỏi gốc"
         
-        with patch.object(faq_service.rag_service, 'get_answer', 
-                         return_value=(mock_answer, mock_confidence, mock_source)):
+        with patch.object(faq_service.rag_service, 'get_answers', 
+                         return_value=[(mock_answer, mock_confidence, mock_source)]):
             
             request = FAQRequest(question="Test question")
             response = faq_service.get_faq_answer(request)
@@ -72,7 +76,7 @@ class TestFAQService:
         faq_service.initialized = True
         
         # Mock RAG service to raise exception
-        with patch.object(faq_service.rag_service, 'get_answer', 
+        with patch.object(faq_service.rag_service, 'get_answers', 
                          side_effect=Exception("Test error")):
             
             request = FAQRequest(question="Test question")
@@ -83,6 +87,102 @@ class TestFAQService:
             assert response.confidence == 0.0
             assert response.processing_time >= 0
     
+    def test_answer_batch_uses_batch_path(self, faq_service):
+        """Test micro-batches of several questions use the batch RAG path"""
+        with patch.object(faq_service.rag_service, 'get_answers',
+                         return_value=[("A1", 90.0, "Q1"), ("A2", 80.0, "Q2")]) as mock_get_answers:
+            
+            results = faq_service.answer_batch(["Q1", "Q2"])
+            
+            mock_get_answers.assert_called_once_with(["Q1", "Q2"])
+            assert results[1] == ("A2", 80.0, "Q2")
+    
+    def test_fast_path_skips_the_batcher(self, faq_service):
+        """Test verbatim and decisive lexical matches are answered without waiting for a batch"""
+        faq_service.initialized = True
+        
+        miss = FastPathMiss("Something else", 0, [])
+        with patch.object(faq_service.rag_service, 'get_fast_answer',
+                          side_effect=[(("A1", 100.0, "Q1"), None), (None, miss)]), \
+             patch.object(faq_service.batcher, 'submit', return_value=("A2", 80.0, "Q2")) as mock_submit:
+            
+            assert faq_service.get_faq_answer(FAQRequest(question="Q1")).answer == "A1"
+            mock_submit.assert_not_called()
+            
+            # The miss, with its lexical hits, is what the batch answers
+            assert faq_service.get_faq_answer(FAQRequest(question="Something else")).answer == "A2"
+            mock_submit.assert_called_once_with(miss)
+    
+    def test_get_batching_stats(self, faq_service):
+        """Test batching stats are reported"""
+        stats = faq_service.get_batching_stats()
+        
+        assert stats["enabled"] is True
+        assert "batch_size_histogram" in stats
+    
+    def test_identical_questions_share_one_computation(self):
+        """Test concurrent identical questions (after normalization) are answered once"""
+        faq_service = FAQService(enable_batching=False)
+        faq_service.initialized = True
+        started = threading.Event()
+        release = threading.Event()
+        
+        def slow_answer(question):
+            started.set()
+            release.wait(5)
+            return ("Câu trả lời", 90.0, "Câu hỏi gốc")
+        
+        questions = ["Làm sao đổi vé?", "làm sao   đổi vé", "LÀM SAO ĐỔI VÉ..."]
+        with patch.object(faq_service.rag_service, 'get_answer', side_effect=slow_answer) as mock_get_answer:
+            with ThreadPoolExecutor(max_workers=len(questions)) as pool:
+                leader = pool.submit(faq_service.get_faq_answer, FAQRequest(question=questions[0]))
+                started.wait(5)
+                followers = [pool.submit(faq_service.get_faq_answer, FAQRequest(question=q)) for q in questions[1:]]
+                deadline = time.monotonic() + 5
+                while faq_service.get_single_flight_stats()["collapsed"] < 2 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                release.set()
+                responses = [leader.result()] + [future.result() for future in followers]
+        
+        assert mock_get_answer.call_count == 1
+        assert all(response is responses[0] for response in responses)
+        stats = faq_service.get_single_flight_stats()
+        assert stats["executed"] == 1
+        assert stats["collapsed"] == 2
+        assert stats["in_flight"] == 0
+    
+    def test_get_faq_answers_success(self, faq_service):
+        """Test successful batch FAQ answer retrieval"""
+        faq_service.initialized = True
+        
+        mock_answers = [
+            ("Câu trả lời 1", 90.0, "Câu hỏi 1"),
+            ("Câu trả lời 2", 75.0, "Câu hỏi 2")
+        ]
+        
+        with patch.object(faq_service.rag_service, 'get_answers',
+                         return_value=mock_answers) as mock_get_answers:
+            
+            request = FAQBatchRequest(questions=["Q1", "Q2"])
+            response = faq_service.get_faq_answers(request)
+            
+            mock_get_answers.assert_called_once_with(["Q1", "Q2"])
+            assert isinstance(response, FAQBatchResponse)
+            assert response.count == 2
+            assert response.results[0].answer == "Câu trả lời 1"
+            assert response.results[1].source_question == "Câu hỏi 2"
+            assert response.processing_time >= 0
+            assert all(result.processing_time >= 0 for result in response.results)
+    
+    def test_get_faq_answers_not_initialized(self, faq_service):
+        """Test batch FAQ answers when service not initialized"""
+        request = FAQBatchRequest(questions=["Q1", "Q2"])
+        
+        response = faq_service.get_faq_answers(request)
+        
+        assert response.count == 2
+        assert all("khởi tạo" in result.answer for result in response.results)
+    
     def test_get_all_faqs_not_initialized(self, faq_service):
         """Test getting all FAQs when service not initialized"""
         faqs = faq_service.get_all_faqs()
@@ -136,6 +236,22 @@ class TestFAQService:
             assert len(results) == 1
             assert results[0]['question'] == 'How to book?'
     
+    def test_search_faqs_accent_insensitive_paginated(self, faq_service):
+        """Test keyword search ignores diacritics and pages ranked results"""
+        faq_service.initialized = True
+        
+        import pandas as pd
+        faq_service.rag_service.faq_data = pd.DataFrame({
+            'question': ['Cách đổi vé?', 'Đổi giờ khởi hành được không?', 'Hủy vé thế nào?'],
+            'answer': ['Answer 1', 'Answer 2', 'Có thể đổi sang chuyến khác']
+        })
+        
+        results = faq_service.search_faqs("doi", limit=2)
+        
+        assert [result['question'] for result in results] == ['Đổi giờ khởi hành được không?', 'Cách đổi vé?']
+        assert faq_service.search_faqs("doi", limit=2, offset=2)[0]['question'] == 'Hủy vé thế nào?'
+        assert faq_service.search_faqs_page("doi", limit=2)["total"] == 3
+    
     def test_search_faqs_no_matches(self, faq_service):
         """Test FAQ search with no matches"""
         # Mock initialized service with FAQ data
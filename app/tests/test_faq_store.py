@@ -0,0 +1,37 @@
+import pytest
+import pandas as pd
+from app.services.faq_store import FAQStore
+
+class TestFAQStore:
+    """Test cases for the compact FAQ store"""
+    
+    def test_from_dataframe(self):
+        """Test rows keep CSV order and read like records"""
+        store = FAQStore.from_dataframe(pd.DataFrame({
+            'question': ['Cách đặt vé?', 'Cách hủy vé?'],
+            'answer': ['Đặt qua app', None]
+        }))
+        
+        assert len(store) == 2
+        assert store[0].question == 'Cách đặt vé?'
+        assert store[0]['answer'] == 'Đặt qua app'
+        assert store[1].answer == ''
+        assert store[1].to_dict() == {'question': 'Cách hủy vé?', 'answer': ''}
+        assert store.questions == ('Cách đặt vé?', 'Cách hủy vé?')
+    
+    def test_duplicate_strings_are_shared(self):
+        """Test repeated answers are stored once"""
+        store = FAQStore(['a', 'b'], [''.join(['same ', 'answer']), ''.join(['same ', 'answer'])])
+        
+        assert store.answers[0] is store.answers[1]
+    
+    def test_records_have_no_instance_dict(self):
+        """Test records are slot-only"""
+        store = FAQStore(['a'], ['b'])
+        
+        assert not hasattr(store[0], '__dict__')
+    
+    def test_requires_question_column(self):
+        """Test ingest rejects data without questions"""
+        with pytest.raises(ValueError):
+            FAQStore.from_dataframe(pd.DataFrame({'answer': ['b']}))
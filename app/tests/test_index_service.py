@@ -0,0 +1,71 @@
+import pytest
+import numpy as np
+import sys
+import os
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.index_service import (
+    build_index, get_index_type, resolve_index_params, evaluate_index, compare_index_configs
+)
+
+class TestIndexService:
+    """Test cases for Index Service"""
+    
+    @pytest.fixture
+    def embeddings(self):
+        """Create normalized random embeddings"""
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((300, 32)).astype('float32')
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    
+    @pytest.mark.parametrize("index_type, params", [
+        ("flat", {}),
+        ("hnsw", {"M": 8, "efSearch": 32}),
+        ("ivf", {"nlist": 8, "nprobe": 8}),
+        ("ivfpq", {"nlist": 4, "nprobe": 4, "pq_m": 8})
+    ])
+    def test_build_index_types(self, embeddings, index_type, params):
+        """Test every index type builds, trains and finds the query itself"""
+        index = build_index(embeddings, index_type, params)
+        
+        assert index.ntotal == len(embeddings)
+        assert get_index_type(index) == index_type
+        _, ids = index.search(embeddings[:5], 1)
+        if index_type != "ivfpq":
+            assert list(ids[:, 0]) == [0, 1, 2, 3, 4]
+    
+    def test_ivf_nlist_clamped_to_rows(self, embeddings):
+        """Test nlist larger than the corpus is clamped"""
+        index = build_index(embeddings[:20], "ivf", {"nlist": 1024, "nprobe": 2048})
+        
+        assert index.nlist == 20
+        assert index.nprobe == 20
+    
+    def test_unknown_index_type(self):
+        """Test invalid index types are rejected"""
+        with pytest.raises(ValueError):
+            resolve_index_params("annoy")
+    
+    def test_evaluate_flat_has_full_recall(self, embeddings):
+        """Test the exact index has recall 1.0 against itself"""
+        index = build_index(embeddings, "flat")
+        
+        report = evaluate_index(index, embeddings, embeddings[:50], k=5)
+        
+        assert report["recall_at_5"] == pytest.approx(1.0)
+        assert report["num_queries"] == 50
+        assert report["latency_ms_avg"] >= 0
+    
+    def test_compare_index_configs(self, embeddings):
+        """Test configs are evaluated side by side"""
+        reports = compare_index_configs(
+            embeddings,
+            [{"index_type": "flat"}, {"index_type": "hnsw", "params": {"M": 8}}],
+            k=3
+        )
+        
+        assert [report["index_type"] for report in reports] == ["flat", "hnsw"]
+        assert all(0.0 <= report["recall_at_3"] <= 1.0 for report in reports)
+        assert reports[1]["params"]["M"] == 8
@@ -0,0 +1,96 @@
+import pytest
+from app.services.lexical_service import BM25Index, KeywordIndex, LexicalIndex
+
+class TestLexicalIndex:
+    """Test cases for the BM25 lexical index"""
+    
+    @pytest.fixture
+    def lexical_index(self):
+        """Create a lexical index over sample FAQ rows"""
+        return LexicalIndex(
+            [
+                'Làm thế nào để đặt vé máy bay?',
+                'Cách check-in online như thế nào?',
+                'Thời gian hoàn tiền trong bao lâu?'
+            ],
+            [
+                'Bạn có thể đặt vé qua website hoặc app Vexere...',
+                'Check-in online từ 24h trước giờ bay...',
+                'Thời gian hoàn tiền từ 1-14 ngày...'
+            ]
+        )
+    
+    def test_search_ignores_diacritics(self, lexical_index):
+        """Test accented and unaccented queries find the same row"""
+        accented = lexical_index.search("hoàn tiền")
+        unaccented = lexical_index.search("hoan tien")
+        
+        assert accented[0][0] == 2
+        assert [row for row, _, _ in accented] == [row for row, _, _ in unaccented]
+        assert accented[0][2] == pytest.approx(1.0)
+    
+    def test_search_ranks_phrase_matches_first(self, lexical_index):
+        """Test bigram matches outrank scattered syllables"""
+        results = lexical_index.search("đặt vé máy bay")
+        
+        assert results[0][0] == 0
+        assert all(results[0][1] >= score for _, score, _ in results)
+    
+    def test_search_no_match(self, lexical_index):
+        """Test unknown terms return no rows"""
+        assert lexical_index.search("xyz") == []
+        assert lexical_index.search("") == []
+    
+    def test_search_top_k(self, lexical_index):
+        """Test the result count is capped"""
+        assert len(lexical_index.search("thế nào bay", top_k=1)) == 1
+    
+    def test_coverage_counts_missing_terms(self):
+        """Test coverage drops when query syllables are absent from the document"""
+        index = BM25Index(['đặt vé', 'hủy vé'])
+        terms = index.tokenize('đặt vé xe')
+        
+        assert 0.0 < index.coverage(terms, 0) < 1.0
+        assert index.coverage(terms, 0) > index.coverage(terms, 1)
+
+class TestKeywordIndex:
+    """Test cases for the trigram keyword index"""
+    
+    @pytest.fixture
+    def keyword_index(self):
+        """Create a keyword index over sample FAQ records"""
+        return KeywordIndex([
+            {'question': 'Làm thế nào để đặt vé máy bay?', 'answer': 'Đặt vé qua website hoặc app Vexere'},
+            {'question': 'Cách hủy vé như thế nào?', 'answer': 'Hủy vé trong mục Quản lý đặt chỗ'},
+            {'question': 'Thời gian hoàn tiền trong bao lâu?', 'answer': 'Từ 1-14 ngày sau khi hủy vé'}
+        ])
+    
+    def test_search_accent_insensitive(self, keyword_index):
+        """Test unaccented keywords match accented text"""
+        total, results = keyword_index.search("hoan tien")
+        
+        assert total == 1
+        assert results[0]['question'] == 'Thời gian hoàn tiền trong bao lâu?'
+    
+    def test_search_ranks_question_matches_first(self, keyword_index):
+        """Test question matches come before answer-only matches"""
+        total, results = keyword_index.search("hủy vé")
+        
+        assert total == 2
+        assert results[0]['question'] == 'Cách hủy vé như thế nào?'
+        assert results[1]['question'] == 'Thời gian hoàn tiền trong bao lâu?'
+    
+    def test_search_pagination(self, keyword_index):
+        """Test limit/offset page through the ranked matches"""
+        total, first_page = keyword_index.search("vé", limit=2)
+        _, second_page = keyword_index.search("vé", limit=2, offset=2)
+        
+        assert total == 3
+        assert len(first_page) == 2
+        assert len(second_page) == 1
+        assert second_page[0] not in first_page
+    
+    def test_search_no_match(self, keyword_index):
+        """Test a keyword whose trigrams are all present but not adjacent"""
+        assert keyword_index.search("tien bay") == (0, [])
+        assert keyword_index.search("xyz") == (0, [])
@@ -0,0 +1,129 @@
+import pytest
+import sys
+import os
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.metrics_service import Counter, Histogram, MetricsRegistry
+
+class TestCounter:
+    """Test cases for labelled counters"""
+    
+    def test_inc_and_render(self):
+        """Test counts are kept per label value and rendered in the text format"""
+        counter = Counter("test_total", "Test counter", ("outcome",))
+        counter.inc(outcome="success")
+        counter.inc(2, outcome="success")
+        counter.inc(outcome="not_found")
+        
+        assert counter.get(outcome="success") == 3
+        rendered = counter.render()
+        assert "# TYPE test_total counter" in rendered
+        assert 'test_total{outcome="success"} 3' in rendered
+        assert 'test_total{outcome="not_found"} 1' in rendered
+    
+    def test_label_mismatch(self):
+        """Test unknown or missing labels are rejected"""
+        counter = Counter("test_total", "Test counter", ("outcome",))
+        
+        with pytest.raises(ValueError):
+            counter.inc(status="success")
+        with pytest.raises(ValueError):
+            counter.inc()
+    
+    def test_label_escaping(self):
+        """Test quotes and newlines in label values are escaped"""
+        counter = Counter("test_total", "Test counter", ("route",))
+        counter.inc(route='a"b\nc')
+        
+        assert 'test_total{route="a\\"b\\nc"} 1' in counter.render()
+
+class TestHistogram:
+    """Test cases for latency histograms"""
+    
+    def test_buckets_are_cumulative(self):
+        """Test bucket counts, sum and count"""
+        histogram = Histogram("test_seconds", "Test histogram", ("stage",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value, stage="encode")
+        
+        rendered = histogram.render()
+        assert 'test_seconds_bucket{stage="encode",le="0.1"} 2' in rendered
+        assert 'test_seconds_bucket{stage="encode",le="1"} 3' in rendered
+        assert 'test_seconds_bucket{stage="encode",le="+Inf"} 4' in rendered
+        assert 'test_seconds_sum{stage="encode"} 2.65' in rendered
+        assert 'test_seconds_count{stage="encode"} 4' in rendered
+    
+    def test_time_context_manager(self):
+        """Test the timer observes once even when the block raises"""
+        histogram = Histogram("test_seconds", "Test histogram", ("stage",))
+        
+        with histogram.time(stage="search"):
+            pass
+        with pytest.raises(RuntimeError):
+            with histogram.time(stage="search"):
+                raise RuntimeError("boom")
+        
+        assert histogram.get_count(stage="search") == 2
+
+class TestMetricsRegistry:
+    """Test cases for the metrics registry"""
+    
+    def test_register_returns_existing(self):
+        """Test registering the same metric twice returns the first one"""
+        registry = MetricsRegistry()
+        first = registry.counter("test_total", "Test counter", ("outcome",))
+        
+        assert registry.counter("test_total", "Test counter", ("outcome",)) is first
+        with pytest.raises(ValueError):
+            registry.histogram("test_total", "Test histogram")
+    
+    def test_render_all(self):
+        """Test all metrics are rendered, newline terminated"""
+        registry = MetricsRegistry()
+        registry.counter("a_total", "A").inc()
+        registry.histogram("b_seconds", "B").observe(0.01)
+        
+        rendered = registry.render()
+        assert "a_total 1" in rendered
+        assert "b_seconds_count 1" in rendered
+        assert rendered.endswith("\n")
+    
+    def test_render_all_sums_processes(self, tmp_path):
+        """Test published snapshots of other workers are added to this process's values"""
+        def worker_registry():
+            registry = MetricsRegistry()
+            registry.counter("a_total", "A", ("outcome",))
+            registry.histogram("b_seconds", "B", buckets=(0.1, 1.0))
+            return registry
+        
+        other = worker_registry()
+        other.counter("a_total", "A", ("outcome",)).inc(2, outcome="ok")
+        other.histogram("b_seconds", "B").observe(0.5)
+        other.write_snapshot(str(tmp_path), pid=1)
+        
+        registry = worker_registry()
+        registry.counter("a_total", "A", ("outcome",)).inc(outcome="ok")
+        registry.counter("a_total", "A", ("outcome",)).inc(outcome="error")
+        registry.histogram("b_seconds", "B").observe(0.05)
+        
+        rendered = registry.render_all(str(tmp_path))
+        assert 'a_total{outcome="ok"} 3' in rendered
+        assert 'a_total{outcome="error"} 1' in rendered
+        assert 'b_seconds_bucket{le="0.1"} 1' in rendered
+        assert 'b_seconds_bucket{le="1"} 2' in rendered
+        assert "b_seconds_count 2" in rendered
+        # This process published its own snapshot too, and its live values are untouched
+        assert sorted(os.listdir(tmp_path)) == sorted(["metrics_1.json", f"metrics_{os.getpid()}.json"])
+        assert registry.counter("a_total", "A", ("outcome",)).get(outcome="ok") == 1
+    
+    def test_clear_drops_inherited_values(self):
+        """Test a forked worker can start from zero"""
+        registry = MetricsRegistry()
+        registry.counter("a_total", "A").inc()
+        
+        registry.clear()
+        
+        assert "a_total 1" not in registry.render()
+
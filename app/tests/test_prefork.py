@@ -0,0 +1,177 @@
+import pytest
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from app.prefork import THREAD_ENV_VARS, cap_threads, default_threads_per_worker, format_memory_report, memory_report, read_memory
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# A FAQ app with a deterministic encoder; /state reports what the answering worker serves.
+# The handler blocks its worker's event loop, so a request sent meanwhile is taken by another worker.
+PREFORK_APP = """
+import hashlib
+import os
+import time
+import numpy as np
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from app.services.faq_service import FAQService
+from app.services.metrics_service import METRICS_DIR_ENV, REGISTRY
+
+class HashEncoder:
+    def encode(self, texts):
+        return np.array([list(hashlib.sha256(text.encode()).digest()[:16]) for text in texts], dtype='float32')
+
+faq_service = FAQService(enable_batching=False)
+rag_service = faq_service.rag_service
+rag_service.csv_path = os.environ["PREFORK_TEST_CSV"]
+rag_service.set_artifact_dir(os.environ["PREFORK_TEST_ARTIFACTS"])
+rag_service.model = HashEncoder()
+STATE_REQUESTS = REGISTRY.counter("prefork_test_state_requests_total", "Requests to /state")
+app = FastAPI()
+
+@app.get("/state")
+async def state():
+    STATE_REQUESTS.inc()
+    time.sleep(1.0)
+    snapshot = rag_service.snapshot
+    return {
+        "pid": os.getpid(),
+        "rows": len(snapshot.faq_data),
+        "source_hash": snapshot.source_hash,
+        "embeddings_file": getattr(snapshot.embeddings, "filename", None)
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return REGISTRY.render_all(os.environ[METRICS_DIR_ENV])
+"""
+
+class TestPrefork:
+    """Test cases for the pre-fork launcher helpers"""
+    
+    def test_cap_threads_sets_environment(self, monkeypatch):
+        """Test thread caps are exported for runtimes not yet started"""
+        for var in THREAD_ENV_VARS:
+            monkeypatch.delenv(var, raising=False)
+        
+        cap_threads(2)
+        
+        assert all(os.environ[var] == "2" for var in THREAD_ENV_VARS)
+    
+    def test_default_threads_per_worker(self):
+        """Test cores are split between workers, at least one each"""
+        assert default_threads_per_worker(1) == (os.cpu_count() or 1)
+        assert default_threads_per_worker(10 ** 6) == 1
+    
+    @pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="needs Linux /proc")
+    def test_memory_report(self):
+        """Test the report compares shared workers with standalone processes"""
+        assert read_memory()["rss"] > 0
+        
+        report = memory_report(os.getpid(), [os.getpid(), os.getpid()])
+        
+        assert len(report["workers"]) == 1
+        assert report["one_process_per_worker_mb"] == pytest.approx(2 * report["master"]["rss"], rel=0.1)
+        assert "Total (PSS)" in format_memory_report(report)
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+class TestPreforkServer:
+    """Test the launcher with real forked workers"""
+    
+    @pytest.fixture
+    def server(self, tmp_path):
+        """Run a two-worker pre-fork server on a free port"""
+        pytest.importorskip("uvicorn")
+        (tmp_path / "prefork_app.py").write_text(PREFORK_APP)
+        csv_path = tmp_path / "faq.csv"
+        csv_path.write_text("question,answer\nQ1?,A1\nQ2?,A2\nQ3?,A3\n")
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(tmp_path), ROOT_DIR]),
+                   PREFORK_TEST_CSV=str(csv_path), PREFORK_TEST_ARTIFACTS=str(tmp_path / "artifacts"))
+        env.pop("FAQ_WATCH_INTERVAL", None)
+        code = (f"from app.prefork import PreforkServer; "
+                f"PreforkServer('prefork_app:app', '127.0.0.1', {port}, workers=2, threads_per_worker=1, "
+                f"report_after=0).run()")
+        with open(tmp_path / "server.log", "w") as log:
+            process = subprocess.Popen([sys.executable, "-c", code], cwd=ROOT_DIR, env=env,
+                                       stdout=log, stderr=subprocess.STDOUT)
+        
+        url = f"http://127.0.0.1:{port}/state"
+        deadline = time.time() + 60
+        while True:
+            try:
+                urllib.request.urlopen(url, timeout=5).read()
+                break
+            except OSError:
+                if process.poll() is not None or time.time() > deadline:
+                    pytest.fail((tmp_path / "server.log").read_text())
+                time.sleep(0.2)
+        
+        yield process, url, csv_path, tmp_path / "artifacts"
+        
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+    
+    def worker_states(self, url):
+        """States of two different workers: the second request arrives while the first blocks its worker"""
+        states = [None, None]
+        
+        def get(i):
+            states[i] = json.loads(urllib.request.urlopen(url, timeout=10).read())
+        
+        threads = [threading.Thread(target=get, args=(i,)) for i in range(2)]
+        threads[0].start()
+        time.sleep(0.3)
+        threads[1].start()
+        for thread in threads:
+            thread.join()
+        return states
+    
+    def test_workers_share_the_master_reload(self, server):
+        """Test both workers serve the master's snapshot and reopen the artifacts it rebuilds"""
+        process, url, csv_path, artifact_dir = server
+        
+        first, second = self.worker_states(url)
+        assert first["pid"] != second["pid"]
+        assert first["rows"] == second["rows"] == 3
+        assert first["source_hash"] == second["source_hash"]
+        
+        # The master rebuilds once; the workers map the files it published instead of re-encoding
+        csv_path.write_text("question,answer\nQ1?,A1\nQ2?,A2\nQ3?,A3\nQ4?,A4\n")
+        process.send_signal(signal.SIGHUP)
+        
+        deadline = time.time() + 30
+        while True:
+            states = self.worker_states(url)
+            if all(state["rows"] == 4 for state in states) or time.time() > deadline:
+                break
+        
+        assert states[0]["pid"] != states[1]["pid"]
+        assert all(state["rows"] == 4 for state in states)
+        assert states[0]["source_hash"] == states[1]["source_hash"] != first["source_hash"]
+        assert {state["embeddings_file"] for state in states} == {str(artifact_dir / "faq_embeddings.npy")}
+        assert not [name for name in os.listdir(artifact_dir) if name.endswith(".tmp")]
+    
+    def test_metrics_are_totals_of_all_workers(self, server):
+        """Test /metrics reports the requests served by every worker, whichever worker answers"""
+        process, url, _, _ = server
+        
+        # One request from the startup probe, then one on each worker
+        first, second = self.worker_states(url)
+        assert first["pid"] != second["pid"]
+        time.sleep(2.5)
+        
+        metrics_url = url.replace("/state", "/metrics")
+        for _ in range(3):
+            metrics = urllib.request.urlopen(metrics_url, timeout=10).read().decode()
+            assert "prefork_test_state_requests_total 3" in metrics.splitlines()
@@ -0,0 +1,135 @@
+import pytest
+import sys
+import os
+import threading
+import time
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.schemas import FAQRequest
+from app.services import profiler_service
+from app.services.faq_service import FAQService
+from app.services.profiler_service import ProfilerBusyError, StackSampler, TraceStore, collapse_stack, profile, traced
+
+def busy_loop(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+class TestStackSampler:
+    """Test cases for the stack sampler"""
+    
+    def test_collapse_stack_root_first(self):
+        """Test stacks are rendered root-first with the pool name and no spaces"""
+        def inner():
+            return collapse_stack(sys._getframe(), "faq-worker_3")
+        
+        stack = inner()
+        frames = stack.split(";")
+        
+        assert frames[0] == "faq-worker"
+        assert frames[-1] == "test_profiler_service.py:inner"
+        assert frames[-2] == "test_profiler_service.py:test_collapse_stack_root_first"
+        assert " " not in stack
+    
+    def test_samples_selected_threads(self):
+        """Test only the selected threads are sampled and output is in collapsed format"""
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_loop, args=(stop,), name="busy")
+        worker.start()
+        try:
+            sampler = StackSampler(interval=0.001, thread_ids=[worker.ident]).start()
+            time.sleep(0.05)
+            sampler.stop()
+        finally:
+            stop.set()
+            worker.join()
+        
+        lines = sampler.collapsed().splitlines()
+        assert sampler.samples > 0
+        assert lines
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            assert stack.startswith("busy;")
+            assert "busy_loop" in stack
+            assert int(count) > 0
+    
+    def test_profile_one_at_a_time(self):
+        """Test a second concurrent profile is rejected"""
+        profiler_service._profile_lock.acquire()
+        try:
+            with pytest.raises(ProfilerBusyError):
+                profile(0.01)
+        finally:
+            profiler_service._profile_lock.release()
+        
+        assert profile(0.01, interval=0.001).samples > 0
+
+class TestRequestTrace:
+    """Test cases for per-request tracing"""
+    
+    def test_traced_is_noop_without_trace(self):
+        """Test untraced requests get the original function back"""
+        assert traced(busy_loop) is busy_loop
+    
+    def test_trace_follows_worker_thread(self):
+        """Test a traced function is sampled in the thread it runs in"""
+        store = TraceStore(max_traces=1)
+        trace = store.start(interval=0.001)
+        
+        def slow_work():
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                pass
+        
+        worker = threading.Thread(target=traced(slow_work), name="faq-worker_0")
+        worker.start()
+        worker.join()
+        store.finish(trace)
+        
+        assert traced(busy_loop) is busy_loop
+        assert store.get(trace.trace_id) is trace
+        assert "faq-worker;" in trace.sampler.collapsed()
+        assert "slow_work" in trace.sampler.collapsed()
+    
+    def test_trace_follows_question_into_micro_batch(self):
+        """Test a traced ask shows the encode work done on the micro-batcher thread"""
+        faq_service = FAQService(enable_single_flight=False)
+        faq_service.initialized = True
+        
+        def encode(questions):
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                pass
+        
+        def get_answers(questions):
+            encode(questions)
+            return [("Câu trả lời", 90.0, "Câu hỏi gốc") for _ in questions]
+        
+        store = TraceStore(max_traces=1)
+        with patch.object(faq_service.rag_service, 'get_fast_answer', return_value=(None, "Đổi vé thế nào?")), \
+             patch.object(faq_service.rag_service, 'get_answers', side_effect=get_answers):
+            trace = store.start(interval=0.001)
+            worker = threading.Thread(target=traced(faq_service.get_faq_answer),
+                                      args=(FAQRequest(question="Đổi vé thế nào?"),), name="faq-worker_0")
+            worker.start()
+            worker.join()
+            store.finish(trace)
+        
+        collapsed = trace.sampler.collapsed()
+        assert "faq-micro-batcher;" in collapsed
+        assert "get_answers" in collapsed
+        assert "encode" in collapsed
+    
+    def test_store_keeps_recent_traces(self):
+        """Test the oldest traces are dropped beyond max_traces"""
+        store = TraceStore(max_traces=2)
+        traces = []
+        for _ in range(3):
+            trace = store.start()
+            store.finish(trace)
+            traces.append(trace)
+        
+        assert store.get(traces[0].trace_id) is None
+        assert list(store.list()) == [traces[1].trace_id, traces[2].trace_id]
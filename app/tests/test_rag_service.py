@@ -8,7 +8,8 @@ import os
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.services.rag_service import RAGService
+from app.services.rag_service import FastPathMiss, RAGService, main, verify_artifact
+from app.services.index_service import get_index_type
 
 class TestRAGService:
     """Test cases for RAG Service"""
@@ -84,6 +85,269 @@ class TestRAGService:
         assert os.path.exists(rag_service.embeddings_path)
         assert os.path.exists(rag_service.index_path)
     
+    def test_create_embeddings_hnsw_and_evaluate(self, sample_faq_data, tmp_path):
+        """Test a configured ANN index type is built and can be evaluated"""
+        rag_service = RAGService(index_type="hnsw", index_params={"M": 8})
+        mock_model = Mock()
+        mock_model.encode.return_value = np.random.rand(3, 384)
+        rag_service.model = mock_model
+        rag_service.faq_data = sample_faq_data
+        rag_service.embeddings_path = str(tmp_path / "test_embeddings.pkl")
+        rag_service.index_path = str(tmp_path / "test_index.faiss")
+        
+        assert rag_service.create_embeddings() is True
+        assert get_index_type(rag_service.index) == "hnsw"
+        
+        reports = rag_service.evaluate_index(configs=[{"index_type": "flat"}], k=2)
+        assert reports[0]["recall_at_2"] == pytest.approx(1.0)
+        
+        # A stored index of another type is not reused
+        flat_service = RAGService()
+        flat_service.embeddings_path = rag_service.embeddings_path
+        flat_service.index_path = rag_service.index_path
+        assert flat_service.load_embeddings() is False
+    
+    def test_evaluate_live_index(self, rag_service, sample_faq_data, tmp_path):
+        """Test the live ID-mapped index is scored against the same distinct questions"""
+        faq_data = pd.concat([sample_faq_data, sample_faq_data.iloc[:1]], ignore_index=True)
+        mock_model = Mock()
+        mock_model.encode.return_value = np.random.default_rng(0).random((4, 384))
+        rag_service.model = mock_model
+        rag_service.faq_data = faq_data
+        rag_service.embeddings_path = str(tmp_path / "test_embeddings.npy")
+        rag_service.index_path = str(tmp_path / "test_index.faiss")
+        
+        assert rag_service.create_embeddings() is True
+        
+        reports = rag_service.evaluate_index(k=2)
+        assert reports[0]["index_type"] == "flat"
+        assert reports[0]["num_queries"] == 3
+        assert reports[0]["recall_at_2"] == pytest.approx(1.0)
+    
+    def test_save_and_load_mmap_artifacts(self, rag_service, sample_faq_data, tmp_path):
+        """Test embeddings round-trip through a memory-mapped .npy and manifest"""
+        csv_file = tmp_path / "test_faq.csv"
+        sample_faq_data.to_csv(csv_file, index=False)
+        rag_service.load_faq_data(str(csv_file))
+        mock_model = Mock()
+        mock_model.encode.return_value = np.random.rand(3, 384)
+        rag_service.model = mock_model
+        rag_service.embeddings_path = str(tmp_path / "faq_embeddings.npy")
+        rag_service.index_path = str(tmp_path / "faq_index.faiss")
+        
+        assert rag_service.create_embeddings() is True
+        manifest = rag_service.load_manifest()
+        assert manifest["dimension"] == 384
+        assert manifest["row_count"] == 3
+        assert manifest["model_name"] == rag_service.model_name
+        assert manifest["source_sha256"] == rag_service.source_hash
+        
+        rag_service.index = None
+        assert rag_service.load_embeddings() is True
+        assert isinstance(rag_service.embeddings, np.memmap)
+        assert rag_service.index.ntotal == 3
+        np.testing.assert_allclose(np.linalg.norm(rag_service.embeddings, axis=1), 1.0, rtol=1e-5)
+    
+    def test_load_embeddings_rejects_other_encoder_backend(self, rag_service, sample_faq_data, tmp_path):
+        """Test artifacts built by one encoder backend are not served with another"""
+        mock_model = Mock()
+        mock_model.encode.return_value = np.random.rand(3, 384)
+        rag_service.model = mock_model
+        rag_service.faq_data = sample_faq_data
+        rag_service.embeddings_path = str(tmp_path / "faq_embeddings.npy")
+        rag_service.index_path = str(tmp_path / "faq_index.faiss")
+        assert rag_service.create_embeddings() is True
+        
+        onnx_service = RAGService(encoder_backend="onnx-int8")
+        onnx_service.embeddings_path = rag_service.embeddings_path
+        onnx_service.index_path = rag_service.index_path
+        
+        assert onnx_service.load_embeddings() is False
+    
+    def test_load_embeddings_reembeds_only_changed_rows(self, rag_service, sample_faq_data, tmp_path):
+        """Test a CSV edit re-encodes only added/changed questions and patches the index"""
+        csv_file = tmp_path / "test_faq.csv"
+        sample_faq_data.to_csv(csv_file, index=False)
+        rag_service.load_faq_data(str(csv_file))
+        mock_model = Mock()
+        mock_model.encode.return_value = np.random.rand(3, 384)
+        rag_service.model = mock_model
+        rag_service.embeddings_path = str(tmp_path / "faq_embeddings.npy")
+        rag_service.index_path = str(tmp_path / "faq_index.faiss")
+        rag_service.create_embeddings()
+        kept_vector = np.array(rag_service.embeddings[1])
+        
+        # Answer-only edit: nothing to re-encode
+        sample_faq_data.loc[0, 'answer'] = 'Câu trả lời mới'
+        sample_faq_data.to_csv(csv_file, index=False)
+        rag_service.load_faq_data(str(csv_file))
+        mock_model.encode.reset_mock()
+        assert rag_service.load_embeddings() is True
+        mock_model.encode.assert_not_called()
+        
+        # One question changed, one added
+        sample_faq_data.loc[0, 'question'] = 'Làm sao để đổi vé?'
+        edited = pd.concat([sample_faq_data, pd.DataFrame({
+            'question': ['Hành lý ký gửi bao nhiêu kg?'], 'answer': ['20kg']
+        })], ignore_index=True)
+        edited.to_csv(csv_file, index=False)
+        rag_service.load_faq_data(str(csv_file))
+        mock_model.encode.return_value = np.random.rand(2, 384)
+        
+        assert rag_service.load_embeddings() is True
+        mock_model.encode.assert_called_once_with(['Làm sao để đổi vé?', 'Hành lý ký gửi bao nhiêu kg?'])
+        assert rag_service.index.ntotal == 4
+        np.testing.assert_allclose(rag_service.embeddings[1], kept_vector)
+        
+        # Searching a stored vector maps back to its row in the edited data
+        results = rag_service.search_embeddings(np.array(rag_service.embeddings[3:4], dtype='float32'), top_k=1)
+        assert results[0][0][0] == 3
+        
+        # The patched artifact loads as-is next time
+        mock_model.encode.reset_mock()
+        assert rag_service.load_embeddings() is True
+        mock_model.encode.assert_not_called()
+    
+    def test_build_cli_artifact_is_relocatable_and_read_only(self, sample_faq_data, tmp_path):
+        """Test an offline-built artifact loads read-only from another location"""
+        csv_file = tmp_path / "faq.csv"
+        sample_faq_data.to_csv(csv_file, index=False)
+        build_dir = tmp_path / "build"
+        
+        mock_model = Mock(spec=['encode'])
+        mock_model.encode.side_effect = lambda texts, **kwargs: np.random.rand(len(texts), 384)
+        with patch('app.services.rag_service.SentenceTransformer', return_value=mock_model):
+            assert main(["build", "--csv", str(csv_file), "--out", str(build_dir), "--workers", "2",
+                         "--batch-size", "2"]) == 0
+        
+        # Move the artifact and serve it from the new location
+        served_dir = tmp_path / "mounted" / "faq"
+        served_dir.parent.mkdir()
+        os.rename(build_dir, served_dir)
+        assert verify_artifact(str(served_dir))["ok"] is True
+        files_before = {name: os.path.getmtime(served_dir / name) for name in os.listdir(served_dir)}
+        
+        rag_service = RAGService(artifact_dir=str(served_dir))
+        rag_service.model = mock_model
+        csv_file.unlink()
+        
+        assert rag_service.read_only is True
+        assert rag_service.initialize() is True
+        assert len(rag_service.faq_data) == 3
+        assert rag_service.index.ntotal == 3
+        assert {name: os.path.getmtime(served_dir / name) for name in os.listdir(served_dir)} == files_before
+    
+    def test_read_only_artifact_is_not_rebuilt(self, rag_service, sample_faq_data, tmp_path):
+        """Test a read-only server refuses stale artifacts instead of rewriting them"""
+        csv_file = tmp_path / "faq.csv"
+        sample_faq_data.to_csv(csv_file, index=False)
+        mock_model = Mock(spec=['encode'])
+        mock_model.encode.side_effect = lambda texts, **kwargs: np.random.rand(len(texts), 384)
+        rag_service.model = mock_model
+        rag_service.build_artifact(str(csv_file), str(tmp_path / "artifact"))
+        
+        served = RAGService(artifact_dir=str(tmp_path / "artifact"))
+        served.model = mock_model
+        sample_faq_data.loc[0, 'question'] = 'Câu hỏi mới?'
+        sample_faq_data.to_csv(csv_file, index=False)
+        served.load_faq_data(str(csv_file))
+        
+        assert served.load_embeddings() is False
+        assert verify_artifact(str(tmp_path / "artifact"))["ok"] is True
+    
+    def test_reload_swaps_snapshot_atomically(self, rag_service, sample_faq_data, tmp_path):
+        """Test a reload builds a new snapshot aside and leaves the old one intact"""
+        csv_file = tmp_path / "test_faq.csv"
+        sample_faq_data.to_csv(csv_file, index=False)
+        rag_service.load_faq_data(str(csv_file))
+        mock_model = Mock()
+        mock_model.encode.return_value = np.random.rand(3, 384)
+        rag_service.model = mock_model
+        rag_service.embeddings_path = str(tmp_path / "faq_embeddings.npy")
+        rag_service.index_path = str(tmp_path / "faq_index.faiss")
+        rag_service.create_embeddings()
+        old_snapshot = rag_service.snapshot
+        
+        assert rag_service.reload()["status"] == "unchanged"
+        
+        edited = pd.concat([sample_faq_data, pd.DataFrame({
+            'question': ['Hành lý ký gửi bao nhiêu kg?'], 'answer': ['20kg']
+        })], ignore_index=True)
+        edited.to_csv(csv_file, index=False)
+        mock_model.encode.return_value = np.random.rand(1, 384)
+        
+        result = rag_service.reload()
+        
+        assert result["status"] == "reloaded"
+        assert result["reembedded"] == 1
+        assert rag_service.snapshot.version > old_snapshot.version
+        assert len(rag_service.faq_data) == 4
+        assert rag_service.index.ntotal == 4
+        # In-flight readers of the old snapshot are unaffected
+        assert len(old_snapshot.faq_data) == 3
+        assert old_snapshot.index.ntotal == 3
+        assert rag_service.last_reload["status"] == "reloaded"
+    
+    def test_reload_missing_csv(self, rag_service):
+        """Test a failed reload keeps serving the current snapshot"""
+        snapshot = rag_service.snapshot
+        
+        result = rag_service.reload("non_existent_file.csv")
+        
+        assert result["status"] == "error"
+        assert rag_service.snapshot is snapshot
+    
+    def test_reopen_published_artifacts(self, rag_service, sample_faq_data, tmp_path):
+        """Test another process picks up a rebuilt artifact without encoding anything"""
+        csv_file = tmp_path / "test_faq.csv"
+        sample_faq_data.to_csv(csv_file, index=False)
+        rag_service.load_faq_data(str(csv_file))
+        mock_model = Mock()
+        mock_model.encode.return_value = np.random.rand(3, 384)
+        rag_service.model = mock_model
+        rag_service.embeddings_path = str(tmp_path / "faq_embeddings.npy")
+        rag_service.index_path = str(tmp_path / "faq_index.faiss")
+        rag_service.create_embeddings()
+        
+        reader = RAGService()
+        reader.embeddings_path = rag_service.embeddings_path
+        reader.index_path = rag_service.index_path
+        reader.model = Mock()
+        assert reader.load_faq_data(str(csv_file)) and reader.load_embeddings()
+        
+        edited = pd.concat([sample_faq_data, pd.DataFrame({
+            'question': ['Hành lý ký gửi bao nhiêu kg?'], 'answer': ['20kg']
+        })], ignore_index=True)
+        edited.to_csv(csv_file, index=False)
+        # The CSV changed but nobody has rebuilt the artifact yet
+        assert reader.reopen_artifacts()["status"] == "stale"
+        assert len(reader.faq_data) == 3
+        
+        mock_model.encode.return_value = np.random.rand(1, 384)
+        assert rag_service.reload()["status"] == "reloaded"
+        
+        result = reader.reopen_artifacts()
+        
+        assert result["status"] == "reopened"
+        assert len(reader.faq_data) == 4
+        assert reader.index.ntotal == 4
+        reader.model.encode.assert_not_called()
+        assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+    
+    def test_create_embeddings_float16(self, sample_faq_data, tmp_path):
+        """Test embeddings can be stored as float16"""
+        rag_service = RAGService(embeddings_dtype="float16")
+        mock_model = Mock()
+        mock_model.encode.return_value = np.random.rand(3, 384)
+        rag_service.model = mock_model
+        rag_service.faq_data = sample_faq_data
+        rag_service.embeddings_path = str(tmp_path / "faq_embeddings.npy")
+        rag_service.index_path = str(tmp_path / "faq_index.faiss")
+        
+        rag_service.create_embeddings()
+        
+        assert np.load(rag_service.embeddings_path).dtype == np.float16
+    
     def test_create_embeddings_no_data(self, rag_service):
         """Test embeddings creation without FAQ data"""
         result = rag_service.create_embeddings()
@@ -185,6 +449,187 @@ class TestRAGService:
         assert confidence == 0.0
         assert source_question == ""
     
+    def test_get_answers_single_encode_and_search(self, rag_service, sample_faq_data):
+        """Test batch answers use one encode call and one index search"""
+        rag_service.hybrid_mode = "off"
+        mock_model = Mock()
+        mock_model.encode.return_value = np.random.rand(2, 384)
+        rag_service.faq_data = sample_faq_data
+        rag_service.model = mock_model
+        
+        mock_index = Mock()
+        mock_index.search.return_value = (
+            np.array([[0.9, 0.5], [0.1, 0.05]]),
+            np.array([[1, 0], [2, 1]])
+        )
+        rag_service.index = mock_index
+        
+        results = rag_service.get_answers(["Check-in online?", "Random question"])
+        
+        assert mock_model.encode.call_count == 1
+        assert mock_index.search.call_count == 1
+        assert len(results) == 2
+        assert results[0][2] == sample_faq_data.iloc[1]['question']
+        assert results[0][1] == pytest.approx(90.0)
+        assert "Xin lỗi" in results[1][0]
+    
+    def test_encode_queries_uses_cache(self, rag_service):
+        """Test repeated normalized queries skip the transformer"""
+        mock_model = Mock()
+        mock_model.encode.return_value = np.random.rand(1, 384)
+        rag_service.model = mock_model
+        
+        first = rag_service.encode_queries(["Làm sao đổi vé?"])
+        second = rag_service.encode_queries(["  làm sao ĐỔI vé "])
+        
+        assert mock_model.encode.call_count == 1
+        np.testing.assert_allclose(first, second)
+        assert np.linalg.norm(first[0]) == pytest.approx(1.0, abs=1e-5)
+        stats = rag_service.get_cache_stats()["embedding_cache"]
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+    
+    def test_encode_queries_encodes_only_misses(self, rag_service):
+        """Test only uncached queries are sent to the transformer"""
+        mock_model = Mock()
+        mock_model.encode.return_value = np.random.rand(1, 384)
+        rag_service.model = mock_model
+        rag_service.encode_queries(["hoàn vé"])
+        
+        mock_model.encode.return_value = np.random.rand(1, 384)
+        embeddings = rag_service.encode_queries(["Hoàn vé", "đổi vé", "hoàn vé?"])
+        
+        assert embeddings.shape == (3, 384)
+        mock_model.encode.assert_called_with(["đổi vé"])
+    
+    def test_get_answer_semantic_cache_skips_index(self, rag_service, sample_faq_data):
+        """Test a near-duplicate question is answered from the semantic cache"""
+        rag_service.hybrid_mode = "off"
+        base = np.random.rand(1, 384)
+        mock_model = Mock()
+        mock_model.encode.side_effect = [base, base + 0.001]
+        rag_service.faq_data = sample_faq_data
+        rag_service.model = mock_model
+        
+        mock_index = Mock()
+        mock_index.search.return_value = (np.array([[0.9]]), np.array([[0]]))
+        rag_service.index = mock_index
+        
+        first = rag_service.get_answer("Làm sao để đặt vé?")
+        second = rag_service.get_answer("Làm thế nào để đặt vé?")
+        
+        assert second == first
+        assert mock_index.search.call_count == 1
+        assert rag_service.get_cache_stats()["answer_cache"]["hits"] == 1
+    
+    def test_get_answer_exact_match_skips_encode(self, rag_service, sample_faq_data):
+        """Test a question copied from the FAQ list is answered by hash lookup"""
+        mock_model = Mock()
+        mock_model.encode.return_value = np.random.rand(1, 384)
+        mock_index = Mock()
+        mock_index.search.return_value = (np.array([[0.1]]), np.array([[0]]))
+        rag_service.faq_data = sample_faq_data
+        rag_service.model = mock_model
+        rag_service.index = mock_index
+        
+        answers = rag_service.get_answers(["  cách CHECK-IN online như thế nào ", "xyz"])
+        
+        assert answers[0] == (sample_faq_data.iloc[1]['answer'], 100.0, sample_faq_data.iloc[1]['question'])
+        mock_index.search.assert_called_once()
+        assert mock_model.encode.call_args[0][0] == ["xyz"]
+        
+        stats = rag_service.get_cache_stats()["retrieval"]
+        assert stats["queries"] == 2
+        assert stats["exact_match"] == 1
+        assert stats["exact_match_rate"] == pytest.approx(0.5)
+    
+    def test_get_answer_lexical_fast_path_skips_encode(self, rag_service, sample_faq_data):
+        """Test a decisive keyword match is answered without the transformer"""
+        mock_model = Mock()
+        mock_index = Mock()
+        rag_service.faq_data = sample_faq_data
+        rag_service.model = mock_model
+        rag_service.index = mock_index
+        
+        answer, confidence, question = rag_service.get_answer("thoi gian hoan tien")
+        
+        assert question == sample_faq_data.iloc[2]['question']
+        assert answer == sample_faq_data.iloc[2]['answer']
+        # A keyword match is never reported as certain
+        assert confidence == pytest.approx(60.0)
+        mock_model.encode.assert_not_called()
+        mock_index.search.assert_not_called()
+        assert rag_service.get_cache_stats()["retrieval"]["lexical_fast_path"] == 1
+    
+    def test_short_keyword_match_is_not_decisive(self, rag_service, sample_faq_data):
+        """Test a full match on too few syllables still goes to dense retrieval"""
+        rag_service.faq_data = sample_faq_data
+        rag_service.index = Mock()
+        
+        assert rag_service.get_fast_answer("hoan tien")[0] is None
+        
+        rag_service.fast_path_min_terms = 2
+        assert rag_service.get_fast_answer("hoan tien")[0][2] == sample_faq_data.iloc[2]['question']
+    
+    def test_get_fast_answer(self, rag_service, sample_faq_data):
+        """Test the encoder-free paths answer alone and leave other questions to dense retrieval"""
+        rag_service.faq_data = sample_faq_data
+        rag_service.index = Mock()
+        
+        assert rag_service.get_fast_answer("cách check-in online như thế nào")[0][2] == sample_faq_data.iloc[1]['question']
+        assert rag_service.get_fast_answer("thoi gian hoan tien")[0][2] == sample_faq_data.iloc[2]['question']
+        answer, miss = rag_service.get_fast_answer("xyz")
+        assert answer is None
+        assert miss == FastPathMiss("xyz", rag_service.snapshot.version, [])
+        
+        stats = rag_service.get_cache_stats()["retrieval"]
+        assert stats["queries"] == 2
+        assert stats["exact_match"] == 1
+        assert stats["lexical_fast_path"] == 1
+    
+    def test_fast_path_miss_is_not_matched_again(self, rag_service, sample_faq_data):
+        """Test a query the fast path already missed goes straight to dense retrieval with its hits"""
+        mock_model = Mock()
+        mock_model.encode.return_value = np.ones((1, 384), dtype='float32')
+        mock_index = Mock()
+        mock_index.search.return_value = (np.array([[0.62]]), np.array([[1]]))
+        rag_service.faq_data = sample_faq_data
+        rag_service.model = mock_model
+        rag_service.index = mock_index
+        
+        with patch.object(rag_service, 'match_fast_path', wraps=rag_service.match_fast_path) as spy:
+            _, miss = rag_service.get_fast_answer("check-in online sớm")
+            answer, confidence, question = rag_service.get_answers([miss])[0]
+        
+        assert spy.call_count == 1
+        assert miss.hits
+        assert question == sample_faq_data.iloc[1]['question']
+        assert rag_service.get_cache_stats()["retrieval"]["queries"] == 1
+    
+    def test_get_answer_fuses_lexical_and_dense(self, rag_service, sample_faq_data):
+        """Test RRF promotes a row ranked by both retrievers"""
+        mock_model = Mock()
+        mock_model.encode.return_value = np.ones((1, 384), dtype='float32')
+        rag_service.faq_data = sample_faq_data
+        rag_service.model = mock_model
+        
+        # Dense prefers row 0 slightly, lexical only matches row 1
+        mock_index = Mock()
+        mock_index.search.return_value = (np.array([[0.62, 0.6]]), np.array([[0, 1]]))
+        rag_service.index = mock_index
+        
+        answer, confidence, question = rag_service.get_answer("check-in online sớm")
+        
+        assert question == sample_faq_data.iloc[1]['question']
+        assert confidence == pytest.approx(60.0)
+        mock_model.encode.assert_called_once()
+    
+    def test_search_similar_questions_batch_no_index(self, rag_service):
+        """Test batch search without index"""
+        results = rag_service.search_similar_questions_batch(["Q1", "Q2"])
+        
+        assert results == [[], []]
+    
     def test_initialize_success(self, rag_service, sample_faq_data, tmp_path):
         """Test successful service initialization"""
         # Create temporary CSV file
@@ -0,0 +1,68 @@
+import pytest
+import sys
+import os
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.rate_limit_service import RateLimiter, RateLimitExceededError, TokenBucket
+
+class TestTokenBucket:
+    """Test cases for the token bucket"""
+    
+    def test_burst_then_refill(self):
+        """Test a full bucket allows a burst, then refills at the rate"""
+        bucket = TokenBucket(rate=2.0, burst=3.0, now=0.0)
+        
+        assert [bucket.take(0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+        assert bucket.take(0.0) == pytest.approx(0.5)
+        assert bucket.take(0.5) == 0.0
+    
+    def test_refill_is_capped_at_burst(self):
+        """Test idle time never accumulates more than the burst"""
+        bucket = TokenBucket(rate=1.0, burst=2.0, now=0.0)
+        bucket.take(100.0)
+        
+        assert bucket.tokens == pytest.approx(1.0)
+
+class TestRateLimiter:
+    """Test cases for the per-key rate limiter"""
+    
+    def test_limits_each_key_separately(self):
+        """Test one user running out of tokens does not affect another"""
+        limiter = RateLimiter(rate=0.001, burst=2)
+        limiter.acquire("user001")
+        limiter.acquire("user001")
+        
+        with pytest.raises(RateLimitExceededError) as exc_info:
+            limiter.acquire("user001")
+        assert exc_info.value.retry_after > 0
+        
+        limiter.acquire("user002")
+        stats = limiter.get_stats()
+        assert stats["allowed"] == 3
+        assert stats["limited"] == 1
+    
+    def test_disabled_with_zero_rate(self):
+        """Test a rate of 0 turns limiting off"""
+        limiter = RateLimiter(rate=0, burst=1)
+        for _ in range(10):
+            limiter.acquire("user001")
+    
+    def test_evicts_least_recently_seen_keys(self):
+        """Test the number of tracked keys is bounded"""
+        limiter = RateLimiter(rate=1, burst=1, max_keys=2)
+        for key in ("a", "b", "c"):
+            limiter.acquire(key)
+        
+        assert limiter.get_stats()["tracked_keys"] == 2
+        # "a" was evicted and starts again with a full bucket
+        limiter.acquire("a")
+    
+    def test_large_requests_need_full_bucket(self):
+        """Test a request costing more than the burst is admitted with a full bucket"""
+        limiter = RateLimiter(rate=0.001, burst=5)
+        limiter.acquire("user001", amount=50)
+        
+        with pytest.raises(RateLimitExceededError):
+            limiter.acquire("user001")
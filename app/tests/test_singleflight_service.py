@@ -0,0 +1,53 @@
+import pytest
+import sys
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.singleflight_service import SingleFlight
+
+class TestSingleFlight:
+    """Test cases for Single-flight Service"""
+    
+    def test_sequential_calls_each_execute(self):
+        """Test calls that do not overlap are not collapsed"""
+        single_flight = SingleFlight()
+        
+        assert single_flight.do("a", lambda: 1) == (1, False)
+        assert single_flight.do("a", lambda: 2) == (2, False)
+        assert single_flight.get_stats()["collapsed"] == 0
+    
+    def test_concurrent_calls_share_result_and_exception(self):
+        """Test overlapping callers wait for the leader and share its exception"""
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        
+        def failing():
+            started.set()
+            release.wait(5)
+            raise ValueError("boom")
+        
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(single_flight.do, "a", failing)
+            started.wait(5)
+            follower = pool.submit(single_flight.do, "a", failing)
+            while single_flight.get_stats()["collapsed"] < 1:
+                time.sleep(0.001)
+            release.set()
+            
+            with pytest.raises(ValueError):
+                leader.result()
+            with pytest.raises(ValueError):
+                follower.result()
+        
+        stats = single_flight.get_stats()
+        assert stats["executed"] == 1
+        assert stats["collapsed"] == 1
+        assert stats["in_flight"] == 0
+        # The failed key is free again
+        assert single_flight.do("a", lambda: 3) == (3, False)
@@ -0,0 +1,32 @@
+import sys
+import os
+import unicodedata
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.text_processing import normalize_query
+
+class TestTextProcessing:
+    """Test cases for text normalization"""
+    
+    def test_normalize_query_case_whitespace_punctuation(self):
+        """Test lowercase, collapsed whitespace and trimmed punctuation"""
+        assert normalize_query("  Làm sao   ĐỔI vé?? ") == "làm sao đổi vé"
+        assert normalize_query("...Hoàn vé!") == "hoàn vé"
+    
+    def test_normalize_query_unicode_nfc(self):
+        """Test decomposed and composed Vietnamese text give the same key"""
+        decomposed = unicodedata.normalize("NFD", "hoàn vé")
+        
+        assert decomposed != "hoàn vé"
+        assert normalize_query(decomposed) == normalize_query("hoàn vé")
+    
+    def test_normalize_query_keeps_inner_punctuation(self):
+        """Test punctuation inside the question is preserved"""
+        assert normalize_query("check-in online?") == "check-in online"
+    
+    def test_normalize_query_empty(self):
+        """Test empty input"""
+        assert normalize_query("") == ""
+        assert normalize_query("???") == ""
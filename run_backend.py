@@ -3,12 +3,26 @@
 Simple script to run the FastAPI backend server
 """
 
+import argparse
 import subprocess
 import sys
 import os
 
+def parse_args():
+    """Parse launcher options"""
+    parser = argparse.ArgumentParser(description="Run the FastAPI backend server")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Production mode: load the model once, then fork this many workers (default: dev mode with --reload)")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="torch/FAISS/OpenMP threads per worker (default: CPU count / workers)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    return parser.parse_args()
+
 def main():
     """Run the FastAPI backend server"""
+    args = parse_args()
+    
     print("🚀 Starting Vexere AI Customer Service Backend...")
     print("📍 API will be available at: http://localhost:8000")
     print("📚 API Documentation: http://localhost:8000/docs")
@@ -20,12 +34,18 @@ def main():
         # Change to the project root directory
         os.chdir(os.path.dirname(os.path.abspath(__file__)))
         
+        if args.workers > 0:
+            # Pre-forked workers share the model and index loaded by the master
+            from app.prefork import serve
+            serve(args.host, args.port, args.workers, args.threads_per_worker)
+            return
+        
         # Start FastAPI server using uvicorn
         subprocess.run([
             sys.executable, "-m", "uvicorn", 
             "app.main:app", 
-            "--host", "0.0.0.0", 
-            "--port", "8000",
+            "--host", args.host, 
+            "--port", str(args.port),
             "--reload"
         ], check=True)
     except subprocess.CalledProcessError as e: